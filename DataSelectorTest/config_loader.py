@@ -31,7 +31,19 @@ class DataSelectorConfig:
         self.open_log = False
         self.validate_sql = False
         self.sql_timeout = 30
+        self.execution_timeout = 30
         self.columns_vertical = False
+        self.export_batch_size = 10000
+        self.resume_attempts = 3
+        self.preview_rows = 1000
+        self.run_parameters = False
+        self.stale_run_hours = 24
+        self.max_concurrent_exports = 2
+        self.profile = False
+        self.stage_path = ""
+        self.skip_unchanged = False
+        self.profile_top_allocations = 25
+        self.distinct_columns = ""
 
     def _load_xml(self):
         """
@@ -65,6 +77,7 @@ class DataSelectorConfig:
             self.open_log = root.findtext("DefaultOpenLogFile", "No").lower() in ("yes", "y")
             self.validate_sql = root.findtext("ValidateSQL", "No").lower() in ("yes", "y")
             self.columns_vertical = root.findtext("LoadColumnsVertically", "No").lower() in ("yes", "y")
+            self.run_parameters = root.findtext("PassRunParameters", "No").lower() in ("yes", "y")
 
             # SQL timeout — convert from string to integer safely
             timeout_text = root.findtext("SQLTimeout", "30")
@@ -73,8 +86,44 @@ class DataSelectorConfig:
             except ValueError:
                 self.sql_timeout = 30
 
+            # Execution timeout — defaults to the SQL timeout if not set
+            self.execution_timeout = self._read_int(root, "ExecutionTimeout", self.sql_timeout)
+
+            # Export batching and resume settings
+            self.export_batch_size = self._read_int(root, "ExportBatchSize", 10000)
+            self.resume_attempts = self._read_int(root, "ResumeAttempts", 3)
+
+            # Maximum number of rows fetched when previewing a query
+            self.preview_rows = self._read_int(root, "PreviewRows", 1000)
+
+            # Age after which another session's unfinished run is cleaned up
+            self.stale_run_hours = self._read_int(root, "StaleRunHours", 24)
+
+            # Number of queued exports that can run at the same time
+            self.max_concurrent_exports = self._read_int(root, "MaxConcurrentExports", 2)
+
+            # Skip exports whose query and source data are unchanged since the output was written
+            self.skip_unchanged = root.findtext("SkipUnchanged", "No").lower() in ("yes", "y")
+
+            # Folder of the local stage database (the temp folder if not set)
+            self.stage_path = root.findtext("StagePath", "")
+
+            # Profiling of export runs, to diagnose slow exports
+            self.profile = root.findtext("Profile", "No").lower() in ("yes", "y")
+            self.profile_top_allocations = self._read_int(root, "ProfileTopAllocations", 25)
+
+            # Columns whose distinct values are counted in the export statistics
+            self.distinct_columns = root.findtext("DistinctColumns", "")
+
             self.loaded = True
 
         except Exception as e:
             print(f"[Config Error] Could not load DataSelector.xml: {e}")
             self.loaded = False
+
+    def _read_int(self, root, tag, default):
+        """Read an integer setting, falling back to the default if it is missing or invalid."""
+        try:
+            return int(root.findtext(tag, str(default)))
+        except ValueError:
+            return default
@@ -0,0 +1,111 @@
+import struct
+from datetime import date, datetime, time
+from decimal import Decimal
+
+# SQL Server specific ODBC types that pyodbc cannot convert itself
+SQL_SS_TIME2 = -154
+SQL_SS_TIMESTAMPOFFSET = -155
+
+# --- conversion_functions.py ---
+def _format_fraction(fraction):
+    """Format the nanoseconds of a time as 7 fractional digits, or nothing if there are none."""
+    return f".{fraction // 100:07d}" if fraction else ""
+
+
+def convert_time2(value):
+    """Convert a SQL Server time value (SQL_SS_TIME2_STRUCT) to 'hh:mm:ss.fffffff' text."""
+    if value is None:
+        return None
+    hour, minute, second, fraction = struct.unpack("<3H2xI", value)
+    return f"{hour:02d}:{minute:02d}:{second:02d}{_format_fraction(fraction)}"
+
+
+def convert_datetimeoffset(value):
+    """Convert a SQL Server datetimeoffset value (SQL_SS_TIMESTAMPOFFSET_STRUCT) to ISO 8601 text."""
+    if value is None:
+        return None
+    year, month, day, hour, minute, second, fraction, tz_hour, tz_minute = struct.unpack("<6hI2h", value)
+    sign = "-" if tz_hour < 0 or tz_minute < 0 else "+"
+    return (f"{year:04d}-{month:02d}-{day:02d} {hour:02d}:{minute:02d}:{second:02d}{_format_fraction(fraction)}"
+            f" {sign}{abs(tz_hour):02d}:{abs(tz_minute):02d}")
+
+
+# Output converters registered on each connection, by SQL type. Dates, times and
+# decimals pyodbc already handles are left as Python objects so key and
+# high-water values are bound back to the server with their own types.
+OUTPUT_CONVERTERS = {
+    SQL_SS_TIME2: convert_time2,
+    SQL_SS_TIMESTAMPOFFSET: convert_datetimeoffset,
+}
+
+
+def register_output_converters(connection):
+    """Register the output converters on a pyodbc connection."""
+    for sql_type, converter in OUTPUT_CONVERTERS.items():
+        connection.add_output_converter(sql_type, converter)
+
+
+def format_text(value):
+    """Format a value as text, keeping nulls."""
+    return None if value is None else str(value)
+
+
+def format_real(value):
+    """Convert a decimal to a float, keeping nulls."""
+    return None if value is None else float(value)
+
+
+# Formatters for the Python types returned by pyodbc that QGIS cannot store in
+# a text attribute field itself. Other values (numbers, dates and the text of
+# time and datetimeoffset columns) are converted by QGIS, so are passed through
+TEXT_FORMATTERS = {
+    Decimal: format_text,
+}
+
+# Formatters for the Python types SQLite cannot store itself
+STAGE_FORMATTERS = {
+    Decimal: format_real,
+    datetime: format_text,
+    date: format_text,
+    time: format_text,
+}
+
+# Formatters used for each output format. Vector outputs have text attribute
+# fields, and the delimited writers format values themselves. Run
+# benchmarks/conversion_benchmark.py to time the conversion of a batch
+OUTPUT_FORMATTERS = {
+    "shp": TEXT_FORMATTERS,
+    "zip": TEXT_FORMATTERS,
+    "gpkg": TEXT_FORMATTERS,
+    "map": TEXT_FORMATTERS,
+    "stage": STAGE_FORMATTERS,
+}
+
+
+def build_column_formatters(description, type_formatters=TEXT_FORMATTERS):
+    """
+    Build a formatter for each column once from the cursor description, so a
+    batch can be converted column by column instead of checking the type of
+    every value. Columns whose type has no formatter (such as text and binary
+    geometry columns) get None.
+    """
+    return [type_formatters.get(column[1]) for column in description]
+
+
+def convert_rows(rows, formatters):
+    """
+    Convert a batch of rows with the column formatters from build_column_formatters.
+    Only the columns with a formatter are converted, in a copy of each row, and
+    a batch with no such columns is returned unchanged.
+    """
+    columns = [(i, formatter) for i, formatter in enumerate(formatters) if formatter is not None]
+    if not rows or not columns:
+        return rows
+
+    converted = []
+    for row in rows:
+        row = list(row)
+        for i, formatter in columns:
+            row[i] = formatter(row[i])
+        converted.append(row)
+    return converted
@@ -2,6 +2,7 @@ from qgis.PyQt.QtWidgets import QAction
 from qgis.PyQt.QtCore import Qt
 
 from .forms.data_selector_dock import DataSelectorDockWidget
+from .data_selector_session import DataSelectorSession
 
 class DataSelector:
     def __init__(self, iface):
@@ -9,6 +10,7 @@ class DataSelector:
         self.iface = iface
         self.dock_widget = None
         self.action = None
+        self.session = None
 
     def initGui(self):
         # Create an action for the Plugins menu
@@ -18,8 +20,12 @@ class DataSelector:
         # Add it to the Plugins menu
         self.iface.addPluginToMenu("&DataSelector", self.action)
 
+        # Create the session that holds the config, connections and form
+        # state while the dock is closed and reopened
+        self.session = DataSelectorSession()
+
         # Load and show the dock widget when the plugin is started
-        self.dock_widget = DataSelectorDockWidget(self.iface.mainWindow())
+        self.dock_widget = DataSelectorDockWidget(self.iface.mainWindow(), self.session)
 
         # Set the dock widget to be closable
         self.dock_widget.set_on_close_callback(self.on_dock_closed)
@@ -36,10 +42,15 @@ class DataSelector:
             self.iface.removeDockWidget(self.dock_widget)
             self.dock_widget = None
 
+        # Cancel any running export and close the connections
+        if self.session:
+            self.session.close()
+            self.session = None
+
     def toggle_dock(self):
         if self.dock_widget is None:
-            # Re-create if it's been closed
-            self.dock_widget = DataSelectorDockWidget(self.iface.mainWindow())
+            # Re-create if it's been closed, from the session kept by the plugin
+            self.dock_widget = DataSelectorDockWidget(self.iface.mainWindow(), self.session)
 
             # Set the dock widget to be closable
             self.dock_widget.set_on_close_callback(self.on_dock_closed)
@@ -54,4 +65,7 @@ class DataSelector:
                 self.dock_widget.activateWindow()
 
     def on_dock_closed(self):
+        # Remove the closed dock, as its state is kept in the session
+        self.iface.removeDockWidget(self.dock_widget)
+        self.dock_widget.deleteLater()
         self.dock_widget = None
@@ -0,0 +1,87 @@
+import os
+import threading
+
+from qgis.core import QgsApplication
+
+from .config_loader import DataSelectorConfig
+from .sql_server_functions import SQLServerFunctions
+from .export_functions import ExportQueue
+from .history_functions import QueryHistory
+from .library_functions import QueryLibrary
+
+class DataSelectorSession:
+    """
+    State held by the plugin for as long as QGIS is running, so it outlives the
+    dock widget: the config, the database connections, the table list, cached
+    column lists, the form contents, the queue of exports, the history of
+    past runs and the index of saved queries. Closing and
+    reopening the dock reuses all of these rather than starting again.
+    """
+
+    def __init__(self):
+        # Load config from XML
+        self.config = DataSelectorConfig()
+
+        # Connect to SQL Server, with a separate connection for background validation.
+        # A validation left running by a closed dock cannot be stopped, so the
+        # checks take turns on the connection
+        self.db = SQLServerFunctions(self.config.sql_connection)
+        self.validation_db = SQLServerFunctions(self.config.sql_connection)
+        self.validation_lock = threading.Lock()
+
+        # Cached table list, column lists and validation results
+        self.tables = None
+        self.columns = {}
+        self.validation_cache = {}
+
+        # The form contents when the dock was last closed
+        self.form_state = None
+
+        # The queue of exports and the log file they write to. Exports only run
+        # at the same time if each query reads just its own run's selection
+        self.export_queue = ExportQueue(self.config.max_concurrent_exports)
+        self.log_file = None
+
+        # Record every finished export in the local history, kept in the QGIS profile
+        self.history = QueryHistory(os.path.join(QgsApplication.qgisSettingsDirPath(), "DataSelector_history.sqlite"))
+        self.export_queue.jobFinished.connect(self.record_run)
+
+        # Index the saved queries in the query folder so they can be searched
+        self.library = QueryLibrary(os.path.join(QgsApplication.qgisSettingsDirPath(), "DataSelector_library.sqlite"),
+                                    self.config.query_path)
+
+    def get_tables(self, refresh=False):
+        """Return the selectable table names, querying the server the first time or if refresh is True."""
+        if self.tables is None or refresh:
+            self.tables = self.db.get_table_names(
+                self.config.objects_table,
+                self.config.include_wildcard,
+                self.config.exclude_wildcard,
+                self.config.schema
+            )
+            self.columns = {}
+        return self.tables
+
+    def get_columns(self, table_name):
+        """Return the column names of a table, querying the server the first time."""
+        if table_name not in self.columns:
+            columns = self.db.get_columns(table_name)
+            if not columns:
+                return columns
+            self.columns[table_name] = columns
+        return self.columns[table_name]
+
+    def record_run(self, entry):
+        """Record a finished export in the history."""
+        job = entry.job
+
+        # Skipped runs are recorded separately so they do not shorten the predictions
+        status = "Skipped" if job.skipped else entry.status
+        self.history.record(job.sql, job.parts, job.format_key, job.file_path, status,
+                            job.rows_written, job.output_bytes, job.timings)
+
+    def close(self):
+        """Cancel any queued or running exports and close the connections when the plugin is unloaded."""
+        self.export_queue.cancel_all()
+        self.db.reset_connection()
+        self.validation_db.reset_connection()
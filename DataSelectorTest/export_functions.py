@@ -0,0 +1,918 @@
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+import pyodbc
+from qgis.PyQt.QtCore import QObject, pyqtSignal
+from qgis.core import QgsApplication, QgsTask
+
+from .sql_server_functions import is_connection_error
+from .file_functions import open_output_writer, output_exists, get_output_fields, write_log, read_json_sidecar, write_json_sidecar, delete_json_sidecar, get_checkpoint_path, get_delta_path, get_run_registry_path, get_output_size, get_stats_path, get_fingerprint_path, DEFAULT_CRS
+from .conversion_functions import build_column_formatters, convert_rows, OUTPUT_FORMATTERS
+from .stage_functions import LocalStage, StageWriter
+from .map_functions import MapLayerLoader, MapLayerWriter
+from .profile_functions import get_profile_path, profile_run
+from .stats_functions import ColumnStatistics, format_statistics
+from .query_functions import build_query_sql, get_query_tables, reads_other_tables, add_run_parameters, is_run_scoped, build_resume_sql, can_add_tiebreaker, get_order_key, ID_LIST_TABLE, AREA_TABLE
+
+def encode_key(value):
+    """
+    Convert a key value into a JSON-safe form that records its type.
+    """
+    if isinstance(value, datetime):
+        return {"type": "datetime", "value": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"type": "decimal", "value": str(value)}
+    if isinstance(value, (bytes, bytearray)):
+        return {"type": "bytes", "value": bytes(value).hex()}
+    return {"type": "value", "value": value}
+
+def decode_key(encoded):
+    """
+    Convert a key value stored by encode_key back into its original type.
+    """
+    if not encoded:
+        return None
+    key_type = encoded.get("type")
+    value = encoded.get("value")
+    if key_type == "datetime":
+        return datetime.fromisoformat(value)
+    if key_type == "decimal":
+        return Decimal(value)
+    if key_type == "bytes":
+        return bytes.fromhex(value)
+    return value
+
+# Output formats written with geometries, in the coordinate reference system of the table
+VECTOR_FORMATS = ("shp", "zip", "gpkg", "map")
+
+# Serialises updates to the run registry between jobs running at the same time
+_registry_lock = threading.Lock()
+
+def new_run_id():
+    """Return a short unique token identifying an export run's temporary tables."""
+    return uuid.uuid4().hex[:12]
+
+
+class ExportJob:
+    """
+    A single export run: the selection stored procedure, the query, the streamed
+    write to the output file and the clear stored procedure.
+
+    Progress (rows written and the last ordered key value) is checkpointed next to
+    the output file after every batch. If the connection drops, the job reconnects
+    and resumes from the checkpoint, and the selection is kept so a later run can
+    resume from the same point instead of starting from zero.
+
+    In delta mode only rows whose delta column (a rowversion or modified date)
+    is above the high-water mark of the previous run are fetched, and they are
+    merged into the existing output by the key column.
+
+    An ID list filter or an area of interest is uploaded to a session temp
+    table before the query runs, and the query joins or intersects against it.
+
+    Queries with named parameters are run through sp_executesql with the
+    parameter values bound, so the plan is reused across runs.
+
+    If PassRunParameters is set, the stored procedures and the query are given
+    the schema, user and a unique run token, so the procedures can select into
+    separate temporary tables (or rows) and the query can read just its own.
+    Only queries that use @RunId are run alongside other exports. Runs are
+    recorded in a registry next to the log file until their selection is
+    cleared, so the tables of crashed runs can be cleared later.
+    """
+
+    def __init__(self, db, config, parts, file_path, format_key, log_file=None, delta=None, id_filter=None, area_filter=None, parameters=None, user_id="Temp"):
+        self.db = db
+        self.config = config
+        self.parts = dict(parts)
+        self.file_path = file_path
+        self.format_key = format_key
+        self.log_file = log_file
+        self.delta = delta
+        self.id_filter = id_filter
+        self.area_filter = area_filter
+        self.parameters = parameters or []
+        self.parameter_values = [p["value"] for p in self.parameters]
+        self.user_id = user_id
+        self.run_id = None
+        self.registry_path = get_run_registry_path(config.log_path, user_id)
+
+        # Filter on the uploaded ID list
+        if id_filter:
+            self.parts["id_column"] = id_filter["column"]
+
+        # Filter on the uploaded area of interest
+        if area_filter:
+            self.parts["area_column"] = area_filter["column"]
+
+        # Queries on the local stage are built for SQLite and have no stored procedures
+        self.local = isinstance(db, LocalStage)
+        self.sql = db.build_sql(self.parts) if self.local else build_query_sql(self.parts)
+        self.export_sql = self.sql
+
+        # The query only reads its own run's selection if it filters on the run token
+        self.run_scoped = self.local or (config.run_parameters and is_run_scoped(self.sql, self.parameters))
+        self.checkpoint_path = get_checkpoint_path(file_path)
+        self.checkpoint = None
+        self.rows_written = 0
+        self.error_message = None
+        self.cancelled = False
+
+        # Seconds spent in each stage of the run, and the size of the output
+        self.timings = {}
+        self.output_bytes = None
+
+        # The high-water mark from the previous delta run, if there was one
+        self.delta_path = get_delta_path(file_path)
+        self.delta_from = None
+        self.high_water = None
+
+        # The fingerprint of the query and its source data, if unchanged exports are skipped
+        self.fingerprint_path = get_fingerprint_path(file_path)
+        self.fingerprint = None
+        self.skipped = False
+
+        # The memory layers an 'add to map' export is loaded into, kept across reconnects
+        self.map_loader = None
+
+        # The spatial reference ID of the table, and the coordinate reference system of a vector output
+        self.srid = None
+        self.output_crs = None
+
+    def log(self, message):
+        """Write a message to the log file, if there is one."""
+        if self.log_file:
+            write_log(self.log_file, message)
+
+    def has_checkpoint(self):
+        """
+        Check if there is a checkpoint for this query and output file
+        left behind by an interrupted run.
+        """
+        checkpoint = read_json_sidecar(self.checkpoint_path)
+        return bool(
+            checkpoint and
+            checkpoint.get("sql") == self.sql and
+            checkpoint.get("format") == self.format_key and
+            checkpoint.get("parameters", []) == self.parameter_values
+        )
+
+    def discard_checkpoint(self):
+        """Delete any checkpoint left behind by an interrupted run."""
+        delete_json_sidecar(self.checkpoint_path)
+
+    def cancel(self):
+        """
+        Cancel the job. Called from another thread: the running query is cancelled
+        on the server and the job stops at the next batch.
+        """
+        self.cancelled = True
+        self.db.cancel()
+
+    def run(self, resume=False):
+        """
+        Run the export. Returns True if all rows were written.
+        If resume is True and a matching checkpoint exists, the export
+        continues from the checkpoint instead of starting again.
+        The run is profiled if profiling is turned on in the configuration.
+        """
+        if not self.config.profile:
+            return self._run(resume)
+
+        # Write the profile and allocations report next to the log file
+        profile_path = get_profile_path(self.log_file, self.config.log_path)
+        with profile_run(profile_path, self.config.profile_top_allocations, self.log):
+            success = self._run(resume)
+        return success
+
+    def _run(self, resume):
+        """Run the export, as described in run."""
+
+        # Skip the export if the source data has not changed since the output was written
+        if self.config.skip_unchanged and not self.local and not (resume and self.has_checkpoint()):
+            start = time.perf_counter()
+            self.fingerprint = self._get_fingerprint()
+            self._add_timing("fingerprint", start)
+            if self._output_unchanged():
+                return True
+
+        # The output is about to change, so its old fingerprint no longer applies
+        delete_json_sidecar(self.fingerprint_path)
+
+        # Load the checkpoint from the interrupted run
+        self.checkpoint = read_json_sidecar(self.checkpoint_path) if resume and self.has_checkpoint() else None
+        if self.checkpoint:
+            self.rows_written = self.checkpoint.get("rows_written", 0)
+            self.log(f"Resuming export after {self.rows_written} rows")
+        else:
+            self.discard_checkpoint()
+            self.checkpoint = {
+                "sql": self.sql,
+                "format": self.format_key,
+                "parameters": self.parameter_values,
+                "output": self.file_path,
+                "started": datetime.now().isoformat(),
+                "selection_done": False,
+                "rows_written": 0,
+                "last_key": None,
+                "last_key_rows": 0,
+                "file_size": None,
+                "tiebreaker": self._get_tiebreaker(),
+            }
+
+        # Order the rows repeatably by the table's unique key, so the export can be resumed exactly
+        if not self.local:
+            self.export_sql = build_query_sql(dict(self.parts, tiebreaker=self.checkpoint.get("tiebreaker")))
+
+        # Keep the run token of an interrupted run, as its selection may have been kept
+        self.run_id = self.checkpoint.get("run_id") or new_run_id()
+        self.checkpoint["run_id"] = self.run_id
+
+        # Clear the temporary tables left behind by crashed runs
+        if self.config.run_parameters and not self.local:
+            self.clean_up_stale_runs()
+
+        # Load the high-water mark for a delta run
+        if self.delta:
+            self.delta_from = self._read_high_water()
+            if self.delta_from is None:
+                self.log("No previous delta run found, extracting all rows")
+            else:
+                self.log(f"Extracting rows changed since {self.delta_from}")
+
+        # Run the selection stored procedure unless the selection was kept
+        if not self.checkpoint.get("selection_done"):
+            if self.config.select_proc and not self.local:
+                self.log("Running selection stored procedure")
+                self._register_run()
+                start = time.perf_counter()
+                selected = self.db.run_procedure(self.config.select_proc, self.config.execution_timeout, self._procedure_params())
+                self._add_timing("selection", start)
+
+                # The procedure may have finished just as the user cancelled
+                if self.cancelled:
+                    return self._cancelled()
+                if not selected:
+                    self.error_message = "Failed to run selection procedure."
+                    self.log("Failed to run selection stored procedure")
+                    return False
+            self.checkpoint["selection_done"] = True
+        write_json_sidecar(self.checkpoint_path, self.checkpoint)
+
+        # Export the rows, reconnecting and resuming if the connection drops
+        attempt = 0
+        while True:
+            try:
+                self._export()
+                break
+
+            except pyodbc.Error as e:
+                # Clear the selection straight away if the user cancelled
+                if self.cancelled:
+                    return self._cancelled()
+
+                # Only retry if the connection was lost, not for query errors or timeouts
+                attempt += 1
+                self.log(f"Export interrupted after {self.rows_written} rows: {e}")
+                if not is_connection_error(e):
+                    self.error_message = f"Export failed: {e}"
+                    self.log("Export failed. The selection has been kept so the export can be resumed")
+                    return False
+                if attempt > self.config.resume_attempts:
+                    self.error_message = f"Export interrupted after {self.rows_written} rows. Run again to resume."
+                    self.log("Export failed. The selection has been kept so the export can be resumed")
+                    return False
+
+                # Wait before reconnecting so a brief outage can recover
+                time.sleep(5 * attempt)
+                self.db.reset_connection()
+                self.log(f"Reconnecting (attempt {attempt} of {self.config.resume_attempts})")
+
+            except Exception as e:
+                self.error_message = f"Export failed: {e}"
+                self.log(f"Export failed: {e}")
+                return False
+
+        # The job may have been cancelled between batches
+        if self.cancelled:
+            return self._cancelled()
+
+        # Run the clear stored procedure to delete the temporary tables
+        start = time.perf_counter()
+        self.clear_selection()
+        self._add_timing("clear", start)
+
+        # Record the new high-water mark for the next delta run
+        if self.delta:
+            self._write_high_water()
+
+        # The export is complete so the checkpoint is no longer needed
+        self.discard_checkpoint()
+
+        # Layers added to the map have no file to measure
+        if self.format_key != "map":
+            self.output_bytes = get_output_size(self.file_path)
+
+        # Record the fingerprint so the export can be skipped until the data changes
+        if self.fingerprint:
+            write_json_sidecar(self.fingerprint_path, {
+                "fingerprint": self.fingerprint,
+                "rows": self.rows_written,
+                "exported": datetime.now().isoformat(),
+            })
+        self.log(f"{self.rows_written} rows exported")
+        self.log("Timings: " + ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in self.timings.items()))
+        return True
+
+    def _add_timing(self, stage, start):
+        """Add the time since start (from time.perf_counter) to a stage of the run."""
+        self.timings[stage] = self.timings.get(stage, 0) + time.perf_counter() - start
+
+    def _cancelled(self):
+        """
+        Tidy up after the job was cancelled: run the clear stored procedure so the
+        server resources are released, and mark the checkpoint so a later resume
+        runs the selection again.
+        """
+        self.error_message = f"Export cancelled after {self.rows_written} rows."
+        self.log("Export cancelled by the user")
+        self.db.reset_connection()
+        self.clear_selection()
+        self.checkpoint["selection_done"] = False
+        write_json_sidecar(self.checkpoint_path, self.checkpoint)
+        return False
+
+    def clear_selection(self, run_id=None):
+        """Run the clear stored procedure to delete the temporary tables of this run (or another run)."""
+        if self.config.clear_proc and not self.local:
+            self.log("Deleting temporary tables ...")
+            if not self.db.run_procedure(self.config.clear_proc, params=self._procedure_params(run_id)):
+                self.log("Error deleting the temporary tables")
+                return False
+        self._unregister_run(run_id or self.run_id)
+        return True
+
+    def _procedure_params(self, run_id=None):
+        """Return the parameters passed to the stored procedures, or None if they take none."""
+        if not self.config.run_parameters:
+            return None
+        return {"Schema": self.config.schema, "UserId": self.user_id, "RunId": run_id or self.run_id}
+
+    def _query_params(self):
+        """Return the named parameters bound to the query, with the run's parameters if they are passed."""
+        if not self.config.run_parameters or self.local:
+            return self.parameters
+        return add_run_parameters(self.parameters, self.config.schema, self.user_id, self.run_id)
+
+    def _register_run(self):
+        """Record that this run is creating temporary tables on the server."""
+        if not self.config.run_parameters:
+            return
+        with _registry_lock:
+            runs = read_json_sidecar(self.registry_path) or {}
+            runs[self.run_id] = {
+                "output": self.file_path,
+                "checkpoint": self.checkpoint_path,
+                "host": socket.gethostname(),
+                "pid": os.getpid(),
+                "started": datetime.now().isoformat(),
+            }
+            write_json_sidecar(self.registry_path, runs)
+
+    def _unregister_run(self, run_id):
+        """Remove a run from the registry once its temporary tables have been cleared."""
+        if not self.config.run_parameters:
+            return
+        with _registry_lock:
+            runs = read_json_sidecar(self.registry_path) or {}
+            if runs.pop(run_id, None) is not None:
+                write_json_sidecar(self.registry_path, runs)
+
+    def clean_up_stale_runs(self):
+        """
+        Clear the temporary tables of runs left behind by another QGIS session,
+        e.g. one that crashed, once they are older than StaleRunHours. If the
+        run could still be resumed, its checkpoint is marked so the selection is
+        run again.
+        """
+        with _registry_lock:
+            runs = read_json_sidecar(self.registry_path) or {}
+
+        now = datetime.now()
+        for run_id, run in runs.items():
+            # Leave runs from this session and recent runs alone
+            if run_id == self.run_id or (run.get("host") == socket.gethostname() and run.get("pid") == os.getpid()):
+                continue
+            try:
+                age_hours = (now - datetime.fromisoformat(run["started"])).total_seconds() / 3600
+            except (KeyError, TypeError, ValueError):
+                age_hours = None
+            if age_hours is not None and age_hours < self.config.stale_run_hours:
+                continue
+
+            self.log(f"Clearing temporary tables left by run {run_id} to {run.get('output')}")
+            if not self.clear_selection(run_id):
+                continue
+
+            # The selection for that run has gone, so a resume must select again
+            checkpoint = read_json_sidecar(run.get("checkpoint") or "")
+            if checkpoint and checkpoint.get("run_id") == run_id:
+                checkpoint["selection_done"] = False
+                write_json_sidecar(run["checkpoint"], checkpoint)
+
+    def _get_fingerprint(self):
+        """
+        Return a hash of everything that decides the contents of the output:
+        the SQL, parameter values, format, filters and the change markers of
+        the source tables and of the objects the selection procedure uses.
+        Returns None if the tables cannot all be found, e.g. if the Where box
+        has a FROM clause or subquery, or a table's change markers cannot be
+        read, so the export is never skipped on a guess.
+        """
+        if reads_other_tables(self.parts):
+            self.log("The query reads from tables in a FROM clause or subquery, so the export will not be skipped")
+            return None
+        tables = get_query_tables(self.parts)
+
+        # The selection procedure may read from any table, so add the ones it uses
+        if self.config.select_proc:
+            procedure_tables = self.db.get_procedure_tables(self.config.select_proc)
+            if procedure_tables is None:
+                self.log(f"Cannot find the tables {self.config.select_proc} reads from, so the export will not be skipped")
+                return None
+            tables += [table_name for table_name in procedure_tables if table_name not in tables]
+
+        markers = {}
+        for table_name in tables:
+            markers[table_name] = self.db.get_change_markers(table_name)
+            if markers[table_name] is None:
+                self.log(f"Cannot read the change markers of {table_name}, so the export will not be skipped")
+                return None
+        content = {
+            "sql": self.sql,
+            "parameters": self.parameter_values,
+            "format": self.format_key,
+            "ids": self.id_filter["values"] if self.id_filter else None,
+            "area": [bytes(wkb).hex() for wkb in self.area_filter["wkb"]] if self.area_filter else None,
+            "delta": self.delta,
+            "procedure": [self.config.select_proc, self.user_id] if self.config.select_proc else None,
+            "markers": markers,
+        }
+        return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def _get_srid(self):
+        """
+        Return the spatial reference ID of the table's geometry column, on SQL
+        Server or as recorded when it was staged, or None if it cannot be found.
+        """
+        table_name = self.parts["table"]
+        geometry_column = self.db.get_geometry_column(table_name)
+        return self.db.get_srid(table_name, geometry_column) if geometry_column else None
+
+    def _output_unchanged(self):
+        """
+        Check if the output was written from the same query and source data,
+        and if so touch it so it looks up to date, and log that it was skipped.
+        """
+        previous = read_json_sidecar(self.fingerprint_path)
+        if not self.fingerprint or not previous or previous.get("fingerprint") != self.fingerprint:
+            return False
+        if not os.path.exists(self.file_path):
+            return False
+
+        os.utime(self.file_path)
+        self.skipped = True
+        self.rows_written = previous.get("rows", 0)
+        self.output_bytes = get_output_size(self.file_path)
+        self.log(f"Source data unchanged since {previous.get('exported')}, export skipped")
+        return True
+
+    def _read_high_water(self):
+        """
+        Return the high-water mark recorded by the previous delta run into the
+        output file, or None if there is no usable previous run.
+        """
+        state = read_json_sidecar(self.delta_path)
+        if not state or not os.path.exists(self.file_path):
+            return None
+        if state.get("sql") != self.sql or state.get("column") != self.delta["column"]:
+            return None
+        if state.get("parameters", []) != self.parameter_values:
+            return None
+        return decode_key(state.get("high_water"))
+
+    def _write_high_water(self):
+        """Record the high-water mark for the next delta run."""
+        high_water = self.high_water if self.high_water is not None else self.delta_from
+        write_json_sidecar(self.delta_path, {
+            "sql": self.sql,
+            "parameters": self.parameter_values,
+            "column": self.delta["column"],
+            "key": self.delta["key"],
+            "high_water": encode_key(high_water) if high_water is not None else None,
+            "updated": datetime.now().isoformat(),
+        })
+
+    def _get_order_key(self):
+        """
+        Return the (column, descending) pair the rows are ordered by, if any.
+        Delta runs are always ordered by the delta column.
+        """
+        if self.delta_from is not None:
+            return self.delta["column"], False
+        return get_order_key(self.parts.get("order_by"))
+
+    def _update_last_key(self, rows, key_index):
+        """
+        Record the last key value written, and how many rows have been written
+        with it, so a resume from the key can skip those rows.
+        """
+        last_key = rows[-1][key_index]
+        tied = 0
+        for row in reversed(rows):
+            if row[key_index] != last_key:
+                break
+            tied += 1
+
+        # The whole batch may share the key with the end of the previous batch
+        encoded = encode_key(last_key)
+        if tied == len(rows) and self.checkpoint.get("last_key") == encoded:
+            tied += self.checkpoint.get("last_key_rows", 0)
+        self.checkpoint["last_key"] = encoded
+        self.checkpoint["last_key_rows"] = tied
+
+    def _get_tiebreaker(self):
+        """
+        Return the unique key columns of the table to add to the end of the
+        ORDER BY, so rows with equal order values come back in the same order
+        if the export is resumed. Returns None if the query is unordered, the
+        key cannot be added to its order, or the table has no unique key.
+        """
+        if self.local or self.delta or not can_add_tiebreaker(self.parts):
+            return None
+        return self.db.get_unique_key(self.parts["table"])
+
+    def _resume_query(self):
+        """
+        Return the SQL, parameters and number of rows to skip needed to continue
+        from the checkpoint. Only a repeatable order can be resumed: after the
+        last key when ordered by a unique key, by an OFFSET when the order ends
+        with the table's unique key, and for a delta run from the last change
+        value written (ordered by the key within it), skipping the rows already
+        written with that value. Any other export is started again.
+        """
+        rows_written = self.checkpoint.get("rows_written", 0)
+        last_key = self.checkpoint.get("last_key")
+        tiebreaker = self.checkpoint.get("tiebreaker")
+
+        # Fetch the rows changed since the high-water mark, or from the last change value written
+        if self.delta_from is not None:
+            resuming = bool(rows_written and last_key)
+            from_key = decode_key(last_key) if resuming else self.delta_from
+            skip_rows = self.checkpoint.get("last_key_rows", 0) if resuming else 0
+            sql = build_resume_sql(self.parts, self.delta["column"], inclusive=resuming, tiebreaker=self.delta["key"])
+            return sql, [from_key], skip_rows
+
+        if not rows_written:
+            return self.export_sql, None, 0
+
+        # Resume after the last key value written, if the key is unique
+        order_key = self._get_order_key()
+        if order_key and last_key and tiebreaker and [column.lower() for column in tiebreaker] == [order_key[0].lower()]:
+            key_column, descending = order_key
+            return build_resume_sql(self.parts, key_column, descending), [decode_key(last_key)], 0
+
+        # Resume using an offset into the rows, which end with the unique key
+        if tiebreaker:
+            return self.export_sql + " OFFSET ? ROWS", [rows_written], 0
+
+        # The rows already written cannot be told apart from the rows read again
+        self._restart()
+        return self.export_sql, None, 0
+
+    def _restart(self):
+        """Start the export again from the first row, replacing the rows already written."""
+        self.log(f"The rows are not in a repeatable order, so the export is starting again instead of after {self.rows_written} rows")
+        self.rows_written = 0
+        self.checkpoint.update({"rows_written": 0, "last_key": None, "last_key_rows": 0, "file_size": None})
+
+        # Remove the features already added to the map
+        if self.map_loader is not None:
+            self.map_loader.clearRequested.emit()
+
+    def _export(self):
+        """
+        Execute the query and stream the rows to the output file in batches,
+        checkpointing after each batch is written.
+        """
+        # Stop before uploading the filters or running the query if the job was cancelled
+        if self.cancelled:
+            return
+
+        start = time.perf_counter()
+        sql, params, skip_rows = self._resume_query()
+
+        # Upload the ID list to a temp table on this connection (again after a reconnect)
+        if self.id_filter:
+            count, invalid = self.db.upload_id_list(ID_LIST_TABLE, self.id_filter["values"], self.parts["table"], self.id_filter["column"])
+            self.log(f"Uploaded {count} IDs to filter {self.id_filter['column']}")
+            if invalid:
+                self.log(f"{invalid} IDs were left out as they are not valid values of {self.id_filter['column']}")
+
+        # Upload the area of interest geometries to a temp table on this connection
+        if self.area_filter:
+            count, index_error = self.db.upload_area(AREA_TABLE, self.area_filter["wkb"], self.area_filter["srid"], self.area_filter["extent"])
+            self.log(f"Uploaded {count} area of interest geometries from {self.area_filter['layer']}")
+            if index_error:
+                self.log(f"Could not create the spatial index on the area of interest, so the query may be slow: {index_error}")
+        append = bool(self.checkpoint.get("rows_written")) and output_exists(self.format_key, self.file_path)
+
+        # Discard any text written after the last checkpoint
+        file_size = self.checkpoint.get("file_size")
+        if append and file_size is not None:
+            os.truncate(self.file_path, file_size)
+
+        # Look up the coordinate reference system of a vector output or stage once,
+        # before the query holds the connection
+        if (self.format_key in VECTOR_FORMATS or self.format_key == "stage") and self.output_crs is None:
+            self.srid = self._get_srid()
+            self.output_crs = f"EPSG:{self.srid}" if self.srid else DEFAULT_CRS
+
+        # The uploads can take a while, so check again before running the query
+        if self.cancelled:
+            return
+
+        self.log(f"Executing SQL: {sql}")
+        if self.parameters:
+            self.log("Parameters: " + ", ".join(f"{p['name']} = {p['value']}" for p in self.parameters))
+        cursor = self.db.open_cursor(sql, params, self.config.execution_timeout, self._query_params())
+        self._add_timing("query", start)
+
+        # Extract the column names from the SQL Server result set metadata
+        headers = [desc[0] for desc in cursor.description]
+
+        # Find the ordered key column in the results, if there is one
+        lower_headers = [h.lower() for h in headers]
+        order_key = self._get_order_key()
+        key_index = None
+        if order_key and order_key[0].lower() in lower_headers:
+            key_index = lower_headers.index(order_key[0].lower())
+
+        # Find the delta column so the high-water mark can be tracked
+        delta_index = None
+        if self.delta:
+            if self.delta["column"].lower() not in lower_headers:
+                raise ValueError(f"Delta column '{self.delta['column']}' must be included in the selected columns")
+            delta_index = lower_headers.index(self.delta["column"].lower())
+
+        # Merge the changed rows into the existing output for a delta run
+        upsert_key = self.delta["key"] if self.delta_from is not None else None
+        if self.format_key == "stage":
+            writer = StageWriter(self.file_path, self.parts["table"], headers, append, self.sql, self.srid)
+        elif self.format_key == "map":
+            # Create the layers the first time only, so a retry after a reconnect carries on adding to them
+            if self.map_loader is None:
+                fields, geom_index = get_output_fields(headers)
+                layer_name = os.path.splitext(os.path.basename(self.file_path))[0]
+                self.map_loader = MapLayerLoader(layer_name, fields, self.output_crs, geom_index >= 0, self.config.layer_location)
+            writer = MapLayerWriter(self.map_loader, headers)
+        else:
+            writer = open_output_writer(self.format_key, self.file_path, headers, append, upsert_key, self.config.layer_location, self.output_crs or DEFAULT_CRS)
+        if writer is None:
+            raise ValueError(f"Unknown output format '{self.format_key}'")
+
+        # Build the column formatters for the output once
+        type_formatters = OUTPUT_FORMATTERS.get(self.format_key)
+        formatters = build_column_formatters(cursor.description, type_formatters) if type_formatters else []
+        stats = ColumnStatistics(headers, self.config.distinct_columns, not hasattr(writer, "extent"))
+
+        try:
+            batch_size = self.config.export_batch_size
+            while not self.cancelled:
+                start = time.perf_counter()
+                rows = cursor.fetchmany(batch_size)
+                self._add_timing("fetch", start)
+                if not rows:
+                    break
+
+                # Skip rows that were written before the interruption
+                if skip_rows:
+                    skipped = min(skip_rows, len(rows))
+                    rows = rows[skipped:]
+                    skip_rows -= skipped
+                    if not rows:
+                        continue
+
+                # Add the batch to the column statistics
+                start = time.perf_counter()
+                stats.update(rows)
+                self._add_timing("stats", start)
+
+                # Convert the batch for the output
+                start = time.perf_counter()
+                output_rows = convert_rows(rows, formatters)
+                self._add_timing("convert", start)
+
+                # Write the batch and record the checkpoint
+                start = time.perf_counter()
+                writer.write_rows(output_rows)
+                self.rows_written += len(rows)
+                self.checkpoint["rows_written"] = self.rows_written
+                self.checkpoint["file_size"] = writer.flush()
+                if key_index is not None:
+                    self._update_last_key(rows, key_index)
+                if delta_index is not None:
+                    self._update_high_water(rows, delta_index)
+                write_json_sidecar(self.checkpoint_path, self.checkpoint)
+                self._add_timing("write", start)
+
+            # Complete outputs that are only assembled once every row is written
+            if not self.cancelled and hasattr(writer, "finish"):
+                start = time.perf_counter()
+                writer.finish()
+                self._add_timing("write", start)
+
+        finally:
+            writer.close()
+            cursor.close()
+
+        # Log the outputs if mixed geometry types were split
+        outputs = writer.output_names() if hasattr(writer, "output_names") else []
+        if len(outputs) > 1:
+            self.log(f"Mixed geometry types split into: {', '.join(outputs)}")
+
+        # Write the column statistics next to the output and to the log
+        if not self.cancelled:
+            self._write_statistics(stats, append, getattr(writer, "extent", None))
+
+    def _write_statistics(self, stats, resumed, extent=None):
+        """
+        Write the column statistics to a JSON file next to the output, and log
+        them, with the extent measured by the writer if it has one.
+        """
+        summary = stats.to_dict(extent)
+        summary["resumed"] = resumed
+        write_json_sidecar(get_stats_path(self.file_path), summary)
+        if resumed:
+            self.log("Column statistics cover the rows exported since the run was resumed:")
+        else:
+            self.log("Column statistics:")
+        for line in format_statistics(summary):
+            self.log(f"  {line}")
+
+    def _update_high_water(self, rows, delta_index):
+        """Track the highest delta column value written."""
+        values = [row[delta_index] for row in rows if row[delta_index] is not None]
+        if values:
+            batch_max = max(values)
+            if self.high_water is None or batch_max > self.high_water:
+                self.high_water = batch_max
+
+
+class ExportTask(QgsTask):
+    """
+    Run an export job in the background so QGIS stays responsive while the
+    query runs, and so the query can be cancelled from the dock.
+    """
+
+    def __init__(self, job, resume=False):
+        super().__init__(f"DataSelector export to {os.path.basename(job.file_path)}", QgsTask.CanCancel)
+        self.job = job
+        self.resume = resume
+        self.success = False
+
+    def run(self):
+        """Run the export job. Called on a background thread by the task manager."""
+        self.success = self.job.run(resume=self.resume)
+        return self.success
+
+    def cancel(self):
+        """Cancel the running query on the server as well as the task."""
+        self.job.cancel()
+        super().cancel()
+
+
+class QueuedExport:
+    """An export job in the queue, with its priority, status and timings."""
+
+    def __init__(self, entry_id, job, resume=False, priority=0):
+        self.entry_id = entry_id
+        self.job = job
+        self.resume = resume
+        self.priority = priority
+        self.status = "Queued"
+        self.task = None
+        self.queued = time.time()
+        self.started = None
+        self.finished = None
+
+    def is_active(self):
+        """Check if the job is waiting or running."""
+        return self.status in ("Queued", "Running")
+
+    def duration(self):
+        """Return the seconds the job has been running for (or ran for), or None if not started."""
+        if self.started is None:
+            return None
+        return (self.finished or time.time()) - self.started
+
+
+class ExportQueue(QObject):
+    """
+    Queue of export jobs run in the background as QgsTasks, at most max_running
+    at a time. Waiting jobs are started highest priority first, then in the
+    order they were added. A job whose query is not scoped to its run would
+    read the selection of any other run, so it only runs on its own.
+    """
+
+    # Emitted when a job is added, started, finishes or is changed
+    changed = pyqtSignal()
+
+    # Emitted with the QueuedExport when a running job finishes, fails or is cancelled
+    jobFinished = pyqtSignal(object)
+
+    def __init__(self, max_running=1, parent=None):
+        super().__init__(parent)
+        self.max_running = max(1, max_running)
+        self.entries = []
+        self._next_id = 1
+
+    def add(self, job, resume=False, priority=0):
+        """Add a job to the queue and start it if there is a free slot."""
+        entry = QueuedExport(self._next_id, job, resume, priority)
+        self._next_id += 1
+        self.entries.append(entry)
+        self._start_next()
+        self.changed.emit()
+        return entry
+
+    def active_entries(self):
+        """Return the jobs that are waiting or running."""
+        return [entry for entry in self.entries if entry.is_active()]
+
+    def _start_next(self):
+        """Start waiting jobs, highest priority first, until the running limit is reached."""
+        running = [entry for entry in self.entries if entry.status == "Running"]
+        waiting = sorted(
+            (entry for entry in self.entries if entry.status == "Queued"),
+            key=lambda entry: (-entry.priority, entry.entry_id)
+        )
+        for entry in waiting:
+            # Stop at the limit, or at a job that cannot share the server with the running ones
+            if len(running) >= self.max_running:
+                break
+            if running and not (entry.job.run_scoped and all(other.job.run_scoped for other in running)):
+                break
+            running.append(entry)
+            entry.status = "Running"
+            entry.started = time.time()
+            entry.task = ExportTask(entry.job, entry.resume)
+            entry.task.taskCompleted.connect(lambda entry=entry: self._finished(entry))
+            entry.task.taskTerminated.connect(lambda entry=entry: self._finished(entry))
+            QgsApplication.taskManager().addTask(entry.task)
+
+    def _finished(self, entry):
+        """Record the result of a job and start the next one."""
+        entry.finished = time.time()
+        if entry.task.success:
+            entry.status = "Completed"
+        elif entry.job.cancelled:
+            entry.status = "Cancelled"
+        else:
+            entry.status = "Failed"
+        entry.task = None
+        self._start_next()
+        self.changed.emit()
+        self.jobFinished.emit(entry)
+
+    def set_priority(self, entry, priority):
+        """Change the priority of a job that has not started yet."""
+        if entry.status == "Queued":
+            entry.priority = priority
+            self.changed.emit()
+
+    def cancel(self, entry):
+        """Remove a waiting job from the queue, or cancel a running one."""
+        if entry.status == "Queued":
+            entry.status = "Cancelled"
+            entry.finished = time.time()
+            self.changed.emit()
+        elif entry.status == "Running" and entry.task is not None:
+            entry.task.cancel()
+
+    def cancel_all(self):
+        """Cancel every waiting and running job."""
+        for entry in self.active_entries():
+            self.cancel(entry)
+
+    def clear_finished(self):
+        """Remove the jobs that have finished from the list."""
+        self.entries = self.active_entries()
+        self.changed.emit()
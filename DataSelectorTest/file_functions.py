@@ -1,92 +1,677 @@
 import csv
+import hashlib
+import json
 import os
-from qgis.core import QgsFields, QgsField, QgsVectorLayer, QgsVectorFileWriter, QgsFeature, QgsGeometry, QgsProject
+import re
+import shutil
+import subprocess
+import tempfile
+import zipfile
+from qgis.core import QgsFields, QgsField, QgsVectorLayer, QgsVectorFileWriter, QgsFeature, QgsFeatureRequest, QgsExpression, QgsGeometry, QgsProject, QgsWkbTypes, QgsCoordinateReferenceSystem, QgsRectangle, QgsVectorDataProvider
 from PyQt5.QtCore import QVariant
 from datetime import datetime
 
-def write_csv(file_path, headers, rows):
+# Names of the columns holding the geometry
+GEOMETRY_COLUMNS = ("shape", "sp_geometry")
+
+class DelimitedFileWriter:
     """
-    Write output to a .csv file with headers and rows.
-    Equivalent to the C# WriteEmptyTextFile + export logic.
+    Stream rows to a delimited text file (.csv or .txt) in batches.
+    When appending, the header row is not written again.
+    """
+
+    def __init__(self, file_path, headers, delimiter=",", append=False):
+        self.file_path = file_path
+        self._file = open(file_path, 'a' if append else 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file, delimiter=delimiter)
+
+        # Only write the header row for a new file
+        if not append:
+            self._writer.writerow(headers)
+
+    def write_rows(self, rows):
+        """Write a batch of rows to the file."""
+        self._writer.writerows(rows)
+
+    def flush(self):
+        """Flush buffered rows to disk and return the current file size."""
+        self._file.flush()
+        return self._file.tell()
+
+    def close(self):
+        """Close the file."""
+        self._file.close()
+
+
+def get_output_fields(headers):
+    """
+    Build the attribute fields for a vector output from the column names.
+    Returns the fields and the index of the 'Shape' or 'SP_GEOMETRY' column (-1 if none).
+    """
+    fields = QgsFields()
+    geom_index = -1
+
+    # Define attribute fields
+    for i, name in enumerate(headers):
+        if name.lower() in GEOMETRY_COLUMNS:
+            geom_index = i
+            continue
+        fields.append(QgsField(name, QVariant.String))
+
+    return fields, geom_index
+
+
+# Coordinate reference system of vector outputs when the table's cannot be found
+DEFAULT_CRS = "EPSG:4326"
+
+# Multi-part geometry types used for each geometry family, so single and
+# multi-part geometries of the same family can share an output
+GEOMETRY_OUTPUT_TYPES = {
+    QgsWkbTypes.PointGeometry: ("Point", QgsWkbTypes.MultiPoint),
+    QgsWkbTypes.LineGeometry: ("Line", QgsWkbTypes.MultiLineString),
+    QgsWkbTypes.PolygonGeometry: ("Polygon", QgsWkbTypes.MultiPolygon),
+}
+
+
+def geometry_from_value(value):
+    """
+    Convert a geometry column value to a QgsGeometry. Accepts WKT text or WKB bytes.
+    Returns None for empty values.
+    """
+    if not value:
+        return None
+    if isinstance(value, (bytes, bytearray)):
+        geom = QgsGeometry()
+        geom.fromWkb(bytes(value))
+        return geom
+    return QgsGeometry.fromWkt(value)
+
+
+def rows_to_features(rows, fields, geom_index, extent=None):
+    """
+    Convert a batch of rows to features, taking the geometry from the geometry column.
+    Geometries are converted to multi-part so they match the output layer type.
+    If an extent is given it is grown to include each geometry.
+    """
+    features = []
+
+    for row in rows:
+        feat = QgsFeature(fields)
+
+        # Take the attributes, leaving out the geometry column
+        attrs = list(row)
+        if geom_index >= 0:
+            del attrs[geom_index]
+        feat.setAttributes(attrs)
+
+        if geom_index >= 0:
+            geom = geometry_from_value(row[geom_index])
+            if geom is not None and not geom.isNull():
+                geom.convertToMultiType()
+                feat.setGeometry(geom)
+                if extent is not None:
+                    extent.combineExtentWith(geom.boundingBox())
+
+        features.append(feat)
+
+    return features
+
+
+def split_features_by_type(features):
+    """
+    Group features by geometry type (point, line or polygon) in one pass.
+    Features without a geometry are grouped under None.
+    """
+    groups = {}
+    for feat in features:
+        geom_type = feat.geometry().type() if feat.hasGeometry() else None
+        if geom_type not in GEOMETRY_OUTPUT_TYPES:
+            geom_type = None
+        groups.setdefault(geom_type, []).append(feat)
+    return groups
+
+
+def find_existing_outputs(file_path, driver_name):
+    """
+    Find the output written for each geometry type by a previous run: the output
+    name itself and any '<name>_Point', '<name>_Line' or '<name>_Polygon' outputs.
+    Returns a dictionary of geometry type to (path, layer name).
+    """
+    base_path, extension = os.path.splitext(file_path)
+    base_name = os.path.basename(base_path)
+    outputs = {}
+
+    for suffix in [""] + [f"_{type_name}" for type_name, _ in GEOMETRY_OUTPUT_TYPES.values()]:
+        if driver_name == "GPKG":
+            path, layer_name = file_path, base_name + suffix
+            uri = f"{path}|layername={layer_name}"
+        else:
+            path, layer_name = base_path + suffix + extension, base_name + suffix
+            uri = path
+        if not os.path.exists(path):
+            continue
+
+        # Record the geometry type of the output
+        layer = QgsVectorLayer(uri, layer_name, "ogr")
+        if layer.isValid() and layer.geometryType() not in outputs:
+            outputs[layer.geometryType()] = (path, layer_name)
+
+    return outputs
+
+
+class VectorFileWriter:
+    """
+    Stream rows to a vector file (shapefile or GeoPackage) in batches. Expects
+    WKT or WKB geometry in a field called 'Shape' or 'SP_GEOMETRY'.
+
+    The geometry type is detected for each row and features are routed to one
+    output per geometry type, so mixed point/polygon results are split in a
+    single pass. The first geometry type found is written to the output name,
+    and any further types to '<name>_Point', '<name>_Line' or '<name>_Polygon'
+    (separate shapefiles, or extra layers in the same GeoPackage).
+    When appending, features are added to the existing outputs.
+    """
+
+    def __init__(self, file_path, headers, driver_name="ESRI Shapefile", append=False, crs_authid=DEFAULT_CRS):
+        self.file_path = file_path
+        self.driver_name = driver_name
+        self.append = append
+        self.crs = QgsCoordinateReferenceSystem(crs_authid)
+        self.fields, self.geom_index = get_output_fields(headers)
+        self.base_path, self.extension = os.path.splitext(file_path)
+        self.base_name = os.path.basename(self.base_path)
+
+        # The output path and layer name for each geometry type, in the order they were created
+        self.outputs = {}
+        self._writers = {}
+
+        # Features without a geometry waiting for the first output to be created
+        self._pending = []
+
+        # The extent of the geometries written, measured as the features are built
+        self.extent = QgsRectangle()
+        self.extent.setMinimal()
+
+        # Find the outputs written by the previous run
+        if append:
+            self.outputs = find_existing_outputs(file_path, driver_name)
+
+        # Tables without a geometry column are written as a single table
+        if self.geom_index < 0:
+            self._get_writer(QgsWkbTypes.NullGeometry, QgsWkbTypes.NoGeometry)
+
+    def _output_for(self, type_name):
+        """Return the path and layer name for the output of a geometry type."""
+        suffix = f"_{type_name}" if self.outputs else ""
+        if self.driver_name == "GPKG":
+            return self.file_path, self.base_name + suffix
+        return self.base_path + suffix + self.extension, self.base_name + suffix
+
+    def _get_writer(self, geom_type, wkb_type):
+        """Return the writer for a geometry type, creating its output if needed."""
+        if geom_type in self._writers:
+            return self._writers[geom_type]
+
+        # Append to an existing output, or create a new one
+        options = QgsVectorFileWriter.SaveVectorOptions()
+        options.driverName = self.driver_name
+        options.fileEncoding = "UTF-8"
+        if geom_type in self.outputs:
+            path, layer_name = self.outputs[geom_type]
+            options.actionOnExistingFile = QgsVectorFileWriter.AppendToLayerNoNewFields
+        else:
+            type_name = GEOMETRY_OUTPUT_TYPES.get(geom_type, ("Table", None))[0]
+            path, layer_name = self._output_for(type_name)
+            if self.driver_name == "GPKG" and os.path.exists(path) and (self.outputs or self.append):
+                options.actionOnExistingFile = QgsVectorFileWriter.CreateOrOverwriteLayer
+            self.outputs[geom_type] = (path, layer_name)
+        options.layerName = layer_name
+
+        writer = QgsVectorFileWriter.create(
+            path, self.fields, wkb_type,
+            self.crs, QgsProject.instance().transformContext(), options
+        )
+        if writer.hasError() != QgsVectorFileWriter.NoError:
+            raise IOError(writer.errorMessage())
+
+        self._writers[geom_type] = writer
+        return writer
+
+    def _add_features(self, writer, features):
+        """Add features to an output, raising an error if they cannot be written."""
+        if not writer.addFeatures(features):
+            raise IOError(writer.errorMessage())
+
+    def write_rows(self, rows):
+        """Convert a batch of rows to features and route them to the output for their geometry type."""
+        self.write_features(rows_to_features(rows, self.fields, self.geom_index, self.extent))
+
+    def write_features(self, features):
+        """Route features built with the writer's fields to the output for their geometry type."""
+        for geom_type, group in split_features_by_type(features).items():
+            if geom_type is None:
+                self._pending.extend(group)
+                continue
+            type_name, wkb_type = GEOMETRY_OUTPUT_TYPES[geom_type]
+            self._add_features(self._get_writer(geom_type, wkb_type), group)
+
+        # Add features without a geometry to the first output
+        if self._pending and self._writers:
+            self._add_features(next(iter(self._writers.values())), self._pending)
+            self._pending = []
+
+    def flush(self):
+        """Flush buffered features to disk."""
+
+        # Features without a geometry need an output before they can be written,
+        # so default to a polygon output as before
+        if self._pending:
+            writer = self._get_writer(QgsWkbTypes.PolygonGeometry, QgsWkbTypes.MultiPolygon)
+            self._add_features(writer, self._pending)
+            self._pending = []
+
+        for writer in self._writers.values():
+            writer.flushBuffer()
+        return None
+
+    def close(self):
+        """Finish writing the outputs."""
+        self.flush()
+
+        # Releasing the writers closes the files
+        self._writers = {}
+
+    def output_names(self):
+        """Return the names of the outputs written: file paths, or layer names for a GeoPackage."""
+        if self.driver_name == "GPKG":
+            return [layer_name for _, layer_name in self.outputs.values()]
+        return [path for path, _ in self.outputs.values()]
+
+
+def get_zip_work_folder(file_path):
+    """
+    Return the local temp folder a zipped shapefile is written to before it is
+    zipped to the output path. The folder is named after the output path so an
+    interrupted export can carry on where it stopped.
+    """
+    key = hashlib.sha1(os.path.abspath(file_path).lower().encode("utf-8")).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"DataSelector_{key}")
+
+
+class ZippedShapefileWriter:
+    """
+    Stream rows to a shapefile in a local temp folder, then zip its files (with
+    the layer style, if there is one) into a single .zip at the output path.
+    Only the compressed .zip is written to the output folder, which is often a
+    network share, so the data crosses the network once as one file.
+    """
+
+    def __init__(self, file_path, headers, append=False, style_path=None, crs_authid=DEFAULT_CRS):
+        self.file_path = file_path
+        self.style_path = style_path
+        self.work_folder = get_zip_work_folder(file_path)
+
+        # Start with an empty folder, unless carrying on after an interruption
+        if not append:
+            shutil.rmtree(self.work_folder, ignore_errors=True)
+        os.makedirs(self.work_folder, exist_ok=True)
+
+        stem = os.path.splitext(os.path.basename(file_path))[0]
+        self._writer = VectorFileWriter(os.path.join(self.work_folder, stem + ".shp"), headers, "ESRI Shapefile", append, crs_authid)
+
+    @property
+    def extent(self):
+        """The extent of the geometries written."""
+        return self._writer.extent
+
+    def write_rows(self, rows):
+        """Write a batch of rows to the local shapefile."""
+        self._writer.write_rows(rows)
+
+    def flush(self):
+        """Flush buffered features to the local shapefile."""
+        return self._writer.flush()
+
+    def finish(self):
+        """
+        Zip the shapefiles, and a copy of the style for each one, to the output
+        path once every row has been written. The zip is written to a temporary
+        name and then replaced so an incomplete zip is never left behind.
+        """
+        self._writer.close()
+        temp_path = self.file_path + ".tmp"
+        with zipfile.ZipFile(temp_path, "w", zipfile.ZIP_DEFLATED) as zip_file:
+            for entry in sorted(os.scandir(self.work_folder), key=lambda e: e.name):
+                zip_file.write(entry.path, entry.name)
+
+            # Name the style after each shapefile so QGIS applies it when the layer is opened
+            if self.style_path and os.path.isfile(self.style_path):
+                for path in self._writer.output_names():
+                    zip_file.write(self.style_path, os.path.splitext(os.path.basename(path))[0] + ".qml")
+        os.replace(temp_path, self.file_path)
+        shutil.rmtree(self.work_folder, ignore_errors=True)
+
+    def close(self):
+        """Close the local shapefile. It is kept if the export did not finish so it can be resumed."""
+        self._writer.close()
+
+    def output_names(self):
+        """Return the names of the shapefiles in the zip."""
+        return [os.path.basename(path) for path in self._writer.output_names()]
+
+
+def output_exists(format_key, file_path):
+    """
+    Check if an export has already written to its output, so an interrupted
+    export can be carried on. A zipped shapefile is only zipped when complete,
+    so its local temp folder is checked instead.
+    """
+    if format_key == "zip":
+        return os.path.isdir(get_zip_work_folder(file_path))
+    return os.path.exists(file_path)
+
+
+class GeoPackageUpserter:
+    """
+    Merge batches of rows into an existing GeoPackage. Features whose key
+    column matches a row in the batch are replaced, and new keys are added.
+    Used to apply delta extracts to the output of a previous run.
+    The output layers are opened once for the run and indexed on the key
+    column, so the features to replace are found without scanning each layer.
+    """
+
+    def __init__(self, file_path, headers, key_column, crs_authid=DEFAULT_CRS):
+        self.file_path = file_path
+        self.headers = headers
+        self.key_column = key_column
+        self.crs_authid = crs_authid
+        self.fields, self.geom_index = get_output_fields(headers)
+
+        # The extent of the geometries merged in
+        self.extent = QgsRectangle()
+        self.extent.setMinimal()
+
+        # Find the key column in the results
+        lower_headers = [h.lower() for h in headers]
+        if key_column.lower() not in lower_headers:
+            raise ValueError(f"Key column '{key_column}' must be included in the selected columns")
+        self.key_index = lower_headers.index(key_column.lower())
+        self.key_field = self.fields.field(self.fields.lookupField(headers[self.key_index]))
+
+        # Open the layers written by the previous run
+        self._layers = {}
+        self._open_layers()
+
+    def _open_layers(self):
+        """Open any output layers not yet open, indexing them on the key column."""
+        for geom_type, (path, layer_name) in find_existing_outputs(self.file_path, "GPKG").items():
+            if geom_type in self._layers:
+                continue
+            layer = QgsVectorLayer(f"{path}|layername={layer_name}", layer_name, "ogr")
+            provider = layer.dataProvider()
+            key_index = layer.fields().lookupField(self.key_field.name())
+            if key_index >= 0 and provider.capabilities() & QgsVectorDataProvider.CreateAttributeIndex:
+                provider.createAttributeIndex(key_index)
+
+            # The layer has a fid column before the output fields
+            mapping = [layer.fields().lookupField(field.name()) for field in self.fields]
+            self._layers[geom_type] = (layer, mapping)
+
+    def _format_key(self, value):
+        """
+        Format a key the way the writer stores it in the text key field (so
+        dates keep QGIS's own format), or None if it is null or cannot be.
+        """
+        if value is None:
+            return None
+        try:
+            key = self.key_field.convertCompatible(value)
+        except ValueError:
+            return None
+        return key if isinstance(key, str) else None
+
+    def _delete_keys(self, keys):
+        """Delete the features with the given keys from every geometry layer."""
+        key_list = ", ".join(QgsExpression.quotedValue(key) for key in keys)
+        expression = f"{QgsExpression.quotedColumnRef(self.key_field.name())} IN ({key_list})"
+
+        for layer, _ in self._layers.values():
+            request = QgsFeatureRequest().setFilterExpression(expression)
+            request.setFlags(QgsFeatureRequest.NoGeometry)
+            request.setNoAttributes()
+            fids = [feat.id() for feat in layer.getFeatures(request)]
+
+            # Delete the old versions of the changed rows
+            if fids and not layer.dataProvider().deleteFeatures(fids):
+                raise IOError(f"Cannot delete changed features from {self.file_path}")
+
+    def _add_features(self, layer, mapping, features):
+        """Add features to an open layer, placing their attributes in the layer's fields."""
+        layer_fields = layer.fields()
+        added = []
+        for feat in features:
+            attrs = [None] * layer_fields.count()
+            for index, value in zip(mapping, feat.attributes()):
+                if index >= 0:
+                    attrs[index] = value
+            new_feat = QgsFeature(layer_fields)
+            new_feat.setAttributes(attrs)
+            if feat.hasGeometry():
+                new_feat.setGeometry(feat.geometry())
+            added.append(new_feat)
+
+        ok, _ = layer.dataProvider().addFeatures(added)
+        if not ok:
+            raise IOError(f"Cannot add changed features to {self.file_path}: {layer.dataProvider().lastError()}")
+
+    def write_rows(self, rows):
+        """Replace the features with the same keys as the batch and add the new rows."""
+        features = rows_to_features(rows, self.fields, self.geom_index, self.extent)
+
+        # Delete the existing features with the same keys, matching them as they were stored
+        keys = {self._format_key(row[self.key_index]) for row in rows}
+        keys.discard(None)
+        if keys:
+            self._delete_keys(sorted(keys))
+
+        # Add the new versions to the open layers, and features without a geometry to the first
+        new_features = []
+        for geom_type, group in split_features_by_type(features).items():
+            if geom_type is None and self._layers:
+                geom_type = next(iter(self._layers))
+            if geom_type not in self._layers:
+                new_features.extend(group)
+                continue
+            layer, mapping = self._layers[geom_type]
+            self._add_features(layer, mapping, group)
+
+        # Create outputs for geometry types not written before, then keep them open too
+        if new_features:
+            writer = VectorFileWriter(self.file_path, self.headers, "GPKG", True, self.crs_authid)
+            try:
+                writer.write_features(new_features)
+            finally:
+                writer.close()
+            self._open_layers()
+
+    def flush(self):
+        """Changes are committed as each batch is written."""
+        return None
+
+    def close(self):
+        """Release the output layers."""
+        self._layers = {}
+
+
+def open_output_writer(format_key, file_path, headers, append=False, upsert_key=None, style_path=None, crs_authid=DEFAULT_CRS):
+    """
+    Create a streaming writer for the given output format key ('shp', 'zip', 'gpkg', 'csv' or 'txt').
+    If an upsert key is given the rows are merged into the existing GeoPackage instead.
+    The style is included in a zipped shapefile, and vector outputs are written in the
+    given coordinate reference system. Returns None if the format is not recognised.
+    """
+    if format_key == "csv":
+        return DelimitedFileWriter(file_path, headers, ",", append)
+    if format_key == "txt":
+        return DelimitedFileWriter(file_path, headers, "\t", append)
+    if format_key == "shp":
+        return VectorFileWriter(file_path, headers, "ESRI Shapefile", append, crs_authid)
+    if format_key == "zip":
+        return ZippedShapefileWriter(file_path, headers, append, style_path, crs_authid)
+    if format_key == "gpkg":
+        if upsert_key:
+            return GeoPackageUpserter(file_path, headers, upsert_key, crs_authid)
+        return VectorFileWriter(file_path, headers, "GPKG", append, crs_authid)
+    return None
+
+
+def write_output(format_key, file_path, headers, rows):
+    """
+    Write all rows to the output file in one call using the streaming writer for the format.
     """
     try:
-        with open(file_path, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(headers)
-            writer.writerows(rows)
+        writer = open_output_writer(format_key, file_path, headers)
+        if writer is None:
+            return False
+        try:
+            writer.write_rows(rows)
+        finally:
+            writer.close()
         return True
     except Exception as e:
-        print(f"[CSV Export Error] {e}")
+        print(f"[{format_key.upper()} Export Error] {e}")
         return False
 
 
+def write_csv(file_path, headers, rows):
+    """
+    Write output to a .csv file with headers and rows.
+    Equivalent to the C# WriteEmptyTextFile + export logic.
+    """
+    return write_output("csv", file_path, headers, rows)
+
+
 def write_txt(file_path, headers, rows):
     """
     Write output to a .txt file using tab-delimited format.
     """
+    return write_output("txt", file_path, headers, rows)
+
+
+def write_shapefile(file_path, headers, rows, geom_field="Shape"):
+    """
+    Write output to a shapefile (.shp). Expects WKT geometry in a field called 'Shape' or 'SP_GEOMETRY'.
+    """
+    return write_output("shp", file_path, headers, rows)
+
+
+def read_json_sidecar(file_path):
+    """
+    Read a JSON sidecar file (e.g. an export checkpoint) and return its contents.
+    Returns None if the file does not exist or cannot be read.
+    """
     try:
-        with open(file_path, 'w', newline='', encoding='utf-8') as txtfile:
-            writer = csv.writer(txtfile, delimiter='\t')
-            writer.writerow(headers)
-            writer.writerows(rows)
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[Sidecar Error] Could not read {file_path}: {e}")
+        return None
+
+
+def write_json_sidecar(file_path, data):
+    """
+    Write a JSON sidecar file. The file is written to a temporary name and then
+    replaced so a crash part way through never leaves a truncated file.
+    """
+    try:
+        temp_path = file_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, default=str)
+        os.replace(temp_path, file_path)
         return True
     except Exception as e:
-        print(f"[TXT Export Error] {e}")
+        print(f"[Sidecar Error] Could not write {file_path}: {e}")
         return False
 
 
-def write_shapefile(file_path, headers, rows, geom_field="Shape"):
+def delete_json_sidecar(file_path):
     """
-    Write output to a shapefile (.shp). Expects WKT geometry in a field called 'Shape' or 'SP_GEOMETRY'.
-    Creates a temporary vector layer in memory and writes it to file.
+    Delete a JSON sidecar file if it exists.
     """
     try:
-        fields = QgsFields()
-        geom_index = -1
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        return True
+    except Exception as e:
+        print(f"[Sidecar Error] Could not delete {file_path}: {e}")
+        return False
 
-        # Define attribute fields
-        for i, name in enumerate(headers):
-            if name.lower() in ("shape", "sp_geometry"):
-                geom_index = i
-                continue
-            fields.append(QgsField(name, QVariant.String))
 
-        # Default to polygon geometry, can be changed based on known structure
-        layer = QgsVectorLayer("Polygon?crs=EPSG:4326", "Export", "memory")
-        provider = layer.dataProvider()
-        provider.addAttributes(fields)
-        layer.updateFields()
+def get_checkpoint_path(output_path):
+    """
+    Return the path of the checkpoint file kept next to an output file.
+    """
+    return output_path + ".checkpoint.json"
 
-        features = []
 
-        for row in rows:
-            feat = QgsFeature()
-            attrs = []
+def get_fingerprint_path(output_path):
+    """
+    Return the path of the fingerprint file kept next to an output file,
+    recording what was exported so an unchanged export can be skipped.
+    """
+    return output_path + ".fingerprint.json"
 
-            for i, val in enumerate(row):
-                if i == geom_index:
-                    continue
-                attrs.append(val)
-            feat.setAttributes(attrs)
 
-            if geom_index >= 0:
-                wkt = row[geom_index]
-                geom = QgsGeometry.fromWkt(wkt)
-                feat.setGeometry(geom)
+def get_stats_path(output_path):
+    """
+    Return the path of the column statistics file kept next to an output file.
+    """
+    return output_path + ".stats.json"
 
-            features.append(feat)
 
-        provider.addFeatures(features)
+def get_output_size(file_path):
+    """
+    Return the total size in bytes of an output, including the other files of
+    a shapefile and any outputs split by geometry type, but not the sidecars.
+    """
+    folder = os.path.dirname(file_path) or "."
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    total = 0
+    try:
+        for name in os.listdir(folder):
+            if name.startswith(stem) and not name.endswith((".json", ".tmp")):
+                name_stem = os.path.splitext(name)[0]
+                if name_stem == stem or name_stem in (f"{stem}_Point", f"{stem}_Line", f"{stem}_Polygon"):
+                    total += os.path.getsize(os.path.join(folder, name))
+    except OSError as e:
+        print(f"[Output Size Error] {e}")
+    return total
 
-        # Create the shapefile
-        options = QgsVectorFileWriter.SaveVectorOptions()
-        options.driverName = "ESRI Shapefile"
-        options.fileEncoding = "UTF-8"
-        QgsVectorFileWriter.writeAsVectorFormatV2(layer, file_path, QgsProject.instance().transformContext(), options)
-        return True
-    except Exception as e:
-        print(f"[SHP Export Error] {e}")
-        return False
+
+def get_run_registry_path(log_path, user_id):
+    """
+    Return the path of the file recording the user's export runs that may
+    still have temporary tables on the server.
+    """
+    return os.path.join(log_path, f"DataSelector_{user_id}.runs.json")
+
+
+def get_delta_path(output_path):
+    """
+    Return the path of the delta state file (the high-water mark) kept next to an output file.
+    """
+    return output_path + ".delta.json"
+
+
+def read_id_file(file_path):
+    """
+    Read a list of IDs from a text or CSV file. IDs can be one per line or
+    separated by commas, semicolons, tabs or spaces.
+    """
+    with open(file_path, 'r', encoding='utf-8-sig', errors='replace') as f:
+        return [value for value in re.split(r"[,;\s]+", f.read()) if value]
 
 def create_log_file(log_path):
     """
@@ -1,21 +1,41 @@
 from qgis.PyQt import uic
-from qgis.PyQt.QtWidgets import QDockWidget, QFileDialog, QPushButton, QHBoxLayout, QSpacerItem, QSizePolicy, QWidget, QVBoxLayout, QMessageBox
-from qgis.core import QgsMessageLog, Qgis
+from qgis.PyQt.QtCore import QTimer, QVariant
+from qgis.PyQt.QtWidgets import QDockWidget, QFileDialog, QPushButton, QHBoxLayout, QSpacerItem, QSizePolicy, QWidget, QVBoxLayout, QMessageBox, QInputDialog
+from qgis.core import QgsMessageLog, Qgis, QgsApplication, QgsTask, QgsProject, QgsVectorLayer, QgsGeometry, QgsRectangle, QgsCoordinateTransform, QgsCoordinateReferenceSystem
 
 import os
 import getpass
 
-from ..config_loader import DataSelectorConfig
+from ..data_selector_session import DataSelectorSession
 from ..sql_server_functions import SQLServerFunctions
-from ..file_functions import write_csv, write_txt, write_shapefile, create_log_file, write_log, delete_log_file, open_log_file
-from ..string_functions import strip_illegals
+from ..file_functions import write_log, delete_log_file, open_log_file, read_id_file
+from ..export_functions import ExportJob
+from ..stage_functions import LocalStage, get_stage_path
+from .preview_dialog import PreviewDialog
+from .export_queue_dialog import ExportQueueDialog
+from .history_dialog import HistoryDialog
+from .library_dialog import LibraryDialog
+from .table_select_dialog import TableSelectDialog
+from ..query_functions import build_query_sql, can_add_tiebreaker, ID_LIST_TABLE, AREA_TABLE, get_query_tables, read_query_file, write_query_file, parse_parameters, build_declarations, add_run_parameters
+from ..plan_functions import parse_query_plan, format_query_plan
+from ..history_functions import format_prediction
+from ..string_functions import strip_illegals, clean_sql_error
 
 FORM_CLASS, _ = uic.loadUiType(os.path.join(
     os.path.dirname(__file__), 'data_selector_dock.ui'))
 
+# Delay (in milliseconds) after the last edit before the SQL is validated
+VALIDATION_DELAY = 750
+
+# Number of validation results remembered for queries checked before
+VALIDATION_CACHE_SIZE = 200
+
 class DataSelectorDockWidget(QDockWidget, FORM_CLASS):
-    def __init__(self, parent=None):
-        """Initialize the dockable widget and load configuration."""
+    def __init__(self, parent=None, session=None):
+        """
+        Initialize the dockable widget from the plugin's session, which holds the
+        configuration, connections and cached lists between openings of the dock.
+        """
 
         # Call the parent constructor
         super().__init__(parent)
@@ -24,36 +44,45 @@ class DataSelectorDockWidget(QDockWidget, FORM_CLASS):
         # Set the on_close callback to None
         self._on_close_callback = None
 
-        # Load config from XML
-        self.config = DataSelectorConfig()
+        # Use the plugin's session, or start a new one
+        self.session = session or DataSelectorSession()
+
+        # Get the config loaded from XML
+        self.config = self.session.config
         if not self.config.loaded:
             self.labelMessage.setText("Failed to load config file.")
         else:
             self.labelMessage.setText("")
 
-        # Connect to SQL Server
-        self.db = SQLServerFunctions(self.config.sql_connection)
+        # Use the session's connection to SQL Server
+        self.db = self.session.db
 
         # Set up the UI components
         self.checkClearLog.setChecked(self.config.clear_log)
         self.checkOpenLog.setChecked(self.config.open_log)
         
-        # Populate table list on load
+        # Populate table list on load, from the session's list if already fetched
         if self.config.loaded:
-            self.refresh_tables()
+            self.load_tables()
 
         # Define a translation map from display names to internal format codes
         self.format_translation = {
             "Shapefile": "shp",
             "CSV file (comma delimited)": "csv",
-            "Text file (tab delimited)": "txt"
+            "Text file (tab delimited)": "txt",
+            "GeoPackage": "gpkg",
+            "Zipped shapefile": "zip",
+            "Add to map": "map"
         }
 
         # Define a reverse map for display names
         self.format_map = {
             'csv': 'CSV file (comma delimited)',
             'txt': 'Text file (tab delimited)',
-            'shp': 'Shapefile'
+            'shp': 'Shapefile',
+            'gpkg': 'GeoPackage',
+            'zip': 'Zipped shapefile',
+            'map': 'Add to map'
         }
 
         # Translate config value if it matches one of the short codes
@@ -77,8 +106,18 @@ class DataSelectorDockWidget(QDockWidget, FORM_CLASS):
         self.buttonLoad.clicked.connect(self.load_query)
         self.buttonSave.clicked.connect(self.save_query)
         self.buttonVerify.clicked.connect(self.verify_sql)
+        self.buttonPreview.clicked.connect(self.preview_query)
+        self.buttonPlan.clicked.connect(self.show_plan)
         self.buttonRun.clicked.connect(self.run_query)
+        self.buttonCancel.clicked.connect(self.cancel_query)
+        self.buttonQueue.clicked.connect(self.show_queue)
+        self.buttonHistory.clicked.connect(self.show_history)
+        self.buttonLibrary.clicked.connect(self.show_library)
         self.buttonRefreshTables.clicked.connect(self.refresh_tables)
+        self.buttonMoreTables.clicked.connect(self.choose_extra_tables)
+        self.buttonIdFilter.clicked.connect(self.choose_id_filter)
+        self.buttonAreaFilter.clicked.connect(self.choose_area_filter)
+        self.buttonStage.clicked.connect(self.stage_selection)
 
         # Connect text and combobox signals
         self.textColumns.textChanged.connect(self.update_button_states)
@@ -87,12 +126,68 @@ class DataSelectorDockWidget(QDockWidget, FORM_CLASS):
         self.textOrderBy.textChanged.connect(self.update_button_states)
         self.comboOutputFormat.currentIndexChanged.connect(self.update_button_states)
         self.comboTableName.currentIndexChanged.connect(self.update_button_states)
+        self.comboTableName.currentIndexChanged.connect(self.update_stage_state)
 
         # Hook up logic
         self.textColumns.mouseDoubleClickEvent = self.load_columns
 
+        # Validate the SQL in the background on its own connection, remembering
+        # the result for each SQL text so unchanged queries are not checked again
+        self.validation_db = self.session.validation_db
+        self.validation_lock = self.session.validation_lock
+        self.validation_cache = self.session.validation_cache
+        self.validation_task = None
+        self.validation_pending = False
+
+        # Restart the delay whenever the query is edited, then validate it and
+        # update the predicted run time
+        self.validation_timer = QTimer(self)
+        self.validation_timer.setSingleShot(True)
+        self.validation_timer.setInterval(VALIDATION_DELAY)
+        self.validation_timer.timeout.connect(self.query_changed)
+        # Ignore the signals' arguments, which would otherwise be taken as the timer's interval
+        self.textColumns.textChanged.connect(lambda *args: self.validation_timer.start())
+        self.textWhere.textChanged.connect(lambda *args: self.validation_timer.start())
+        self.textGroupBy.textChanged.connect(lambda *args: self.validation_timer.start())
+        self.textOrderBy.textChanged.connect(lambda *args: self.validation_timer.start())
+        self.textParameters.textChanged.connect(lambda *args: self.validation_timer.start())
+        self.comboTableName.currentIndexChanged.connect(lambda *args: self.validation_timer.start())
+        self.comboOutputFormat.currentIndexChanged.connect(lambda *args: self.validation_timer.start())
+
+        # Set the ID list and area of interest filters to None
+        self.id_filter = None
+        self.area_filter = None
+
+        # Other tables to run the same query against
+        self.extra_tables = []
+
+        # Remember the last parameter values entered, to offer them again
+        self.parameter_values = {}
+
         # Set the process status to None
         self.process_status = None
+        self.preview_dialog = None
+        self.plan_task = None
+        self.queue_dialog = None
+        self.last_export = None
+
+        # Set when the dock is closed, so background tasks finishing later leave its widgets alone
+        self.closed = False
+        self.log_file = self.session.log_file
+
+        # Restore the form as it was when the dock was last closed
+        if self.session.form_state:
+            self.restore_form_state(self.session.form_state)
+
+        # Report on the exports in the session's queue, including any still running
+        self.session.export_queue.changed.connect(self.update_button_states)
+        self.session.export_queue.jobFinished.connect(self.export_finished)
+        active = self.session.export_queue.active_entries()
+        if active:
+            self.last_export = active[-1]
+            self.labelMessage.setText(f"{len(active)} exports queued or running.")
+
+        self.update_stage_state()
         self.update_button_states()
 
     def set_on_close_callback(self, callback):
@@ -109,6 +204,26 @@ class DataSelectorDockWidget(QDockWidget, FORM_CLASS):
             event: The close event object.
         """
 
+        # Keep the form contents and any running export in the session
+        self.session.form_state = self.save_form_state()
+        self.session.export_queue.changed.disconnect(self.update_button_states)
+        self.session.export_queue.jobFinished.disconnect(self.export_finished)
+        self.validation_timer.stop()
+
+        # The dock is deleted once closed, so stop the background tasks that
+        # would show their results in it. Their callbacks check closed first
+        self.closed = True
+        for task in (self.validation_task, self.plan_task):
+            if task is not None:
+                task.cancel()
+
+        # Close the preview, keeping it (unparented) until its background
+        # tasks have finished so they can release its connection
+        if self.preview_dialog is not None:
+            self.preview_dialog.close()
+            self.preview_dialog.setParent(None)
+            self.preview_dialog = None
+
         # If a callback is set, call it
         if self._on_close_callback:
             self._on_close_callback()
@@ -128,6 +243,9 @@ class DataSelectorDockWidget(QDockWidget, FORM_CLASS):
         # Enable or disable the load button
         self.buttonLoad.setEnabled(not process_running)
 
+        # The cancel button is only enabled while the last export started is queued or running
+        self.buttonCancel.setEnabled(self.last_export is not None and self.last_export.is_active())
+
         # Get the text from the text boxes and the selected table
         columns_text = self.textColumns.toPlainText().strip()
         where_text = self.textWhere.toPlainText().strip()
@@ -166,6 +284,16 @@ class DataSelectorDockWidget(QDockWidget, FORM_CLASS):
             ))
         )
 
+        # Enable or disable the preview button, which needs the same as the run button
+        self.buttonPreview.setEnabled(self.buttonRun.isEnabled())
+
+        # Enable or disable the stage button, which needs a table to copy from
+        self.buttonStage.setEnabled(bool(not process_running and selected_table and not where_text.lower().startswith("from ")))
+
+        # Enable or disable the plan button, which needs the same as the verify button
+        self.buttonPlan.setEnabled(self.plan_task is None and bool(not process_running and columns_text and (
+            selected_table is not None or where_text.lower().startswith("from "))))
+
         # Enable or disable the verify button
         self.buttonVerify.setEnabled(
             bool(not process_running and
@@ -179,8 +307,39 @@ class DataSelectorDockWidget(QDockWidget, FORM_CLASS):
             )
         )
 
+    def save_form_state(self):
+        """Return the form contents and options so they can be restored when the dock is reopened."""
+
+        return {
+            "parts": self.get_query_parts(),
+            "delta": self.checkDelta.isChecked(),
+            "clear_log": self.checkClearLog.isChecked(),
+            "open_log": self.checkOpenLog.isChecked(),
+            "id_filter": self.id_filter,
+            "area_filter": self.area_filter,
+            "parameter_values": self.parameter_values,
+            "query_name": getattr(self, "query_name", ""),
+        }
+
+    def restore_form_state(self, state):
+        """Restore the form contents saved by save_form_state."""
+
+        self.set_query_parts(state["parts"])
+        self.checkDelta.setChecked(state["delta"])
+        self.checkClearLog.setChecked(state["clear_log"])
+        self.checkOpenLog.setChecked(state["open_log"])
+        self.set_id_filter(state["id_filter"])
+        self.set_area_filter(state["area_filter"])
+        self.parameter_values = state["parameter_values"]
+        self.query_name = state["query_name"]
+
     def refresh_tables(self):
-        """Fetch filtered table names from SQL Server and populate dropdown."""
+        """Fetch filtered table names from SQL Server again and populate dropdown."""
+
+        self.load_tables(refresh=True)
+
+    def load_tables(self, refresh=False):
+        """Populate the dropdown with the filtered table names, fetched from SQL Server if not already known."""
 
         # Clear existing items
         self.comboTableName.clear()
@@ -191,14 +350,8 @@ class DataSelectorDockWidget(QDockWidget, FORM_CLASS):
         # Reset to default index
         self.comboTableName.setCurrentIndex(0)
 
-        # Set the wildcard filters, schema, and objects table
-        include_wc = self.config.include_wildcard
-        exclude_wc = self.config.exclude_wildcard
-        schema = self.config.schema
-        objects_table = self.config.objects_table
-
-        # Fetch table names from SQL Server
-        tables = self.db.get_table_names(objects_table, include_wc, exclude_wc, schema)
+        # Fetch table names from SQL Server, or use the session's list
+        tables = self.session.get_tables(refresh)
 
         # Add the tables to the dropdown
         self.comboTableName.addItems(tables)
@@ -221,7 +374,7 @@ class DataSelectorDockWidget(QDockWidget, FORM_CLASS):
             return
 
         # Get the columns from the database
-        columns = self.db.get_columns(selected_table)
+        columns = self.session.get_columns(selected_table)
 
         # Check if any columns are already loaded
         if self.textColumns.toPlainText().strip():
@@ -240,47 +393,73 @@ class DataSelectorDockWidget(QDockWidget, FORM_CLASS):
 
         # write_log(self.log_file, f"Loaded columns for table: {selected_table}")
 
-    def build_query(self):
-        """Assemble the SQL query from UI components."""
+    def get_query_parts(self):
+        """Collect the query parts and options entered in the form."""
+
+        # Set the selected table, if a valid table is selected
+        selected_table = self.comboTableName.currentText().strip()
+        if selected_table == "Select a table":
+            selected_table = ""
+
+        # Get the entered values from the text boxes and combo boxes
+        return {
+            "columns": self.textColumns.toPlainText().strip(),
+            "table": selected_table,
+            "extra_tables": ", ".join(self.extra_tables),
+            "where": self.textWhere.toPlainText().strip(),
+            "group_by": self.textGroupBy.toPlainText().strip(),
+            "order_by": self.textOrderBy.toPlainText().strip(),
+            "format": self.comboOutputFormat.currentText(),
+            "delta_column": self.textDeltaColumn.text().strip() if self.checkDelta.isChecked() else "",
+            "key_column": self.textKeyColumn.text().strip(),
+            "tolerance": self.spinTolerance.value() or "",
+            "parameters": self.textParameters.text().strip(),
+        }
 
-        # Get the entered values from the text boxes and combo box
-        table_name = self.comboTableName.currentText().strip()
-        columns = self.textColumns.toPlainText().strip()
-        where_clause = self.textWhere.toPlainText().strip()
-        group_clause = self.textGroupBy.toPlainText().strip()
-        order_clause = self.textOrderBy.toPlainText().strip()
+    def set_query_parts(self, parts):
+        """Fill in the form from a set of query parts, e.g. read from a .qsf file."""
 
-        # If the table name is empty or the first item is the default
-        # and the user has not selected a table, set it to "TempTable"
-        # to avoid SQL errors
-        if not table_name or table_name == "Select a table":
-            table_name = "TempTable"
+        # Set the text boxes
+        self.textColumns.setPlainText(parts.get("columns", ""))
+        self.textWhere.setPlainText(parts.get("where", ""))
+        self.textGroupBy.setPlainText(parts.get("group_by", ""))
+        self.textOrderBy.setPlainText(parts.get("order_by", ""))
 
-        # Construct the SQL command
-        sql = "SELECT "
-        sql += columns if columns else "*"
+        # Find the table in the combo box and, if found, set it as the current index
+        index = self.comboTableName.findText(parts.get("table", ""))
+        if parts.get("table") and index != -1:
+            self.comboTableName.setCurrentIndex(index)
 
-        if not where_clause:
-            sql += f" FROM {table_name}"
-        elif where_clause[:5].lower() == "from ":
-            sql += f" {where_clause}"
-        else:
-            sql += f" FROM {table_name} WHERE {where_clause}"
+        # Set the other tables to run the query against
+        self.set_extra_tables(get_query_tables(parts)[1:])
 
-        if group_clause:
-            sql += f" GROUP BY {group_clause}"
-        if order_clause:
-            sql += f" ORDER BY {order_clause}"
-        
-        # Return the assembled SQL query
-        return sql
+        # Find the format in the combo box and, if found, set it as the current index
+        index = self.comboOutputFormat.findText(parts.get("format", ""))
+        if parts.get("format") and index != -1:
+            self.comboOutputFormat.setCurrentIndex(index)
 
-    def run_query(self):
-        """Execute SQL query and export results."""
+        # Set the delta options
+        self.checkDelta.setChecked(bool(parts.get("delta_column")))
+        self.textDeltaColumn.setText(parts.get("delta_column", ""))
+        self.textKeyColumn.setText(parts.get("key_column", ""))
 
-        # Validate input parameters
-        if not self.validate_parameters():
-            return
+        # Set the simplification tolerance
+        try:
+            self.spinTolerance.setValue(float(parts.get("tolerance") or 0))
+        except ValueError:
+            self.spinTolerance.setValue(0)
+
+        # Set the parameter declarations
+        self.textParameters.setText(parts.get("parameters", ""))
+
+    def build_query(self):
+        """Assemble the SQL query from UI components."""
+
+        # Return the assembled SQL query
+        return build_query_sql(self.get_query_parts())
+
+    def get_user_id(self):
+        """Return the user name, made safe for use in file names."""
 
         # Replace any illegal characters in the user name string.
         user_id = strip_illegals(getpass.getuser())
@@ -291,12 +470,26 @@ class DataSelectorDockWidget(QDockWidget, FORM_CLASS):
         # If the user ID is empty, set it to "Temp".
         if not user_id:
             user_id = "Temp"
-        
+        return user_id
+
+    def get_log_file(self):
+        """Return the path of the user's log file."""
+        return os.path.join(self.config.log_path, f"DataSelector_{self.get_user_id()}.log")
+
+    def run_query(self):
+        """Execute SQL query and export results."""
+
+        # Validate input parameters
+        if not self.validate_parameters():
+            return
+
         # Set up the log file path and name
-        self.log_file = os.path.join(self.config.log_path, f"DataSelector_{user_id}.log")
+        user_id = self.get_user_id()
+        self.log_file = self.get_log_file()
+        self.session.log_file = self.log_file
 
-        # Clear the log file if the checkbox is checked
-        if self.checkClearLog.isChecked():
+        # Clear the log file if the checkbox is checked, unless other exports are still writing to it
+        if self.checkClearLog.isChecked() and not self.session.export_queue.active_entries():
             if not delete_log_file(self.log_file):
                 QMessageBox.critical(self, "DataSelector", "Cannot delete log file. Please make sure it is not open in another window.")
                 return
@@ -308,30 +501,147 @@ class DataSelectorDockWidget(QDockWidget, FORM_CLASS):
         # Clear the message label
         self.labelMessage.setText("")
 
-        # Set the process status to True
-        self.process_status = True
+        # Results added to the map have no output file, so prompt for the layer name instead.
+        # The export's checkpoint and other sidecar files are kept in the log folder
+        if self.format_translation.get(self.comboOutputFormat.currentText()) == "map":
+            layer_name, ok = QInputDialog.getText(self, "Add to Map", "Layer name:", text=self.comboTableName.currentText().strip())
+            if not ok or not layer_name.strip():
+                return
+            file_path = os.path.join(self.config.log_path, f"{strip_illegals(layer_name.strip())}.map")
+        else:
+            # Prompt user for output file name
+            file_path, _ = QFileDialog.getSaveFileName(self, "Save Output", self.config.extract_path, "All Files (*)")
+            if not file_path:
+                return
+
+        # A zipped shapefile is always written as a .zip
+        if self.format_translation.get(self.comboOutputFormat.currentText()) == "zip" and not file_path.lower().endswith(".zip"):
+            file_path += ".zip"
+
+        # Two exports cannot write to the same file at once
+        if any(entry.job.file_path == file_path for entry in self.session.export_queue.active_entries()):
+            QMessageBox.warning(self, "DataSelector", "An export to this file is already queued or running")
+            return
+
+        # Ask for the values of any query parameters
+        parameters = self.get_parameters(prompt=True)
+        if parameters is None:
+            return
+
+        # Translate display format to internal key
+        format_key = self.format_translation.get(self.comboOutputFormat.currentText(), None)
+
+        # Set the delta options if only changed rows are to be extracted
+        delta = None
+        if self.checkDelta.isChecked():
+            delta = {
+                "column": self.textDeltaColumn.text().strip(),
+                "key": self.textKeyColumn.text().strip(),
+            }
+
+        # Set up the export job for the query and output file, on its own
+        # connection so it can run in the background, or on the local stage
+        if self.use_stage():
+            job_db = LocalStage(self.get_stage_path())
+        else:
+            job_db = SQLServerFunctions(self.config.sql_connection)
+        job = ExportJob(job_db, self.config, self.get_query_parts(), file_path, format_key, self.log_file, delta, self.id_filter, self.area_filter, parameters, user_id)
+
+        # Offer to resume if a previous run of this export was interrupted. Layers
+        # added to the map do not outlast the session, so they are always loaded again
+        resume = False
+        if format_key != "map" and job.has_checkpoint():
+            reply = QMessageBox.question(self, "DataSelector",
+                                         "A previous run of this export was interrupted. Resume from where it stopped?",
+                                         QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+            resume = reply == QMessageBox.Yes
+
+        # Add the export to the queue, which runs it in the background when there is a free slot
+        write_log(self.log_file, f"Exporting as {format_key} to {file_path}")
+        self.last_export = self.session.export_queue.add(job, resume)
+        if self.last_export.status == "Running":
+            self.labelMessage.setText("Export running ...")
+        else:
+            self.labelMessage.setText("Export queued.")
         self.update_button_states()
 
-        # Perform the selectiom
-        success = self.execute_selection()
+    def preview_query(self):
+        """Show the first rows of the query in a preview window, without running the selection."""
+
+        # Validate input parameters
+        if not self.validate_parameters():
+            return
+
+        # Ask for the values of any query parameters
+        parameters = self.get_parameters(prompt=True)
+        if parameters is None:
+            return
+
+        # Add the server-side filters and limit the query to the preview rows,
+        # running it on its own connection or on the local stage
+        if self.use_stage():
+            preview_db = LocalStage(self.get_stage_path())
+            sql = preview_db.build_sql(self.get_filtered_parts(), top=self.config.preview_rows)
+        else:
+            preview_db = SQLServerFunctions(self.config.sql_connection)
+            sql = build_query_sql(self.get_filtered_parts(), top=self.config.preview_rows)
+
+        # Declare the run's parameters, with no run token as nothing has been selected for the preview
+        if not self.use_stage():
+            parameters = self.get_query_parameters(parameters)
+
+        # The IDs are matched against the column's type in the selected table
+        id_filter = dict(self.id_filter, table=self.get_query_parts()["table"]) if self.id_filter else None
+
+        # Close any previous preview and open a new one
+        if self.preview_dialog is not None:
+            self.preview_dialog.close()
+        self.preview_dialog = PreviewDialog(preview_db, sql, parameters, id_filter, self.area_filter,
+                                            self.config.sql_timeout, self)
+        self.preview_dialog.show()
+
+    def cancel_query(self):
+        """
+        Cancel the last export started. A running query is cancelled on the server
+        and the selection cleared; a queued export is removed from the queue.
+        """
+
+        if self.last_export is not None and self.last_export.is_active():
+            write_log(self.log_file, f"Cancelling export to {self.last_export.job.file_path}")
+            self.labelMessage.setText("Cancelling ...")
+            self.buttonCancel.setEnabled(False)
+            self.session.export_queue.cancel(self.last_export)
 
-        # Run the stored procedure to clear the temporary tables
-        if (success or self.selectErrors):
-            self.clear_selection()
+    def show_queue(self):
+        """Show the queue of exports, with their status, timings and row counts."""
 
+        if self.queue_dialog is None or not self.queue_dialog.isVisible():
+            self.queue_dialog = ExportQueueDialog(self.session.export_queue, self)
+        self.queue_dialog.show()
+        self.queue_dialog.raise_()
 
+    def export_finished(self, entry):
+        """Report the result of a background export when it completes, fails or is cancelled."""
 
+        job = entry.job
+        success = entry.status == "Completed"
 
         # Show success message
-        self.labelMessage.setText("Export successful." if success else "Export failed.")
-        write_log(self.log_file, "Export complete" if success else "Export failed")
+        name = os.path.basename(job.file_path)
+        if success and job.skipped:
+            self.labelMessage.setText(f"Export to {name} skipped, the source data is unchanged.")
+        else:
+            self.labelMessage.setText(f"Export to {name} successful." if success else (job.error_message or f"Export to {name} failed."))
+        write_log(self.log_file, f"Export to {job.file_path} complete" if success else f"Export to {job.file_path} failed")
+
+        # A new stage can be used straight away
+        if job.format_key == "stage":
+            self.update_stage_state()
 
         if self.checkOpenLog.isChecked():
             write_log(self.log_file, "Opening log file")
             open_log_file(self.log_file)
 
-        # Set the process status to False
-        self.process_status = False
         self.update_button_states()
 
     def validate_parameters(self):
@@ -353,115 +663,318 @@ class DataSelectorDockWidget(QDockWidget, FORM_CLASS):
             return False
         
         # Output format should always be selected
-        if self.comboOutputFormat.currentIndex() == 0:
+        if self.comboOutputFormat.currentText() not in self.format_translation:
             QMessageBox.warning(self, "DataSelector", "Please select an output format")
             return False
+
+        # The area of interest is intersected with the selected table's geometry
+        if self.area_filter and table_name != self.area_filter["table"]:
+            QMessageBox.warning(self, "DataSelector", "The area of interest was chosen for a different table. Please choose it again")
+            return False
+
+        # Delta extracts need the changed and key columns, and a GeoPackage to merge into
+        if self.checkDelta.isChecked():
+            if not self.textDeltaColumn.text().strip() or not self.textKeyColumn.text().strip():
+                QMessageBox.warning(self, "DataSelector", "Please specify the changed and key columns for a delta extract")
+                return False
+            if self.format_translation.get(self.comboOutputFormat.currentText()) != "gpkg":
+                QMessageBox.warning(self, "DataSelector", "Delta extracts can only be merged into a GeoPackage")
+                return False
         
+        # Other tables are queried with the same columns and where clause
+        if self.extra_tables and where_clause.lower().startswith("from "):
+            QMessageBox.warning(self, "DataSelector", "A FROM clause in the Where box cannot be run against several tables")
+            return False
+
+        # The local stage is queried with SQLite, from the staged table only
+        if self.use_stage():
+            if self.extra_tables:
+                QMessageBox.warning(self, "DataSelector", "Several tables cannot be run against the local stage")
+                return False
+            if where_clause.lower().startswith("from "):
+                QMessageBox.warning(self, "DataSelector", "A FROM clause in the Where box cannot be run against the local stage")
+                return False
+            if self.checkDelta.isChecked():
+                QMessageBox.warning(self, "DataSelector", "Delta extracts cannot be run against the local stage")
+                return False
+
+        # Parameter declarations must be valid
+        try:
+            parse_parameters(self.textParameters.text())
+        except ValueError as e:
+            QMessageBox.warning(self, "DataSelector", str(e))
+            return False
+
         # Clear the message label
         self.labelMessage.setText("")
         return True
 
-    def verify_sql(self):
-        """Validate SQL using SET NOEXEC ON/OFF and structured clause logic."""
+    def get_parameters(self, prompt=False):
+        """
+        Parse the parameter declarations entered for the query. If prompt is
+        True the user is asked for each value, defaulting to the last value
+        entered or the default saved with the query. Returns None if the
+        declarations are invalid or the user cancels.
+        """
+        try:
+            parameters = parse_parameters(self.textParameters.text())
+        except ValueError as e:
+            QMessageBox.warning(self, "DataSelector", str(e))
+            return None
+
+        if not prompt:
+            return parameters
+
+        # Ask for each parameter value in turn
+        for parameter in parameters:
+            default = self.parameter_values.get(parameter["name"].lower(), parameter["value"])
+            value, ok = QInputDialog.getText(self, "Query Parameters",
+                                             f"{parameter['name']} ({parameter['type']}):", text=str(default))
+            if not ok:
+                return None
+            parameter["value"] = value.strip()
+            self.parameter_values[parameter["name"].lower()] = parameter["value"]
+
+        return parameters
+
+    def get_query_parameters(self, parameters):
+        """
+        Return the parameters of a query run on the server, with the run's
+        @Schema, @UserId and @RunId added if they are passed to exports.
+        """
+        if not self.config.run_parameters:
+            return parameters
+        return add_run_parameters(parameters, self.config.schema, self.get_user_id())
 
-        # Build the SQL command
-        sql = self.build_query()
+    def query_changed(self):
+        """Validate the edited query, if live validation is on, and update the prediction."""
 
-        # Validate the SQL command
-        try:
-            # Check if the SQL is valid
-            is_valid, error_msg = self.db.validate_sql(sql, timeout=self.config.sql_timeout)
+        if self.config.validate_sql:
+            self.start_validation()
+        self.update_prediction()
 
-            # Inform the user of the result
-            if is_valid:
-                self.labelMessage.setText("SQL is valid.")
-                return
+    def get_filtered_parts(self):
+        """Return the query parts with the columns used by the ID list and area filters."""
+
+        parts = self.get_query_parts()
+        if self.id_filter:
+            parts["id_column"] = self.id_filter["column"]
+        if self.area_filter:
+            parts["area_column"] = self.area_filter["column"]
+        return parts
 
-            # If the SQL is not valid, show an error message
-            self.labelMessage.setText("SQL is invalid.")
+    def update_prediction(self):
+        """Show the expected run time and output size, based on similar past runs."""
 
-            # Show the error message in a message box
-            QMessageBox.information(self, "DataSelector", f"SQL is invalid:\n{error_msg}")
+        parts = self.get_filtered_parts()
+        if not parts["columns"] or not (parts["table"] or parts["where"].lower().startswith("from ")):
+            self.labelPrediction.setText("")
+            return
+        format_key = self.format_translation.get(parts["format"])
+        prediction = self.session.history.predict(build_query_sql(parts), parts["table"], format_key)
+        self.labelPrediction.setText(format_prediction(prediction))
 
-        except Exception as ex:
-            # Handle any exceptions that occur during validation
+    def show_history(self):
+        """Show the past runs, so a query can be loaded or run again."""
 
-            # Shown an error message
-            message = str(ex).replace("SET NOEXEC ON;", "").replace("SET NOEXEC OFF;", "")
-            self.labelMessage.setText(f"SQL is NOT valid:\n{message}")
+        dialog = HistoryDialog(self.session.history, self)
+        dialog.querySelected.connect(self.history_query_selected)
+        dialog.show()
 
-            # Show the error message in a message box
-            QMessageBox.information(self, f"DataSelector", "SQL is invalid:\n{message}")
+    def history_query_selected(self, parts, run_again):
+        """Load a query chosen from the history into the form, and run it if asked."""
 
-    def execute_selection(self):
+        self.set_query_parts(parts)
+        self.labelMessage.setText("Query loaded from history.")
+        if run_again:
+            self.run_query()
 
-        write_log(self.log_file, "Running selection stored procedure")
+    def verify_sql(self):
+        """Validate the SQL now, without waiting for the delay after the last edit."""
 
-        # Check if the run stored procedure is defined
-        if self.config.select_proc:
-            # Run selection stored procedure first
-            if not self.db.run_procedure(self.config.select_proc):
-                self.labelMessage.setText("Failed to run selection procedure.")
-                write_log(self.log_file, "Failed to run selection stored procedure")
-                return
+        self.validation_timer.stop()
+        self.start_validation()
 
-        # Build and execute the SQL query
-        sql = self.build_query()
-        write_log(self.log_file, f"Executing SQL: {sql}")
-        results = self.db.execute_sql(sql)
-        if not results:
-            self.labelMessage.setText("No data returned or query failed.")
-            write_log(self.log_file, "SQL returned no data or failed")
-            return
+    def get_validation_sql(self):
+        """
+        Return the SQL to validate, declaring any parameters so it compiles as one
+        batch, or None if the query is not complete enough to check. The query
+        joins the ID list and area filters as the export does.
+        Raises ValueError if the parameter declarations are not valid.
+        """
+
+        # Check there are columns and a table (or a FROM clause) to select from
+        where_text = self.textWhere.toPlainText().strip()
+        if not self.textColumns.toPlainText().strip():
+            return None
+        if not self.get_query_parts()["table"] and not where_text.lower().startswith("from "):
+            return None
+
+        return self.get_declarations() + build_query_sql(self.get_filtered_parts())
 
-        # Extract the column names from the SQL Server result set metadata
-        headers = [desc[0] for desc in self.db.connection.cursor().description]
+    def get_declarations(self):
+        """
+        Return a DECLARE statement for the query's parameters, so it compiles
+        as one batch. Raises ValueError if the declarations are not valid.
+        """
+        return build_declarations(self.get_query_parameters(parse_parameters(self.textParameters.text())))
 
-        # Assign the actual query result rows (list of tuples) to 'rows'
-        rows = results
+    def start_validation(self):
+        """
+        Validate the current SQL using SET NOEXEC ON/OFF in a background task.
+        Results already known for the same SQL are shown straight away.
+        """
 
-        # Prompt user for output file name
-        output_format = self.comboOutputFormat.currentText().lower()
-        file_path, _ = QFileDialog.getSaveFileName(self, "Save Output", "", "All Files (*)")
-        if not file_path:
+        # Build the SQL command
+        try:
+            sql = self.get_validation_sql()
+        except ValueError as e:
+            self.show_validation(False, str(e))
+            return
+        if sql is None:
+            self.show_validation(None)
             return
 
-        write_log(self.log_file, f"Exporting as {output_format} to {file_path}")
+        # Use the remembered result if this SQL has been checked before
+        if sql in self.validation_cache:
+            self.show_validation(*self.validation_cache[sql])
+            return
 
-        # Translate display format to internal key
-        format_key = self.format_translation.get(output_format, None)
+        # Only one check runs at a time, so check again when it finishes
+        if self.validation_task is not None:
+            self.validation_pending = True
+            return
 
-        # Dispatch table for output writers
-        writer_map = {
-            "shp": write_shapefile,
-            "csv": write_csv,
-            "txt": write_txt
-        }
+        self.labelValidation.setText("Checking SQL ...")
+        self.labelValidation.setToolTip("")
+        self.validation_task = QgsTask.fromFunction(
+            "DataSelector SQL validation", self._validate_sql, sql,
+            on_finished=self.validation_finished, flags=QgsTask.Silent
+        )
+        QgsApplication.taskManager().addTask(self.validation_task)
+
+    def _validate_sql(self, task, sql):
+        """Validate the SQL in the background task on the validation connection."""
 
-        # Write the output using the appropriate function
-        if format_key in writer_map:
-            success = writer_map[format_key](file_path, headers, rows)
+        with self.validation_lock:
+            is_valid, error_msg = self.validation_db.validate_sql(sql, timeout=self.config.sql_timeout)
+        return sql, is_valid, error_msg
+
+    def validation_finished(self, exception, result=None):
+        """Remember and show the result of a background validation."""
+
+        self.validation_task = None
+        if self.closed:
+            return
+        if exception is not None or not result:
+            self.show_validation(False, str(exception or "Validation failed."))
+            return
+
+        # Only remember syntax and object errors (SQLSTATE class 42), not
+        # connection failures or timeouts which may succeed next time
+        sql, is_valid, error_msg = result
+        if is_valid or (error_msg or "").startswith("('42"):
+            # Forget the oldest result once the cache is full
+            if len(self.validation_cache) >= VALIDATION_CACHE_SIZE:
+                del self.validation_cache[next(iter(self.validation_cache))]
+            self.validation_cache[sql] = (is_valid, error_msg)
+
+        # Check again if the query was edited while this check was running,
+        # otherwise show the result
+        if self.validation_pending:
+            self.validation_pending = False
+            self.start_validation()
         else:
-            success = False
+            self.show_validation(is_valid, error_msg)
 
+    def show_validation(self, is_valid, error_msg=None):
+        """Show the validation result under the query, with the full error as a tooltip."""
 
+        if is_valid is None:
+            self.labelValidation.setText("")
+            self.labelValidation.setToolTip("")
+        elif is_valid:
+            self.labelValidation.setText("SQL is valid.")
+            self.labelValidation.setToolTip("")
+        else:
+            self.labelValidation.setText(f"SQL is invalid: {clean_sql_error(error_msg)}")
+            self.labelValidation.setToolTip(error_msg or "")
 
-        # Show success message
-        self.labelMessage.setText("Export successful." if success else "Export failed.")
-        write_log(self.log_file, "Export complete" if success else "Export failed")
+    def show_plan(self):
+        """
+        Fetch the estimated plan for the query in the background and show its
+        cost, scans, seeks and any missing indexes in the dock and the log.
+        """
 
-    def clear_selection(self):
+        # Build the SQL command, declaring any parameters so it compiles as one batch
+        try:
+            sql = self.get_validation_sql()
+        except ValueError as e:
+            QMessageBox.warning(self, "DataSelector", str(e))
+            return
+        if sql is None:
+            return
 
-        # Set up the SQL command
+        # The filters are uploaded and the order completed on the plan connection,
+        # so the plan is of the query the export runs
+        parts = self.get_filtered_parts()
+        id_filter = dict(self.id_filter, table=parts["table"]) if self.id_filter else None
+
+        # Fetch the plan on a separate connection, as the showplan option
+        # changes how every statement on the connection is run
+        plan_db = SQLServerFunctions(self.config.sql_connection)
+        self.labelMessage.setText("Fetching query plan ...")
+        self.plan_task = QgsTask.fromFunction(
+            "DataSelector query plan", self._get_query_plan, plan_db, self.get_declarations(), parts,
+            id_filter, self.area_filter, on_finished=self.plan_finished, flags=QgsTask.Silent
+        )
+        QgsApplication.taskManager().addTask(self.plan_task)
+        self.update_button_states()
 
+    def _get_query_plan(self, task, plan_db, declarations, parts, id_filter, area_filter):
+        """Build the export's query, and fetch and summarise its plan in the background task."""
 
-        # Check if the clear stored procedure is defined
-        if self.config.clear_proc:
-            write_log(self.log_file, "Deleting temporary tables ...")
-            if not self.db.run_procedure(self.config.clear_proc):
-                self.labelMessage.setText("Error: Deleting the temporary tables.")
-                return
+        try:
+            # Upload the ID list and area of interest to temp tables, before the
+            # showplan option stops statements being run
+            if id_filter:
+                plan_db.upload_id_list(ID_LIST_TABLE, id_filter["values"], id_filter["table"], id_filter["column"])
+            if area_filter:
+                plan_db.upload_area(AREA_TABLE, area_filter["wkb"], area_filter["srid"], area_filter["extent"])
+
+            # Order rows with equal order values by the table's unique key, as the export does
+            if can_add_tiebreaker(parts):
+                parts = dict(parts, tiebreaker=plan_db.get_unique_key(parts["table"]))
+
+            sql = declarations + build_query_sql(parts)
+            plan_xml, error_msg = plan_db.get_query_plan(sql, timeout=self.config.sql_timeout)
+        finally:
+            plan_db.reset_connection()
+        if plan_xml is None:
+            raise RuntimeError(error_msg)
+        return sql, format_query_plan(parse_query_plan(plan_xml))
+
+    def plan_finished(self, exception, result=None):
+        """Show the plan summary in the dock and write it to the log."""
+
+        self.plan_task = None
+        if self.closed:
+            return
+        self.update_button_states()
+        if exception is not None or not result:
+            self.labelMessage.setText(f"Cannot get the query plan: {clean_sql_error(str(exception))}")
+            return
+
+        sql, lines = result
+        self.textPlan.setPlainText("\n".join(lines))
+        self.textPlan.setVisible(True)
+        self.labelMessage.setText("Query plan shown.")
 
+        # Write the plan summary to the log
+        log_file = self.get_log_file()
+        write_log(log_file, f"Query plan for: {sql}")
+        for line in lines:
+            write_log(log_file, line)
 
     def save_query(self):
         """Save the current query parts to a .qsf file."""
@@ -510,30 +1023,8 @@ class DataSelectorDockWidget(QDockWidget, FORM_CLASS):
             # Save the query name for future saves
             self.query_name = os.path.basename(file_path)
 
-            # Set the selected table in the combo box
-            selected_table = self.comboTableName.currentText()
-            if selected_table and selected_table == "Select a table":
-                # No valid table selected
-                selected_table = None
-
-            # Set the selected output format in the combo box
-            if self.comboOutputFormat.currentIndex() > 0:
-                selected_format = self.comboOutputFormat.currentText()
-
-            # Save the query to the file
-            with open(file_path, "w", encoding="utf-8") as f:
-                
-                # Define a helper function to format lines
-                def format_line(label, value):
-                    return f"{label} {{{value.strip().replace('\n', ' ')}}}"
-
-                # Write each part of the query to the file
-                f.write(format_line("Fields", self.textColumns.toPlainText()) + "\n")
-                f.write(format_line("From", selected_table or "") + "\n")
-                f.write(format_line("Where", self.textWhere.toPlainText()) + "\n")
-                f.write(format_line("Group By", self.textGroupBy.toPlainText()) + "\n")
-                f.write(format_line("Order By", self.textOrderBy.toPlainText()) + "\n")
-                f.write(format_line("Format", selected_format or "") + "\n")
+            # Save the query parts to the file
+            write_query_file(file_path, self.get_query_parts())
 
             self.labelMessage.setText("Query saved.")
             return True
@@ -575,52 +1066,27 @@ class DataSelectorDockWidget(QDockWidget, FORM_CLASS):
         if not selected_file:
             return False
     
-        # Clear the form
-        self.textColumns.clear()
-        self.textWhere.clear()
-        self.textGroupBy.clear()
-        self.textOrderBy.clear()
+        # Read and parse the .qsf file, then fill in the form
+        return self.load_query_file(selected_file)
 
-        # Set query name from file (for future saves, if applicable)
-        self.query_name = os.path.splitext(os.path.basename(selected_file))[0]
-
-        # Read and parse the .qsf file
-        with open(selected_file, "r") as f:
-
-            # Read each line and process it
-            for line in f:
-                # Strip whitespace and check for empty lines
-                line = line.strip()
-                if not line:
-                    continue
-
-                if line.upper().startswith("FIELDS {") and line.upper() != "FIELDS {}":
-                    value = line[8:-1]  # strip 'FIELDS {' and '}'
-                    self.textColumns.setPlainText(value.replace("$$", "\n"))
-                elif line.upper().startswith("FROM {") and line.upper() != "FROM {}":
-                    value = line[6:-1]  # strip 'FROM {' and '}'
-                    # Find the index of the table in the combo box
-                    index = self.comboTableName.findText(value)
-                    # If found, set it as the current index
-                    if index != -1:
-                        self.comboTableName.setCurrentIndex(index)
-                elif line.upper().startswith("WHERE {") and line.upper() != "WHERE {}":
-                    value = line[7:-1]  # strip 'WHERE {' and '}'
-                    self.textWhere.setPlainText(value.replace("$$", "\n"))
-                elif line.upper().startswith("GROUP BY {") and line.upper() != "GROUP BY {}":
-                    value = line[10:-1]  # strip 'GROUP BY {' and '}'
-                    self.textGroupBy.setPlainText(value.replace("$$", "\n"))
-                elif line.upper().startswith("ORDER BY {") and line.upper() != "ORDER BY {}":
-                    value = line[10:-1]  # strip 'ORDER BY {' and '}'
-                    self.textOrderBy.setPlainText(value.replace("$$", "\n"))
-                elif line.upper().startswith("FORMAT {") and line.upper() != "FORMAT {}":
-                    value = line[8:-1]  # strip 'FORMAT {' and '}'
-                    # Find the index of the format in the combo box
-                    index = self.comboOutputFormat.findText(value)
-                    # If found, set it as the current index
-                    if index != -1:
-                        self.comboOutputFormat.setCurrentIndex(index)
+    def show_library(self):
+        """Search the saved queries in the query folder and load one."""
+
+        dialog = LibraryDialog(self.session.library, self)
+        dialog.querySelected.connect(self.load_query_file)
+        dialog.show()
+
+    def load_query_file(self, file_path):
+        """Load a saved .qsf query file into the form."""
+
+        try:
+            self.set_query_parts(read_query_file(file_path))
+        except Exception as e:
+            QMessageBox.critical(self, "DataSelector", f"Error loading file: {str(e)}")
+            return False
 
+        # Set query name from file (for future saves, if applicable)
+        self.query_name = os.path.splitext(os.path.basename(file_path))[0]
         self.labelMessage.setText("Query loaded.")
         return True
 
@@ -633,6 +1099,22 @@ class DataSelectorDockWidget(QDockWidget, FORM_CLASS):
         self.textGroupBy.clear()
         self.textOrderBy.clear()
 
+        # Clear the delta and simplification options
+        self.checkDelta.setChecked(False)
+        self.textDeltaColumn.clear()
+        self.textKeyColumn.clear()
+        self.spinTolerance.setValue(0)
+        self.textParameters.clear()
+
+        # Clear and hide the query plan
+        self.textPlan.clear()
+        self.textPlan.setVisible(False)
+
+        # Clear the ID list and area of interest filters, and the other tables
+        self.set_id_filter(None)
+        self.set_area_filter(None)
+        self.set_extra_tables([])
+
         # Clear the saved/loaded query name
         self.query_name = ""
 
@@ -648,3 +1130,237 @@ class DataSelectorDockWidget(QDockWidget, FORM_CLASS):
 
             # Set tooltip for the Columns text box
             self.textColumns.setToolTip("Double-click to populate with list of columns from the selected table")
+
+    def get_stage_path(self):
+        """Return the path of the user's local stage database."""
+        return get_stage_path(self.config.stage_path, self.get_user_id())
+
+    def use_stage(self):
+        """Check if the query is to be run against the local stage."""
+        return self.checkUseStage.isEnabled() and self.checkUseStage.isChecked()
+
+    def update_stage_state(self):
+        """Allow the local stage to be used if the selected table has been staged, and describe it."""
+
+        stage = LocalStage(self.get_stage_path()).get_stage(self.comboTableName.currentText())
+        self.checkUseStage.setEnabled(stage is not None)
+        if stage is None:
+            self.checkUseStage.setChecked(False)
+            self.labelStage.setText("")
+            self.labelStage.setToolTip("")
+            return
+        self.labelStage.setText(f"{stage['rows']:,} rows staged {stage['staged_at'].replace('T', ' ')}")
+        self.labelStage.setToolTip(stage["source_sql"] or "")
+
+    def stage_selection(self):
+        """
+        Copy all the columns of the selected table's rows matching the Where box
+        (and the ID list and area filters) to the local stage, in the background.
+        The Where, Group By and Order By can then be refined against the stage.
+        """
+
+        table_name = self.comboTableName.currentText()
+        if not table_name or table_name == "Select a table":
+            QMessageBox.warning(self, "DataSelector", "Please select a table to stage")
+            return
+
+        # Ask for the values of any query parameters used in the Where box
+        parameters = self.get_parameters(prompt=True)
+        if parameters is None:
+            return
+
+        # Stage every column, with the geometry as WKB
+        columns = list(self.session.get_columns(table_name))
+        geometry_column = self.db.get_geometry_column(table_name)
+        if geometry_column:
+            columns.append(f"[{geometry_column}]")
+        if not columns:
+            QMessageBox.warning(self, "DataSelector", f"Cannot find the columns of {table_name}")
+            return
+        parts = {
+            "table": table_name,
+            "columns": ", ".join(columns),
+            "where": self.textWhere.toPlainText().strip(),
+            "group_by": "",
+            "order_by": "",
+            "tolerance": self.get_query_parts().get("tolerance"),
+            "parameters": self.textParameters.text().strip(),
+        }
+
+        # Run the selection into the stage through the export queue
+        self.log_file = self.get_log_file()
+        self.session.log_file = self.log_file
+        stage_path = self.get_stage_path()
+        if any(entry.job.file_path == stage_path for entry in self.session.export_queue.active_entries()):
+            QMessageBox.warning(self, "DataSelector", "A selection is already being staged")
+            return
+        job_db = SQLServerFunctions(self.config.sql_connection)
+        job = ExportJob(job_db, self.config, parts, stage_path, "stage", self.log_file, None, self.id_filter, self.area_filter, parameters, self.get_user_id())
+        write_log(self.log_file, f"Staging {table_name} to {stage_path}")
+        self.last_export = self.session.export_queue.add(job)
+        self.labelMessage.setText("Staging ..." if self.last_export.status == "Running" else "Staging queued.")
+        self.update_button_states()
+
+    def choose_extra_tables(self):
+        """Choose other tables to run the same query against, exporting their rows into the same output."""
+
+        selected_table = self.comboTableName.currentText()
+        tables = [table_name for table_name in self.session.get_tables() if table_name != selected_table]
+        dialog = TableSelectDialog(tables, self.extra_tables, self)
+        if dialog.exec_():
+            self.set_extra_tables(dialog.selected_tables())
+
+    def set_extra_tables(self, tables):
+        """Set (or clear) the other tables to run the query against and show how many there are."""
+
+        self.extra_tables = list(tables)
+        if self.extra_tables:
+            self.labelMoreTables.setText(f"+ {len(self.extra_tables)} tables")
+            self.labelMoreTables.setToolTip("\n".join(self.extra_tables))
+        else:
+            self.labelMoreTables.setText("")
+            self.labelMoreTables.setToolTip("")
+        self.validation_timer.start()
+
+    def choose_id_filter(self):
+        """
+        Load a list of IDs from a text file or a layer field to filter the query by.
+        The IDs are uploaded to a temp table when the query is run.
+        """
+
+        # Ask where the IDs come from
+        sources = ["Text or CSV file", "Layer field"]
+        if self.id_filter:
+            sources.append("Clear the list filter")
+        source, ok = QInputDialog.getItem(self, "Filter by List", "Load the IDs from:", sources, 0, False)
+        if not ok:
+            return
+
+        if source == "Clear the list filter":
+            self.set_id_filter(None)
+            return
+
+        values = []
+        default_column = ""
+        if source == "Layer field":
+            # Choose a vector layer in the project
+            layers = [layer for layer in QgsProject.instance().mapLayers().values() if isinstance(layer, QgsVectorLayer)]
+            if not layers:
+                QMessageBox.warning(self, "DataSelector", "There are no vector layers in the project")
+                return
+            layer_name, ok = QInputDialog.getItem(self, "Filter by List", "Layer:", [layer.name() for layer in layers], 0, False)
+            if not ok:
+                return
+            layer = layers[[layer.name() for layer in layers].index(layer_name)]
+
+            # Choose the field holding the IDs
+            field_name, ok = QInputDialog.getItem(self, "Filter by List", "Field:", layer.fields().names(), 0, False)
+            if not ok:
+                return
+            # Leave out NULLs, which are returned as invalid QVariants rather than None
+            values = [value for value in layer.uniqueValues(layer.fields().indexOf(field_name))
+                      if value is not None and not (isinstance(value, QVariant) and value.isNull())]
+            default_column = field_name
+        else:
+            # Choose the file holding the IDs
+            file_path, _ = QFileDialog.getOpenFileName(self, "Load ID List", self.config.query_path, "Text Files (*.txt *.csv);;All Files (*)")
+            if not file_path:
+                return
+            try:
+                values = read_id_file(file_path)
+            except Exception as e:
+                QMessageBox.critical(self, "DataSelector", f"Error reading file: {str(e)}")
+                return
+
+        if not values:
+            QMessageBox.warning(self, "DataSelector", "No IDs were found")
+            return
+
+        # Ask which column in the query the IDs should match
+        column, ok = QInputDialog.getText(self, "Filter by List", "Column to match the IDs against:", text=default_column)
+        if not ok or not column.strip():
+            return
+
+        self.set_id_filter({"column": column.strip(), "values": values})
+
+    def set_id_filter(self, id_filter):
+        """Set (or clear) the ID list filter and show a summary of it."""
+
+        self.id_filter = id_filter
+        if id_filter:
+            self.labelIdFilter.setText(f"{len(id_filter['values'])} IDs on {id_filter['column']}")
+        else:
+            self.labelIdFilter.setText("")
+
+    def choose_area_filter(self):
+        """
+        Choose a vector layer whose features are used as an area of interest.
+        The geometries are uploaded to a temp table with a spatial index when the
+        query is run, so the spatial selection is done on the server.
+        """
+
+        # Ask which layer to use, or clear the current area
+        layers = [layer for layer in QgsProject.instance().mapLayers().values()
+                  if isinstance(layer, QgsVectorLayer) and layer.isSpatial()]
+        names = [layer.name() for layer in layers]
+        if self.area_filter:
+            names.append("Clear the area of interest")
+        if not names:
+            QMessageBox.warning(self, "DataSelector", "There are no spatial layers in the project")
+            return
+        layer_name, ok = QInputDialog.getItem(self, "Area of Interest", "Layer:", names, 0, False)
+        if not ok:
+            return
+        if layer_name == "Clear the area of interest":
+            self.set_area_filter(None)
+            return
+        layer = layers[names.index(layer_name)]
+
+        # Find the geometry column and SRID of the selected table
+        table_name = self.comboTableName.currentText()
+        if not table_name or table_name == "Select a table":
+            QMessageBox.warning(self, "DataSelector", "Please select a table to query from")
+            return
+        geometry_column = self.db.get_geometry_column(table_name)
+        srid = self.db.get_srid(table_name, geometry_column) if geometry_column else None
+        if not geometry_column or not srid:
+            QMessageBox.warning(self, "DataSelector", f"Cannot find the geometry column or SRID of {table_name}")
+            return
+
+        # Use only the selected features if there are any
+        features = layer.getSelectedFeatures() if layer.selectedFeatureCount() else layer.getFeatures()
+
+        # Transform the geometries to the table's coordinate system and convert them to WKB
+        transform = QgsCoordinateTransform(layer.crs(), QgsCoordinateReferenceSystem(f"EPSG:{srid}"), QgsProject.instance())
+        wkb_geometries = []
+        extent = QgsRectangle()
+        extent.setMinimal()
+        for feat in features:
+            if not feat.hasGeometry():
+                continue
+            geom = QgsGeometry(feat.geometry())
+            geom.transform(transform)
+            wkb_geometries.append(bytes(geom.asWkb()))
+            extent.combineExtentWith(geom.boundingBox())
+
+        if not wkb_geometries:
+            QMessageBox.warning(self, "DataSelector", f"There are no features in {layer.name()}")
+            return
+
+        self.set_area_filter({
+            "layer": layer.name(),
+            "table": table_name,
+            "column": f"{table_name}.[{geometry_column}]",
+            "srid": srid,
+            "wkb": wkb_geometries,
+            "extent": (extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum()),
+        })
+
+    def set_area_filter(self, area_filter):
+        """Set (or clear) the area of interest filter and show a summary of it."""
+
+        self.area_filter = area_filter
+        if area_filter:
+            self.labelAreaFilter.setText(f"{len(area_filter['wkb'])} features from {area_filter['layer']}")
+        else:
+            self.labelAreaFilter.setText("")
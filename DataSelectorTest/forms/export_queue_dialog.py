@@ -0,0 +1,125 @@
+import os
+import time
+
+from qgis.PyQt.QtCore import QTimer
+from qgis.PyQt.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem, QPushButton, QAbstractItemView, QHeaderView
+
+# Columns shown for each job in the queue
+QUEUE_COLUMNS = ["Output", "Priority", "Status", "Rows", "Queued", "Duration"]
+
+def format_duration(seconds):
+    """Format a number of seconds as h:mm:ss."""
+    if seconds is None:
+        return ""
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+class ExportQueueDialog(QDialog):
+    """
+    Show the queued, running and finished exports with their status, timings
+    and row counts. Waiting jobs can be moved up or down the queue, and any
+    job that has not finished can be cancelled.
+    """
+
+    def __init__(self, queue, parent=None):
+        super().__init__(parent)
+        self.queue = queue
+
+        # Set up the dialog
+        self.setWindowTitle("DataSelector Export Queue")
+        self.resize(700, 300)
+        layout = QVBoxLayout(self)
+        self.tableJobs = QTableWidget(0, len(QUEUE_COLUMNS))
+        self.tableJobs.setHorizontalHeaderLabels(QUEUE_COLUMNS)
+        self.tableJobs.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.tableJobs.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.tableJobs.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.tableJobs.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.tableJobs.verticalHeader().setVisible(False)
+        layout.addWidget(self.tableJobs)
+
+        # Add the buttons
+        buttons = QHBoxLayout()
+        self.buttonRaise = QPushButton("Raise Priority")
+        self.buttonLower = QPushButton("Lower Priority")
+        self.buttonCancelJob = QPushButton("Cancel Job")
+        self.buttonClearFinished = QPushButton("Clear Finished")
+        self.buttonClose = QPushButton("Close")
+        for button in (self.buttonRaise, self.buttonLower, self.buttonCancelJob, self.buttonClearFinished):
+            buttons.addWidget(button)
+        buttons.addStretch()
+        buttons.addWidget(self.buttonClose)
+        layout.addLayout(buttons)
+
+        # Connect the signals
+        self.buttonRaise.clicked.connect(lambda: self.change_priority(1))
+        self.buttonLower.clicked.connect(lambda: self.change_priority(-1))
+        self.buttonCancelJob.clicked.connect(self.cancel_job)
+        self.buttonClearFinished.clicked.connect(self.queue.clear_finished)
+        self.buttonClose.clicked.connect(self.close)
+        self.tableJobs.itemSelectionChanged.connect(self.update_button_states)
+        self.queue.changed.connect(self.refresh)
+
+        # Update the row counts and durations of the running jobs every second
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(1000)
+
+        self.refresh()
+
+    def refresh(self):
+        """Fill the table from the queue, keeping the selected job selected."""
+        selected = self.selected_entry()
+        self.tableJobs.setRowCount(len(self.queue.entries))
+        for row, entry in enumerate(self.queue.entries):
+            values = [
+                os.path.basename(entry.job.file_path),
+                str(entry.priority),
+                entry.status if entry.status != "Failed" else f"Failed: {entry.job.error_message or ''}",
+                str(entry.job.rows_written),
+                time.strftime("%H:%M:%S", time.localtime(entry.queued)),
+                format_duration(entry.duration()),
+            ]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                item.setToolTip(entry.job.file_path if column == 0 else value)
+                self.tableJobs.setItem(row, column, item)
+            if entry is selected:
+                self.tableJobs.selectRow(row)
+        self.update_button_states()
+
+    def selected_entry(self):
+        """Return the job selected in the table, or None."""
+        rows = self.tableJobs.selectionModel().selectedRows()
+        if not rows or rows[0].row() >= len(self.queue.entries):
+            return None
+        return self.queue.entries[rows[0].row()]
+
+    def update_button_states(self):
+        """Enable the buttons that apply to the selected job."""
+        entry = self.selected_entry()
+        waiting = entry is not None and entry.status == "Queued"
+        self.buttonRaise.setEnabled(waiting)
+        self.buttonLower.setEnabled(waiting)
+        self.buttonCancelJob.setEnabled(entry is not None and entry.is_active())
+        self.buttonClearFinished.setEnabled(len(self.queue.active_entries()) < len(self.queue.entries))
+
+    def change_priority(self, change):
+        """Move the selected waiting job up or down the queue."""
+        entry = self.selected_entry()
+        if entry is not None:
+            self.queue.set_priority(entry, entry.priority + change)
+
+    def cancel_job(self):
+        """Cancel the selected job."""
+        entry = self.selected_entry()
+        if entry is not None:
+            self.queue.cancel(entry)
+
+    def closeEvent(self, event):
+        """Stop updating the table when the dialog is closed."""
+        self.timer.stop()
+        self.queue.changed.disconnect(self.refresh)
+        event.accept()
@@ -0,0 +1,96 @@
+import json
+
+from qgis.PyQt.QtCore import pyqtSignal
+from qgis.PyQt.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem, QPushButton, QAbstractItemView, QHeaderView
+
+from ..history_functions import format_size
+from .export_queue_dialog import format_duration
+
+# Columns shown for each past run
+HISTORY_COLUMNS = ["When", "Table", "Format", "Status", "Rows", "Size", "Duration", "Output"]
+
+
+class HistoryDialog(QDialog):
+    """
+    Show the history of past exports, newest first, so a past query can be
+    loaded back into the form or run again.
+    """
+
+    # Emitted with the query parts of the chosen run, and whether to run it straight away
+    querySelected = pyqtSignal(dict, bool)
+
+    def __init__(self, history, parent=None):
+        super().__init__(parent)
+        self.runs = history.recent()
+
+        # Set up the dialog
+        self.setWindowTitle("DataSelector Query History")
+        self.resize(800, 400)
+        layout = QVBoxLayout(self)
+        self.tableRuns = QTableWidget(len(self.runs), len(HISTORY_COLUMNS))
+        self.tableRuns.setHorizontalHeaderLabels(HISTORY_COLUMNS)
+        self.tableRuns.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.tableRuns.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.tableRuns.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.tableRuns.horizontalHeader().setSectionResizeMode(len(HISTORY_COLUMNS) - 1, QHeaderView.Stretch)
+        self.tableRuns.verticalHeader().setVisible(False)
+        layout.addWidget(self.tableRuns)
+
+        # Fill the table, with the SQL as a tooltip
+        for row, run in enumerate(self.runs):
+            values = [
+                (run["run_at"] or "").replace("T", " "),
+                run["table_name"] or "",
+                run["format"] or "",
+                run["status"] or "",
+                f"{run['rows'] or 0:,}",
+                format_size(run["bytes"]) if run["bytes"] is not None else "",
+                format_duration(run["seconds"]),
+                run["output"] or "",
+            ]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                item.setToolTip(run["sql"] or "")
+                self.tableRuns.setItem(row, column, item)
+
+        # Add the buttons
+        buttons = QHBoxLayout()
+        self.buttonLoad = QPushButton("Load")
+        self.buttonRunAgain = QPushButton("Run Again")
+        self.buttonClose = QPushButton("Close")
+        buttons.addWidget(self.buttonLoad)
+        buttons.addWidget(self.buttonRunAgain)
+        buttons.addStretch()
+        buttons.addWidget(self.buttonClose)
+        layout.addLayout(buttons)
+
+        # Connect the signals
+        self.buttonLoad.clicked.connect(lambda: self.select_run(False))
+        self.buttonRunAgain.clicked.connect(lambda: self.select_run(True))
+        self.buttonClose.clicked.connect(self.close)
+        self.tableRuns.itemSelectionChanged.connect(self.update_button_states)
+        self.tableRuns.doubleClicked.connect(lambda index: self.select_run(False))
+        self.update_button_states()
+
+    def selected_run(self):
+        """Return the run selected in the table, or None."""
+        rows = self.tableRuns.selectionModel().selectedRows()
+        return self.runs[rows[0].row()] if rows else None
+
+    def update_button_states(self):
+        """Enable the buttons if a run is selected."""
+        selected = self.selected_run() is not None
+        self.buttonLoad.setEnabled(selected)
+        self.buttonRunAgain.setEnabled(selected)
+
+    def select_run(self, run_again):
+        """Send the selected run's query parts to the dock and close."""
+        run = self.selected_run()
+        if run is None:
+            return
+        try:
+            parts = json.loads(run["parts"] or "{}")
+        except ValueError:
+            return
+        self.close()
+        self.querySelected.emit(parts, run_again)
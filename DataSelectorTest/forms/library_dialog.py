@@ -0,0 +1,129 @@
+import os
+
+from qgis.PyQt.QtCore import pyqtSignal
+from qgis.PyQt.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QTableWidget, QTableWidgetItem, QPushButton, QAbstractItemView, QHeaderView
+from qgis.core import QgsApplication, QgsTask
+
+# Columns shown for each query found
+LIBRARY_COLUMNS = ["Name", "Table", "Fields", "Folder"]
+
+
+class LibraryDialog(QDialog):
+    """
+    Search the saved .qsf queries by name, table, fields or where text. The
+    results come from the library index straight away, and the index is
+    brought up to date with the query folder in the background.
+    """
+
+    # Emitted with the path of the query chosen
+    querySelected = pyqtSignal(str)
+
+    def __init__(self, library, parent=None):
+        super().__init__(parent)
+        self.library = library
+        self.results = []
+        self.update_task = None
+
+        # Set up the dialog
+        self.setWindowTitle("DataSelector Query Library")
+        self.resize(800, 450)
+        layout = QVBoxLayout(self)
+        self.textSearch = QLineEdit()
+        self.textSearch.setPlaceholderText("Search by name, table, column or where text")
+        layout.addWidget(self.textSearch)
+        self.tableQueries = QTableWidget(0, len(LIBRARY_COLUMNS))
+        self.tableQueries.setHorizontalHeaderLabels(LIBRARY_COLUMNS)
+        self.tableQueries.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.tableQueries.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.tableQueries.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.tableQueries.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
+        self.tableQueries.verticalHeader().setVisible(False)
+        layout.addWidget(self.tableQueries)
+
+        # Add the status and the buttons
+        buttons = QHBoxLayout()
+        self.labelStatus = QLabel("")
+        self.buttonLoad = QPushButton("Load")
+        self.buttonClose = QPushButton("Close")
+        buttons.addWidget(self.labelStatus)
+        buttons.addStretch()
+        buttons.addWidget(self.buttonLoad)
+        buttons.addWidget(self.buttonClose)
+        layout.addLayout(buttons)
+
+        # Connect the signals
+        self.textSearch.textChanged.connect(self.search)
+        self.buttonLoad.clicked.connect(self.select_query)
+        self.buttonClose.clicked.connect(self.close)
+        self.tableQueries.itemSelectionChanged.connect(self.update_button_states)
+        self.tableQueries.doubleClicked.connect(lambda index: self.select_query())
+
+        # Show what is already indexed, then update the index in the background
+        self.search()
+        self.labelStatus.setText("Updating the index ...")
+        self.update_task = QgsTask.fromFunction(
+            "DataSelector query library", self._update_index,
+            on_finished=self.index_updated, flags=QgsTask.Silent
+        )
+        QgsApplication.taskManager().addTask(self.update_task)
+
+    def _update_index(self, task):
+        """Update the index in the background task."""
+        return self.library.update(task.isCanceled)
+
+    def index_updated(self, exception, result=None):
+        """Search again once the index is up to date."""
+        self.update_task = None
+        if exception is not None:
+            self.labelStatus.setText(f"Cannot update the index: {exception}")
+            return
+        self.search()
+
+    def search(self):
+        """Show the queries matching the search text."""
+        self.results = self.library.search(self.textSearch.text())
+        self.tableQueries.setRowCount(len(self.results))
+        for row, query in enumerate(self.results):
+            values = [
+                query["name"],
+                query["table_name"] or "",
+                (query["fields"] or "").replace("\n", " "),
+                self.get_folder(query["path"]),
+            ]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                item.setToolTip(query["where_text"] or query["path"])
+                self.tableQueries.setItem(row, column, item)
+        if self.update_task is None:
+            self.labelStatus.setText(f"{len(self.results)} of {self.library.count()} queries.")
+        self.update_button_states()
+
+    def get_folder(self, path):
+        """Return the folder of a query relative to the query folder."""
+        try:
+            return os.path.relpath(os.path.dirname(path), self.library.query_path)
+        except ValueError:
+            return os.path.dirname(path)
+
+    def selected_query(self):
+        """Return the query selected in the table, or None."""
+        rows = self.tableQueries.selectionModel().selectedRows()
+        return self.results[rows[0].row()] if rows else None
+
+    def update_button_states(self):
+        """Enable the load button if a query is selected."""
+        self.buttonLoad.setEnabled(self.selected_query() is not None)
+
+    def select_query(self):
+        """Send the selected query's path to the dock and close."""
+        query = self.selected_query()
+        if query is None:
+            return
+        self.close()
+        self.querySelected.emit(query["path"])
+
+    def closeEvent(self, event):
+        """Stop updating the index when the dialog is closed."""
+        if self.update_task is not None:
+            self.update_task.cancel()
+        event.accept()
@@ -0,0 +1,199 @@
+from qgis.PyQt.QtCore import Qt, QAbstractTableModel, QModelIndex, pyqtSignal
+from qgis.PyQt.QtWidgets import QDialog, QVBoxLayout, QLabel, QTableView, QDialogButtonBox
+from qgis.core import QgsApplication, QgsTask, QgsMessageLog, Qgis
+
+from ..query_functions import ID_LIST_TABLE, AREA_TABLE
+from ..string_functions import clean_sql_error
+
+# Number of rows fetched from the open cursor each time the view reaches the end
+PREVIEW_PAGE_SIZE = 100
+
+def format_preview_value(value):
+    """Format a value from the result set for display in the preview."""
+    if value is None:
+        return "NULL"
+    if isinstance(value, (bytes, bytearray)):
+        return f"<{len(value)} bytes>"
+    return str(value)
+
+
+class QueryResultModel(QAbstractTableModel):
+    """
+    Table model over an open query cursor. Rows are fetched a page at a time
+    in a background task when the view scrolls to the end, so only the rows
+    that are looked at are transferred from the server.
+    """
+
+    # Emitted after each page is added, or when the fetch fails
+    rowsLoaded = pyqtSignal()
+
+    def __init__(self, cursor, parent=None):
+        super().__init__(parent)
+        self.cursor = cursor
+        self.headers = [desc[0] for desc in cursor.description]
+        self.rows = []
+        self.finished = False
+        self.fetch_task = None
+        self.error_message = None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.ToolTipRole):
+            return None
+        return format_preview_value(self.rows[index.row()][index.column()])
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.headers[section]
+        return section + 1
+
+    def canFetchMore(self, parent=QModelIndex()):
+        # Only one page is fetched at a time
+        return not parent.isValid() and not self.finished and self.fetch_task is None
+
+    def fetchMore(self, parent=QModelIndex()):
+        """Fetch the next page of rows in the background."""
+        if not self.canFetchMore(parent):
+            return
+        self.fetch_task = QgsTask.fromFunction(
+            "DataSelector preview", self._fetch_page,
+            on_finished=self._page_fetched, flags=QgsTask.Silent
+        )
+        QgsApplication.taskManager().addTask(self.fetch_task)
+
+    def _fetch_page(self, task):
+        """Fetch a page of rows from the cursor. Runs in the background task."""
+        return self.cursor.fetchmany(PREVIEW_PAGE_SIZE)
+
+    def _page_fetched(self, exception, rows=None):
+        """Add the fetched page to the model."""
+        self.fetch_task = None
+        if exception is not None:
+            self.error_message = str(exception)
+            self.close()
+            self.rowsLoaded.emit()
+            return
+
+        # Insert the new rows at the end
+        rows = rows or []
+        if rows:
+            first = len(self.rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+            self.rows.extend(rows)
+            self.endInsertRows()
+
+        # A short page means there are no more rows
+        if len(rows) < PREVIEW_PAGE_SIZE:
+            self.close()
+        self.rowsLoaded.emit()
+
+    def close(self):
+        """Stop fetching and close the cursor."""
+        self.finished = True
+        try:
+            self.cursor.close()
+        except Exception:
+            pass
+
+
+class PreviewDialog(QDialog):
+    """
+    Show the first rows of a query without running the selection or writing
+    an output. The query is run with TOP on its own connection in a background
+    task and the rows are shown as they are fetched.
+    """
+
+    def __init__(self, db, sql, parameters=None, id_filter=None, area_filter=None, timeout=0, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.sql = sql
+        self.parameters = parameters or []
+        self.id_filter = id_filter
+        self.area_filter = area_filter
+        self.timeout = timeout
+        self.model = None
+        self.closed = False
+
+        # Set up the dialog
+        self.setWindowTitle("DataSelector Preview")
+        self.resize(800, 500)
+        layout = QVBoxLayout(self)
+        self.labelStatus = QLabel("Running query ...")
+        self.labelStatus.setWordWrap(True)
+        layout.addWidget(self.labelStatus)
+        self.tableView = QTableView()
+        layout.addWidget(self.tableView)
+        buttons = QDialogButtonBox(QDialogButtonBox.Close)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+        # Run the query in the background
+        self.query_task = QgsTask.fromFunction(
+            "DataSelector preview query", self._open_cursor,
+            on_finished=self._cursor_opened, flags=QgsTask.Silent
+        )
+        QgsApplication.taskManager().addTask(self.query_task)
+
+    def _open_cursor(self, task):
+        """Upload any filters and execute the query. Runs in the background task."""
+
+        # Upload the ID list and area of interest to temp tables on this connection
+        if self.id_filter:
+            self.db.upload_id_list(ID_LIST_TABLE, self.id_filter["values"], self.id_filter.get("table"), self.id_filter["column"])
+        if self.area_filter:
+            _, index_error = self.db.upload_area(AREA_TABLE, self.area_filter["wkb"], self.area_filter["srid"], self.area_filter["extent"])
+            if index_error:
+                QgsMessageLog.logMessage(f"[Spatial Index Error] {index_error}", "DataSelector", Qgis.Warning)
+
+        return self.db.open_cursor(self.sql, None, self.timeout, self.parameters)
+
+    def _cursor_opened(self, exception, cursor=None):
+        """Show the rows once the query has been executed."""
+        self.query_task = None
+        if self.closed:
+            self.db.reset_connection()
+            return
+        if exception is not None:
+            self.labelStatus.setText(f"Preview failed: {clean_sql_error(str(exception))}")
+            self.labelStatus.setToolTip(str(exception))
+            return
+
+        # The view asks the model for more rows as it is scrolled
+        self.model = QueryResultModel(cursor, self)
+        self.model.rowsLoaded.connect(self.update_status)
+        self.tableView.setModel(self.model)
+
+    def update_status(self):
+        """Show how many rows have been loaded."""
+
+        # Release the connection once the page being fetched when the dialog was closed arrives
+        if self.closed:
+            self.model.close()
+            self.db.reset_connection()
+            return
+
+        if self.model.error_message:
+            self.labelStatus.setText(f"Preview failed: {clean_sql_error(self.model.error_message)}")
+            return
+        rows = len(self.model.rows)
+        if self.model.finished:
+            self.labelStatus.setText(f"{rows} rows.")
+        else:
+            self.labelStatus.setText(f"First {rows} rows. Scroll down to load more.")
+
+    def done(self, result):
+        """Cancel the query and release the connection when the dialog is closed."""
+        self.closed = True
+        self.db.cancel()
+        if self.query_task is None and (self.model is None or self.model.fetch_task is None):
+            if self.model is not None:
+                self.model.close()
+            self.db.reset_connection()
+        super().done(result)
@@ -0,0 +1,51 @@
+from qgis.PyQt.QtCore import Qt
+from qgis.PyQt.QtWidgets import QDialog, QVBoxLayout, QLabel, QLineEdit, QListWidget, QListWidgetItem, QDialogButtonBox
+
+
+class TableSelectDialog(QDialog):
+    """
+    Choose other tables to run the same query against, so their rows are
+    exported together with the selected table's into one output.
+    """
+
+    def __init__(self, tables, selected=None, parent=None):
+        super().__init__(parent)
+        selected = set(selected or [])
+
+        # Set up the dialog
+        self.setWindowTitle("DataSelector Tables")
+        self.resize(400, 450)
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel("Also export the same columns from these tables:"))
+        self.textFilter = QLineEdit()
+        self.textFilter.setPlaceholderText("Filter the tables")
+        layout.addWidget(self.textFilter)
+
+        # List the tables with a check box each
+        self.listTables = QListWidget()
+        for table_name in tables:
+            item = QListWidgetItem(table_name)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Checked if table_name in selected else Qt.Unchecked)
+            self.listTables.addItem(item)
+        layout.addWidget(self.listTables)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+        # Connect the signals
+        self.textFilter.textChanged.connect(self.filter_tables)
+
+    def filter_tables(self, text):
+        """Show only the tables whose names contain the filter text."""
+        text = text.lower()
+        for row in range(self.listTables.count()):
+            item = self.listTables.item(row)
+            item.setHidden(text not in item.text().lower())
+
+    def selected_tables(self):
+        """Return the checked tables, in the order they are listed."""
+        return [self.listTables.item(row).text() for row in range(self.listTables.count())
+                if self.listTables.item(row).checkState() == Qt.Checked]
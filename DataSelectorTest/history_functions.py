@@ -0,0 +1,126 @@
+import json
+import re
+import sqlite3
+import statistics
+from datetime import datetime
+
+# Number of past runs used to predict the next one
+PREDICTION_RUNS = 5
+
+# --- history_functions.py ---
+def normalise_sql(sql):
+    """
+    Normalise a query so runs of the same query with different literal values
+    match: string and number literals are replaced with ?, bracketed names are
+    unbracketed, whitespace is collapsed and the text is lower-cased.
+    """
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql or "")
+    sql = re.sub(r"(?<![\w@#])\d+(?:\.\d+)?\b", "?", sql)
+    sql = re.sub(r"\[(\w+)\]", r"\1", sql)
+    return re.sub(r"\s+", " ", sql).strip().lower()
+
+
+class QueryHistory:
+    """
+    A local SQLite history of export runs: the query, output format, timings of
+    each stage, rows and bytes written. Used to predict how long a query will
+    take and how big its output will be, and to run past queries again.
+    A connection is opened for each call so it can be used from any thread.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS runs ("
+                    " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                    " run_at TEXT, sql TEXT, normalised_sql TEXT, table_name TEXT,"
+                    " format TEXT, parts TEXT, output TEXT, status TEXT,"
+                    " rows INTEGER, bytes INTEGER, seconds REAL, timings TEXT)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS runs_sql ON runs (normalised_sql)")
+                conn.execute("CREATE INDEX IF NOT EXISTS runs_table ON runs (table_name, format)")
+        except sqlite3.Error as e:
+            print(f"[History Error] Could not open {db_path}: {e}")
+
+    def _connect(self):
+        """Open a connection to the history database."""
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def record(self, sql, parts, format_key, output, status, rows, output_bytes, timings):
+        """Record a finished run."""
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT INTO runs (run_at, sql, normalised_sql, table_name, format, parts, output,"
+                    " status, rows, bytes, seconds, timings) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        datetime.now().isoformat(timespec="seconds"), sql, normalise_sql(sql),
+                        (parts.get("table") or "").lower(), format_key, json.dumps(parts), output,
+                        status, rows, output_bytes, sum(timings.values()), json.dumps(timings),
+                    )
+                )
+            return True
+        except sqlite3.Error as e:
+            print(f"[History Error] {e}")
+            return False
+
+    def predict(self, sql, table_name, format_key):
+        """
+        Predict the duration, rows and bytes of a run from the median of the
+        last completed runs of the same query, or of other queries on the same
+        table in the same format if the query has not been run before.
+        Returns a dictionary, or None if there are no similar runs.
+        """
+        searches = [
+            ("the same query", "normalised_sql = ? AND format = ?", (normalise_sql(sql), format_key)),
+            ("queries on this table", "table_name = ? AND format = ?", ((table_name or "").lower(), format_key)),
+        ]
+        try:
+            with self._connect() as conn:
+                for basis, where, params in searches:
+                    runs = conn.execute(
+                        f"SELECT seconds, rows, bytes FROM runs WHERE status = 'Completed' AND {where}"
+                        " ORDER BY id DESC LIMIT ?",
+                        params + (PREDICTION_RUNS,)
+                    ).fetchall()
+                    if runs:
+                        return {
+                            "basis": basis,
+                            "runs": len(runs),
+                            "seconds": statistics.median(run["seconds"] or 0 for run in runs),
+                            "rows": statistics.median(run["rows"] or 0 for run in runs),
+                            "bytes": statistics.median(run["bytes"] or 0 for run in runs),
+                        }
+        except sqlite3.Error as e:
+            print(f"[History Error] {e}")
+        return None
+
+    def recent(self, limit=200):
+        """Return the most recent runs, newest first, as dictionaries."""
+        try:
+            with self._connect() as conn:
+                rows = conn.execute("SELECT * FROM runs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+            return [dict(row) for row in rows]
+        except sqlite3.Error as e:
+            print(f"[History Error] {e}")
+            return []
+
+def format_size(size):
+    """Format a number of bytes as a readable size."""
+    for unit in ("bytes", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "bytes" else f"{size:.1f} {unit}"
+        size /= 1024
+
+def format_prediction(prediction):
+    """Format a prediction from QueryHistory.predict for the dock."""
+    if not prediction:
+        return "No similar runs to predict from."
+    minutes, seconds = divmod(int(round(prediction["seconds"])), 60)
+    duration = f"{minutes}m {seconds}s" if minutes else f"{seconds}s"
+    return (f"Expected about {duration}, {int(prediction['rows']):,} rows, {format_size(prediction['bytes'])}"
+            f" (from {prediction['runs']} runs of {prediction['basis']}).")
@@ -0,0 +1,166 @@
+import os
+import re
+import sqlite3
+
+from .query_functions import read_query_file
+
+# Maximum number of queries returned by a search
+SEARCH_LIMIT = 500
+
+# --- library_functions.py ---
+def build_match_expression(text):
+    """
+    Turn the words typed in the search box into an FTS5 query that matches
+    queries containing every word, each as a prefix (e.g. 'spp coun' finds
+    'Spp_Poly_Names' with 'County').
+    """
+    words = re.findall(r"\w+", text or "")
+    return " ".join(f'"{word}"*' for word in words)
+
+
+class QueryLibrary:
+    """
+    A local SQLite index of the .qsf files under the query folder, holding the
+    parsed table, fields and where text of each one so queries can be found
+    with a full-text search instead of browsing the folder. The index is
+    updated incrementally: only files whose modified time or size has changed
+    are read again. A connection is opened for each call so it can be used
+    from a background task.
+    """
+
+    def __init__(self, index_path, query_path):
+        self.index_path = index_path
+        self.query_path = query_path
+        self.full_text = True
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS queries ("
+                    " path TEXT PRIMARY KEY, name TEXT, mtime REAL, size INTEGER,"
+                    " table_name TEXT, fields TEXT, where_text TEXT)"
+                )
+
+                # Use an FTS5 table for the search if SQLite was built with it
+                try:
+                    conn.execute(
+                        "CREATE VIRTUAL TABLE IF NOT EXISTS queries_fts USING fts5("
+                        "path UNINDEXED, name, table_name, fields, where_text)"
+                    )
+                except sqlite3.OperationalError:
+                    self.full_text = False
+        except sqlite3.Error as e:
+            print(f"[Library Error] Could not open {index_path}: {e}")
+
+    def _connect(self):
+        """Open a connection to the index database."""
+        conn = sqlite3.connect(self.index_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def update(self, is_cancelled=None):
+        """
+        Bring the index up to date with the .qsf files under the query folder.
+        Returns the numbers of files added or changed, and removed.
+        """
+        if not self.query_path or not os.path.isdir(self.query_path):
+            return 0, 0
+
+        try:
+            with self._connect() as conn:
+                indexed = {row["path"]: (row["mtime"], row["size"])
+                           for row in conn.execute("SELECT path, mtime, size FROM queries")}
+                found = set()
+                changed = 0
+
+                # Walk the folder, using the directory entries' cached stat where possible
+                folders = [self.query_path]
+                while folders:
+                    if is_cancelled and is_cancelled():
+                        break
+                    try:
+                        entries = list(os.scandir(folders.pop()))
+                    except OSError as e:
+                        print(f"[Library Error] {e}")
+                        continue
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            folders.append(entry.path)
+                            continue
+                        if not entry.name.lower().endswith(".qsf"):
+                            continue
+                        found.add(entry.path)
+                        stat = entry.stat()
+                        if indexed.get(entry.path) == (stat.st_mtime, stat.st_size):
+                            continue
+
+                        # Parse the new or changed file and replace its entry
+                        try:
+                            parts = read_query_file(entry.path)
+                        except OSError as e:
+                            print(f"[Library Error] {e}")
+                            continue
+                        self._remove(conn, entry.path)
+                        values = (entry.path, os.path.splitext(entry.name)[0], stat.st_mtime, stat.st_size,
+                                  parts["table"], parts["columns"], parts["where"])
+                        conn.execute("INSERT INTO queries VALUES (?, ?, ?, ?, ?, ?, ?)", values)
+                        if self.full_text:
+                            conn.execute("INSERT INTO queries_fts VALUES (?, ?, ?, ?, ?)", values[:2] + values[4:])
+                        changed += 1
+
+                # Remove the files that have gone, unless the walk was cut short
+                removed = 0
+                if not (is_cancelled and is_cancelled()):
+                    for path in set(indexed) - found:
+                        self._remove(conn, path)
+                        removed += 1
+
+            return changed, removed
+
+        except sqlite3.Error as e:
+            print(f"[Library Error] {e}")
+            return 0, 0
+
+    def _remove(self, conn, path):
+        """Remove a file from the index."""
+        conn.execute("DELETE FROM queries WHERE path = ?", (path,))
+        if self.full_text:
+            conn.execute("DELETE FROM queries_fts WHERE path = ?", (path,))
+
+    def search(self, text=""):
+        """
+        Return the indexed queries matching every word of the search text in
+        their name, table, fields or where text, best matches first. All
+        queries are returned, by name, if the text is empty.
+        """
+        match = build_match_expression(text)
+        try:
+            with self._connect() as conn:
+                if not match:
+                    rows = conn.execute("SELECT * FROM queries ORDER BY name LIMIT ?", (SEARCH_LIMIT,))
+                elif self.full_text:
+                    rows = conn.execute(
+                        "SELECT q.* FROM queries_fts f JOIN queries q ON q.path = f.path"
+                        " WHERE queries_fts MATCH ? ORDER BY f.rank LIMIT ?",
+                        (match, SEARCH_LIMIT)
+                    )
+                else:
+                    # Without full-text search, match each word anywhere in the text
+                    words = re.findall(r"\w+", text)
+                    condition = " AND ".join(["(name || ' ' || table_name || ' ' || fields || ' ' || where_text) LIKE ?"] * len(words))
+                    rows = conn.execute(
+                        f"SELECT * FROM queries WHERE {condition} ORDER BY name LIMIT ?",
+                        [f"%{word}%" for word in words] + [SEARCH_LIMIT]
+                    )
+                return [dict(row) for row in rows]
+
+        except sqlite3.Error as e:
+            print(f"[Library Error] {e}")
+            return []
+
+    def count(self):
+        """Return the number of indexed queries."""
+        try:
+            with self._connect() as conn:
+                return conn.execute("SELECT COUNT(*) FROM queries").fetchone()[0]
+        except sqlite3.Error:
+            return 0
@@ -0,0 +1,125 @@
+import os
+
+from qgis.PyQt.QtCore import QObject, pyqtSignal
+from qgis.core import QgsApplication, QgsProject, QgsRectangle, QgsVectorLayer, QgsWkbTypes
+
+from .file_functions import get_output_fields, rows_to_features, split_features_by_type, GEOMETRY_OUTPUT_TYPES
+
+# Memory layer geometry type names used for each geometry family
+MEMORY_LAYER_TYPES = {
+    QgsWkbTypes.PointGeometry: "MultiPoint",
+    QgsWkbTypes.LineGeometry: "MultiLineString",
+    QgsWkbTypes.PolygonGeometry: "MultiPolygon",
+    None: "None",
+}
+
+# --- map_functions.py ---
+class MapLayerLoader(QObject):
+    """
+    Add the features of an 'add to map' export to memory layers in the project
+    as each batch arrives. The features are built on the export's thread and
+    sent here with a signal, so the layers are only changed on the main thread
+    while the map is drawn. There is one layer for each geometry type, each
+    with a spatial index that is kept up to date as features are added.
+    """
+
+    # Emitted from the export's thread with a geometry type and its features
+    featuresReady = pyqtSignal(object, object)
+
+    # Emitted from the export's thread when the export starts again from the first row
+    clearRequested = pyqtSignal()
+
+    def __init__(self, layer_name, fields, crs_authid, has_geometry=True, style_path=None):
+        super().__init__()
+        self.layer_name = layer_name
+        self.fields = fields
+        self.crs_authid = crs_authid
+        self.has_geometry = has_geometry
+        self.style_path = style_path
+        self.layers = {}
+
+        # Live on the main thread so the features are added there
+        self.moveToThread(QgsApplication.instance().thread())
+        self.featuresReady.connect(self.add_features)
+        self.clearRequested.connect(self.clear_features)
+
+    def _get_layer(self, geom_type):
+        """Return the layer for a geometry type, creating it and adding it to the project if needed."""
+        if geom_type in self.layers:
+            return self.layers[geom_type]
+
+        # Name further layers after their geometry type, as for the file outputs
+        name = self.layer_name
+        if self.layers and geom_type in GEOMETRY_OUTPUT_TYPES:
+            name += "_" + GEOMETRY_OUTPUT_TYPES[geom_type][0]
+        layer = QgsVectorLayer(f"{MEMORY_LAYER_TYPES[geom_type]}?crs={self.crs_authid}", name, "memory")
+        provider = layer.dataProvider()
+        provider.addAttributes(self.fields.toList())
+        layer.updateFields()
+
+        # Create the spatial index before any features are added, so it is built as they load
+        if geom_type is not None:
+            provider.createSpatialIndex()
+
+        # Apply the default style
+        if self.style_path and os.path.isfile(self.style_path):
+            layer.loadNamedStyle(self.style_path)
+
+        QgsProject.instance().addMapLayer(layer)
+        self.layers[geom_type] = layer
+        return layer
+
+    def add_features(self, geom_type, features):
+        """Add a batch of features to the layer for their geometry type and redraw it."""
+
+        # Features without a geometry go in the first layer, or a polygon layer, as for the file outputs
+        if geom_type is None and self.has_geometry:
+            geom_type = next(iter(self.layers), QgsWkbTypes.PolygonGeometry)
+
+        layer = self._get_layer(geom_type)
+        layer.dataProvider().addFeatures(features)
+        layer.updateExtents()
+        layer.triggerRepaint()
+
+    def clear_features(self):
+        """Delete the features added so far from the layers."""
+        for layer in self.layers.values():
+            layer.dataProvider().truncate()
+            layer.updateExtents()
+            layer.triggerRepaint()
+
+
+class MapLayerWriter:
+    """
+    Stream rows to memory layers in the project instead of a file, so the
+    results appear on the map as they are exported.
+    """
+
+    def __init__(self, loader, headers):
+        self.loader = loader
+        self.fields, self.geom_index = get_output_fields(headers)
+
+        # The extent of the geometries sent to the map, measured as the features are built
+        self.extent = QgsRectangle()
+        self.extent.setMinimal()
+
+    def write_rows(self, rows):
+        """Convert a batch of rows to features and send them to the map, grouped by geometry type."""
+        features = rows_to_features(rows, self.fields, self.geom_index, self.extent)
+        if self.geom_index < 0:
+            self.loader.featuresReady.emit(None, features)
+            return
+        for geom_type, group in split_features_by_type(features).items():
+            self.loader.featuresReady.emit(geom_type, group)
+
+    def flush(self):
+        """Features are sent to the map as each batch is written."""
+        return None
+
+    def close(self):
+        """The layers stay in the project."""
+        return None
+
+    def output_names(self):
+        """Return the names of the layers added to the map."""
+        return [layer.name() for layer in self.loader.layers.values()]
@@ -0,0 +1,95 @@
+import xml.etree.ElementTree as ET
+
+# XML namespace of SQL Server showplan documents
+SHOWPLAN_NS = {"sp": "http://schemas.microsoft.com/sqlserver/2004/07/showplan"}
+
+# --- plan_functions.py ---
+def _float(value):
+    """Convert a plan attribute to a float, or None if it is missing."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _object_name(element):
+    """Return the [schema].[table].[index] name of the object a plan operator reads."""
+    obj = element.find(".//sp:Object", SHOWPLAN_NS)
+    if obj is None:
+        return ""
+    parts = [obj.get("Schema"), obj.get("Table"), obj.get("Index")]
+    return ".".join(part for part in parts if part)
+
+def parse_query_plan(plan_xml):
+    """
+    Summarise an estimated plan returned by SET SHOWPLAN_XML ON.
+    Returns a dictionary with the estimated cost and rows of the statement,
+    the scan and seek operators (with the object read, estimated rows and
+    subtree cost) and any missing index suggestions.
+    """
+    root = ET.fromstring(plan_xml)
+    summary = {"cost": None, "rows": None, "scans": [], "seeks": [], "missing_indexes": []}
+
+    # Use the costliest statement in the batch, e.g. the SELECT after any DECLAREs
+    for statement in root.iterfind(".//sp:StmtSimple", SHOWPLAN_NS):
+        cost = _float(statement.get("StatementSubTreeCost"))
+        if cost is not None and (summary["cost"] is None or cost > summary["cost"]):
+            summary["cost"] = cost
+            summary["rows"] = _float(statement.get("StatementEstRows"))
+
+    # Collect the scan and seek operators
+    for rel_op in root.iterfind(".//sp:RelOp", SHOWPLAN_NS):
+        physical_op = rel_op.get("PhysicalOp", "")
+        operator = {
+            "operator": physical_op,
+            "object": _object_name(rel_op),
+            "rows": _float(rel_op.get("EstimateRows")),
+            "cost": _float(rel_op.get("EstimatedTotalSubtreeCost")),
+        }
+        if "Scan" in physical_op:
+            summary["scans"].append(operator)
+        elif "Seek" in physical_op:
+            summary["seeks"].append(operator)
+
+    # Collect the missing index suggestions, by columns used for equality,
+    # inequality and included columns
+    for group in root.iterfind(".//sp:MissingIndexGroup", SHOWPLAN_NS):
+        for index in group.iterfind("sp:MissingIndex", SHOWPLAN_NS):
+            columns = {"EQUALITY": [], "INEQUALITY": [], "INCLUDE": []}
+            for column_group in index.iterfind("sp:ColumnGroup", SHOWPLAN_NS):
+                names = [column.get("Name") for column in column_group.iterfind("sp:Column", SHOWPLAN_NS)]
+                columns.setdefault(column_group.get("Usage", ""), []).extend(names)
+            summary["missing_indexes"].append({
+                "impact": _float(group.get("Impact")),
+                "table": ".".join(part for part in (index.get("Schema"), index.get("Table")) if part),
+                "equality": columns["EQUALITY"],
+                "inequality": columns["INEQUALITY"],
+                "include": columns["INCLUDE"],
+            })
+
+    return summary
+
+def format_missing_index(missing_index):
+    """Return a CREATE INDEX statement for a missing index suggestion."""
+    key_columns = ", ".join(missing_index["equality"] + missing_index["inequality"])
+    sql = f"CREATE INDEX <name> ON {missing_index['table']} ({key_columns})"
+    if missing_index["include"]:
+        sql += f" INCLUDE ({', '.join(missing_index['include'])})"
+    return sql
+
+def format_query_plan(summary):
+    """Format a plan summary from parse_query_plan as lines of text for the dock and the log."""
+    def number(value):
+        return "?" if value is None else f"{value:,.0f}" if value >= 100 else f"{value:.3g}"
+
+    lines = [f"Estimated cost {number(summary['cost'])}, estimated rows {number(summary['rows'])}"]
+
+    # List the scans first as they are the usual cause of slow queries
+    for label, operators in (("Scan", summary["scans"]), ("Seek", summary["seeks"])):
+        for op in sorted(operators, key=lambda o: o["cost"] or 0, reverse=True):
+            lines.append(f"{label}: {op['operator']} on {op['object'] or '?'}"
+                         f" ({number(op['rows'])} rows, cost {number(op['cost'])})")
+
+    for missing_index in summary["missing_indexes"]:
+        lines.append(f"Missing index (impact {number(missing_index['impact'])}%): {format_missing_index(missing_index)}")
+
+    return lines
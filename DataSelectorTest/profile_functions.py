@@ -0,0 +1,101 @@
+import cProfile
+import io
+import os
+import pstats
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+# Number of stack frames kept for each allocation traced
+TRACE_FRAMES = 5
+
+# Held while a run is profiled, as only one profile can be active at a time
+_profile_lock = threading.Lock()
+
+# --- profile_functions.py ---
+def get_profile_path(log_file, fallback_folder):
+    """
+    Return the path, without an extension, of the profile files for a run:
+    next to the log file, named after it and the time the run started.
+    """
+    if log_file:
+        base = os.path.splitext(log_file)[0]
+    else:
+        base = os.path.join(fallback_folder or ".", "DataSelector")
+    return f"{base}_{datetime.now():%Y%m%d_%H%M%S}"
+
+
+@contextmanager
+def profile_run(base_path, top_allocations=25, log=print):
+    """
+    Profile the code run inside the block with cProfile, and trace its memory
+    allocations with tracemalloc. Writes the profile to base_path.prof (open it
+    with pstats or snakeviz) and a report of the functions taking the most time
+    and the lines allocating the most memory to base_path.txt.
+    Only one run is profiled at a time: if another profile is active the block
+    runs unprofiled. Progress and errors are passed to log, and never raised.
+    """
+    # cProfile and tracemalloc are process-wide, so a second run cannot be profiled alongside
+    if not _profile_lock.acquire(blocking=False):
+        log("Another export is being profiled, so this run will not be profiled")
+        yield
+        return
+
+    try:
+        profiler = cProfile.Profile()
+        started_tracing = False
+        try:
+            # Another tool may already be tracing allocations, in which case leave it running
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start(TRACE_FRAMES)
+            before = tracemalloc.take_snapshot()
+            profiler.enable()
+        except (RuntimeError, ValueError) as e:
+            # e.g. another profiler is already active on Python 3.12+
+            if started_tracing:
+                tracemalloc.stop()
+            log(f"Could not start profiling, so this run will not be profiled: {e}")
+            yield
+            return
+
+        try:
+            yield
+        finally:
+            profiler.disable()
+            try:
+                after = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+                profiler.dump_stats(base_path + ".prof")
+                with open(base_path + ".txt", "w", encoding="utf-8") as f:
+                    f.write(format_profile_report(profiler, before, after, peak, top_allocations))
+                log(f"Profile written to {base_path}.prof and {base_path}.txt")
+            except Exception as e:
+                log(f"Could not write the profile to {base_path}: {e}")
+            finally:
+                if started_tracing:
+                    tracemalloc.stop()
+    finally:
+        _profile_lock.release()
+
+
+def format_profile_report(profiler, before, after, peak, top_allocations=25):
+    """Format the slowest functions and the top allocations of a profiled run as text."""
+    stream = io.StringIO()
+
+    # The functions taking the most time, including the functions they call
+    stream.write("Functions by cumulative time\n")
+    stream.write("============================\n")
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top_allocations)
+
+    # The lines allocating the most memory during the run
+    stream.write("Top allocations\n")
+    stream.write("===============\n")
+    stream.write(f"Peak traced memory: {peak / 1024 / 1024:.1f} MB\n\n")
+    for diff in after.compare_to(before, "traceback")[:top_allocations]:
+        stream.write(f"{diff.size_diff / 1024:+.1f} KB in {diff.count_diff:+d} blocks\n")
+        for line in diff.traceback.format():
+            stream.write(f"    {line}\n")
+    return stream.getvalue()
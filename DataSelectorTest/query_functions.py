@@ -0,0 +1,401 @@
+import re
+
+from .string_functions import split_columns, find_keyword
+
+# Names of the geometry columns in the spatial tables
+GEOMETRY_COLUMNS = ("shape", "sp_geometry")
+
+# Labels used for each query part in a .qsf file, in the order they are written
+QUERY_FILE_LABELS = [
+    ("columns", "Fields"),
+    ("table", "From"),
+    ("extra_tables", "Also From"),
+    ("where", "Where"),
+    ("group_by", "Group By"),
+    ("order_by", "Order By"),
+    ("format", "Format"),
+    ("delta_column", "Delta Column"),
+    ("key_column", "Key Column"),
+    ("tolerance", "Tolerance"),
+    ("parameters", "Parameters"),
+]
+
+# Query parts that can span several lines in the form
+MULTILINE_PARTS = ("columns", "where", "group_by", "order_by")
+
+# Column added to the rows of a query on several tables, naming the table each row came from
+SOURCE_TABLE_COLUMN = "SourceTable"
+
+# Session temp table holding an uploaded list of IDs to filter by
+ID_LIST_TABLE = "#DataSelectorIds"
+
+# Session temp table holding uploaded area of interest geometries
+AREA_TABLE = "#DataSelectorArea"
+
+# Parameters passed to the query, as well as the stored procedures, if PassRunParameters is set
+RUN_PARAMETERS = (("@Schema", "NVARCHAR(128)"), ("@UserId", "NVARCHAR(128)"), ("@RunId", "NVARCHAR(32)"))
+
+# --- query_functions.py ---
+def format_tolerance(tolerance):
+    """Format a simplification tolerance for SQL without an exponent."""
+    return format(float(tolerance), "f").rstrip("0").rstrip(".")
+
+def convert_geometry_columns(columns, tolerance=None):
+    """
+    Convert the geometry column in the selected columns to WKB so it can be
+    written to vector outputs. If a tolerance is given the geometry is also
+    generalised on the server with Reduce() before it is transferred.
+    Only plain column names are converted, anything else is left as entered.
+    """
+    converted = []
+    for column in split_columns(columns):
+        match = re.fullmatch(r"((?:[\w\[\]]+\.)*)\[?(\w+)\]?", column)
+        if match and match.group(2).lower() in GEOMETRY_COLUMNS:
+            expression = f"{match.group(1)}[{match.group(2)}]"
+            if tolerance and float(tolerance) > 0:
+                expression += f".Reduce({format_tolerance(tolerance)})"
+            column = f"{expression}.STAsBinary() AS [{match.group(2)}]"
+        converted.append(column)
+    return ", ".join(converted)
+
+def split_select_modifier(columns):
+    """
+    Split a leading DISTINCT (or ALL) off the selected columns, so TOP and
+    added columns can be placed after it. Returns (modifier, columns) where
+    the modifier is empty or ends with a space.
+    """
+    match = re.match(r"(distinct|all)\s+", columns, re.IGNORECASE)
+    if not match:
+        return "", columns
+    return match.group(1).upper() + " ", columns[match.end():]
+
+def get_filter_predicates(parts):
+    """
+    Return the extra predicates added to the WHERE clause for server-side
+    filters, such as an uploaded list of IDs.
+    """
+    predicates = []
+
+    # Join against the uploaded ID list rather than a giant IN (...) list
+    if parts.get("id_column"):
+        predicates.append(f"{parts['id_column']} IN (SELECT Id FROM {ID_LIST_TABLE})")
+
+    # Intersect against the uploaded area of interest. The area column has a
+    # different name so the geometry column resolves to the queried table
+    if parts.get("area_column"):
+        predicates.append(
+            f"EXISTS (SELECT 1 FROM {AREA_TABLE} WHERE AreaShape.STIntersects({parts['area_column']}) = 1)"
+        )
+
+    return predicates
+
+def add_predicates(where_clause, predicates):
+    """
+    Add predicates to a WHERE clause (or to a 'FROM ...' clause entered in the
+    Where box), keeping the original conditions together in brackets.
+    """
+    if not predicates:
+        return where_clause
+    extra = " AND ".join(predicates)
+
+    # A full FROM clause may or may not already have its own WHERE, and may end
+    # with a GROUP BY, HAVING or ORDER BY, which is kept after the predicates
+    if where_clause[:5].lower() == "from ":
+        positions = [find_keyword(where_clause, keyword) for keyword in ("group", "having", "order")]
+        tail_pos = min([pos for pos in positions if pos != -1], default=len(where_clause))
+        clause, tail = where_clause[:tail_pos].rstrip(), where_clause[tail_pos:]
+        tail = f" {tail}" if tail else ""
+
+        where_pos = find_keyword(clause, "where")
+        if where_pos == -1:
+            return f"{clause} WHERE {extra}{tail}"
+        conditions = clause[where_pos + 5:].strip()
+        return f"{clause[:where_pos]}WHERE ({conditions}) AND {extra}{tail}"
+
+    # Otherwise the Where box holds just the conditions
+    if where_clause:
+        return f"({where_clause}) AND {extra}"
+    return extra
+
+def build_query_sql(parts, include_order=True, top=None):
+    """
+    Assemble a SQL SELECT statement from the query parts entered in the form.
+    The parts are a dictionary with the keys 'columns', 'table', 'where',
+    'group_by', 'order_by' and optionally 'tolerance', 'id_column',
+    'area_column' and 'tiebreaker' (unique key columns ending the order). The
+    ORDER BY clause can be left off so the statement can be wrapped as a
+    derived table, and the rows can be limited with TOP for a preview.
+    """
+
+    # Combine the same query on several tables into one result
+    tables = get_query_tables(parts)
+    if len(tables) > 1:
+        return build_union_sql(parts, tables, include_order, top)
+
+    # Get the query parts, defaulting to empty strings
+    table_name = (parts.get("table") or "").strip()
+    columns = (parts.get("columns") or "").strip()
+    where_clause = (parts.get("where") or "").strip()
+    group_clause = (parts.get("group_by") or "").strip()
+    order_clause = (parts.get("order_by") or "").strip()
+
+    # If the table name is empty or the first item is the default
+    # and the user has not selected a table, set it to "TempTable"
+    # to avoid SQL errors
+    if not table_name or table_name == "Select a table":
+        table_name = "TempTable"
+
+    # Add any server-side filters to the where clause
+    where_clause = add_predicates(where_clause, get_filter_predicates(parts))
+
+    # Transfer the geometry as WKB, generalised if a tolerance is set
+    modifier, columns = split_select_modifier(columns)
+    if columns:
+        columns = convert_geometry_columns(columns, parts.get("tolerance"))
+
+    # Construct the SQL command, with TOP after any DISTINCT
+    sql = "SELECT " + modifier
+    if top:
+        sql += f"TOP ({int(top)}) "
+    sql += columns if columns else "*"
+
+    if not where_clause:
+        sql += f" FROM {table_name}"
+    elif where_clause[:5].lower() == "from ":
+        sql += f" {where_clause}"
+    else:
+        sql += f" FROM {table_name} WHERE {where_clause}"
+
+    if group_clause:
+        sql += f" GROUP BY {group_clause}"
+    if order_clause and include_order:
+        sql += f" ORDER BY {order_clause}"
+
+        # Order rows with equal order values by a unique key, so the order is
+        # repeatable. Columns already in the order cannot be listed again
+        ordered = [key[0].lower() for key in map(get_order_key, split_columns(order_clause)) if key]
+        tiebreaker = [column for column in parts.get("tiebreaker") or [] if column.lower() not in ordered]
+        if tiebreaker:
+            sql += ", " + ", ".join(f"[{column}]" for column in tiebreaker)
+
+    # Return the assembled SQL query
+    return sql
+
+def get_query_tables(parts):
+    """
+    Return the tables the query is run on: the selected table followed by any
+    other tables chosen to be exported with it.
+    """
+    tables = [(parts.get("table") or "").strip()]
+    for table_name in re.split(r"[,\s]+", parts.get("extra_tables") or ""):
+        if table_name and table_name not in tables:
+            tables.append(table_name)
+    return tables
+
+def reads_other_tables(parts):
+    """
+    Check if any part of the query may read tables other than those returned
+    by get_query_tables, i.e. if it contains a FROM clause or subquery.
+    """
+    return any(
+        re.search(r"\b(from|select)\b", parts.get(name) or "", re.IGNORECASE)
+        for name in MULTILINE_PARTS
+    )
+
+def build_union_sql(parts, tables, include_order=True, top=None):
+    """
+    Run the same columns and where clause against each table and combine the
+    rows with UNION ALL, adding a column naming the table each row came from.
+    The tables are read in one query on one connection, so the rows stream
+    into a single output.
+    """
+    selects = []
+    for table_name in tables:
+        table_parts = dict(parts, table=table_name, extra_tables="", order_by="")
+
+        # Qualify the area of interest column with this table instead of the selected one
+        if parts.get("area_column"):
+            column = parts["area_column"]
+            if column.startswith(parts["table"] + "."):
+                column = table_name + column[len(parts["table"]):]
+            table_parts["area_column"] = column
+
+        # Add the table name after any DISTINCT, which then applies to each table's rows
+        source = table_name.replace("'", "''")
+        modifier, columns = split_select_modifier((parts.get("columns") or "").strip())
+        table_parts["columns"] = f"{modifier}'{source}' AS [{SOURCE_TABLE_COLUMN}], " + (columns or "*")
+        selects.append(build_query_sql(table_parts, include_order=False))
+    sql = " UNION ALL ".join(selects)
+
+    # Limit and order the combined rows
+    order_clause = (parts.get("order_by") or "").strip()
+    if top:
+        sql = f"SELECT TOP ({int(top)}) * FROM ({sql}) AS u"
+    if order_clause and include_order:
+        sql += f" ORDER BY {order_clause}"
+    return sql
+
+def get_order_key(order_clause):
+    """
+    Return the (column, descending) pair if the ORDER BY clause is a single
+    plain column name (optionally bracketed, qualified or followed by ASC/DESC),
+    otherwise None. Only a single-column order can be used as a resume key.
+    """
+    if not order_clause:
+        return None
+
+    match = re.fullmatch(
+        r"\s*(?:[\w\[\]]+\.)*\[?(\w+)\]?(?:\s+(ASC|DESC))?\s*",
+        order_clause,
+        re.IGNORECASE
+    )
+    if not match:
+        return None
+
+    return match.group(1), (match.group(2) or "").upper() == "DESC"
+
+def can_add_tiebreaker(parts):
+    """
+    Check if a unique key of the selected table can be added to the end of the
+    query's ORDER BY. It cannot for unordered, grouped or distinct queries,
+    queries on several tables, or a FROM clause in the Where box, where the
+    key's columns may not be unambiguous or allowed in the ORDER BY.
+    """
+    columns = (parts.get("columns") or "").strip()
+    return bool(
+        (parts.get("order_by") or "").strip() and
+        not (parts.get("group_by") or "").strip() and
+        len(get_query_tables(parts)) == 1 and
+        (parts.get("where") or "").strip()[:5].lower() != "from " and
+        not re.match(r"distinct\b", columns, re.IGNORECASE)
+    )
+
+def build_resume_sql(parts, key_column, descending=False, inclusive=False, tiebreaker=None):
+    """
+    Wrap the query as a derived table so it can be restarted from a key value.
+    The rows after the key are returned, or from the key onwards if inclusive
+    so rows sharing the last key written are not lost. The key column and any
+    tiebreaker column must be among the selected columns.
+    """
+    inner_sql = build_query_sql(parts, include_order=False)
+    operator = "<" if descending else ">"
+    if inclusive:
+        operator += "="
+    direction = " DESC" if descending else ""
+
+    sql = (
+        f"SELECT * FROM ({inner_sql}) AS q"
+        f" WHERE q.[{key_column}] {operator} ?"
+        f" ORDER BY q.[{key_column}]{direction}"
+    )
+
+    # Order rows sharing a key value the same way every time
+    if tiebreaker:
+        sql += f", q.[{tiebreaker}]"
+    return sql
+
+def read_query_file(file_path):
+    """
+    Read a saved .qsf query file and return the query parts as a dictionary.
+    Parts missing from the file are returned as empty strings.
+    """
+    parts = {key: "" for key, _ in QUERY_FILE_LABELS}
+    labels = {label.upper(): key for key, label in QUERY_FILE_LABELS}
+
+    with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+
+        # Read each line and process it
+        for line in f:
+            # Strip whitespace and check for empty lines
+            line = line.strip()
+            if not line or not line.endswith("}") or " {" not in line:
+                continue
+
+            # Split the line into the label and the value in braces
+            label, value = line[:-1].split(" {", 1)
+            key = labels.get(label.strip().upper())
+            if key is None:
+                continue
+
+            # Restore line breaks in the multi-line parts
+            parts[key] = value.replace("$$", "\n") if key in MULTILINE_PARTS else value
+
+    return parts
+
+def write_query_file(file_path, parts):
+    """
+    Write the query parts to a .qsf query file, one 'Label {value}' line per part.
+    """
+    with open(file_path, "w", encoding="utf-8") as f:
+        for key, label in QUERY_FILE_LABELS:
+            value = str(parts.get(key) or "").strip().replace("\n", " ")
+            f.write(f"{label} {{{value}}}\n")
+
+def parse_parameters(text):
+    """
+    Parse the parameter declarations saved with a query, e.g.
+    '@StartDate DATE = 2020-01-01; @County NVARCHAR(50) = Kent'.
+    Returns a list of dictionaries with the name, SQL type and default value.
+    Raises ValueError if a declaration is not valid.
+    """
+    parameters = []
+
+    for declaration in (text or "").split(";"):
+        if not declaration.strip():
+            continue
+
+        # Split the declaration into its name, type and optional default value
+        match = re.fullmatch(
+            r"\s*(@\w+)\s+([A-Za-z]\w*(?:\s*\(\s*(?:\d+|MAX)(?:\s*,\s*\d+)?\s*\))?)\s*(?:=\s*(.*?))?\s*",
+            declaration,
+            re.IGNORECASE
+        )
+        if not match:
+            raise ValueError(f"Invalid parameter declaration: {declaration.strip()}")
+
+        parameters.append({
+            "name": match.group(1),
+            "type": match.group(2).upper(),
+            "value": match.group(3) or "",
+        })
+
+    return parameters
+
+def format_parameters(parameters):
+    """Format a list of parameters as the declarations saved with a query."""
+    return "; ".join(
+        f"{p['name']} {p['type']} = {p['value']}" if p.get("value") != "" else f"{p['name']} {p['type']}"
+        for p in parameters
+    )
+
+def add_run_parameters(parameters, schema, user_id, run_id=None):
+    """
+    Return the query parameters with @Schema, @UserId and @RunId added, so the
+    query can read just the rows its run selected (e.g. WHERE RunId = @RunId).
+    Any of them the query declares itself are left as declared.
+    """
+    declared = {p["name"].lower() for p in parameters}
+    values = (schema, user_id, run_id)
+    return list(parameters) + [
+        {"name": name, "type": sql_type, "value": value}
+        for (name, sql_type), value in zip(RUN_PARAMETERS, values)
+        if name.lower() not in declared
+    ]
+
+def is_run_scoped(sql, parameters=None):
+    """
+    Check if a query reads only its own run's rows, by using the @RunId
+    passed to it rather than a @RunId parameter of its own.
+    """
+    if any(p["name"].lower() == "@runid" for p in parameters or []):
+        return False
+    return bool(re.search(r"@RunId\b", sql or "", re.IGNORECASE))
+
+def build_declarations(parameters):
+    """
+    Return a DECLARE statement for the parameters, so a parameterised query
+    can be validated or previewed as a single batch.
+    """
+    if not parameters:
+        return ""
+    return "DECLARE " + ", ".join(f"{p['name']} {p['type']}" for p in parameters) + "; "
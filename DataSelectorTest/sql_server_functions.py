@@ -2,8 +2,155 @@ from qgis.core import QgsMessageLog, Qgis
 
 import pyodbc
 import re
-
-from .string_functions import fnmatch_to_regex
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from .string_functions import fnmatch_to_regex, wildcard_to_like, replace_markers
+from .conversion_functions import register_output_converters
+
+def is_connection_error(error):
+    """
+    Check if a pyodbc error means the connection was lost (SQLSTATE class 08),
+    as opposed to a query error, a timeout or a cancellation.
+    """
+    sqlstate = str(error.args[0]) if error.args else ""
+    return sqlstate.startswith("08")
+
+# Distance (in map units) the area of interest's extent is grown by for its spatial
+# index, as the bounding box of a point or zero-area area would have no area
+AREA_INDEX_PADDING = 1
+
+# SQL Server integer types, which IDs must be whole numbers to match
+INTEGER_TYPES = ("BIGINT", "INT", "SMALLINT", "TINYINT")
+
+# SQL Server character types, which the ID list is given the database's collation for
+CHARACTER_TYPES = ("CHAR", "VARCHAR", "NCHAR", "NVARCHAR")
+
+# Case-insensitive collation the table names are matched against the wildcards with,
+# so they match the same names on a case-sensitive database as the local regexes
+WILDCARD_COLLATION = "Latin1_General_100_CI_AS"
+
+def sql_type_for_value(value):
+    """
+    Return the SQL Server type used to declare a parameter holding a Python value.
+    """
+    if isinstance(value, bool):
+        return "BIT"
+    if isinstance(value, int):
+        return "BIGINT"
+    if isinstance(value, float):
+        return "FLOAT"
+    if isinstance(value, Decimal):
+        return "DECIMAL(38, 10)"
+    if isinstance(value, datetime):
+        return "DATETIME2"
+    if isinstance(value, (bytes, bytearray)):
+        return "VARBINARY(MAX)"
+    return "NVARCHAR(4000)"
+
+def convert_id_values(values, sql_type=None):
+    """
+    Convert a list of IDs to the Python type matching the SQL Server type of the
+    column they are matched against, de-duplicated and sorted. Whole-number floats
+    (as read from layer fields) are treated as integers. If the type is not known
+    the IDs are integers if they all are whole numbers, otherwise strings.
+    Returns the converted IDs and the number that could not be converted.
+    """
+    base_type = (sql_type or "").split("(")[0].strip().upper()
+    texts = []
+    numbers = []
+
+    # Read each ID as text and, if it is one, as a number so 123.0 matches 123
+    for value in values:
+        if value is None or str(value).strip() == "":
+            continue
+        try:
+            number = Decimal(str(value).strip())
+            if not number.is_finite():
+                number = None
+        except InvalidOperation:
+            number = None
+        whole = number is not None and number == number.to_integral_value()
+        texts.append(str(int(number)) if isinstance(value, float) and whole else str(value).strip())
+        numbers.append(int(number) if whole else number)
+
+    # Without a known type, use integers only if every ID is a whole number
+    if not base_type:
+        base_type = "BIGINT" if all(isinstance(number, int) for number in numbers) else "NVARCHAR"
+
+    # Convert the IDs, leaving out any that are not valid for a numeric type
+    if base_type in INTEGER_TYPES:
+        ids = [number for number in numbers if isinstance(number, int)]
+    elif base_type in ("DECIMAL", "NUMERIC", "MONEY", "SMALLMONEY"):
+        ids = [Decimal(number) for number in numbers if number is not None]
+    elif base_type in ("FLOAT", "REAL"):
+        ids = [float(number) for number in numbers if number is not None]
+    else:
+        ids = texts
+    return sorted(set(ids)), len(texts) - len(ids)
+
+def build_executesql(sql, params=None, named_params=None):
+    """
+    Build a call to sp_executesql for a query with named parameters (declared
+    with the query, e.g. @County NVARCHAR(50)) and any positional '?' parameters.
+    The positional markers are renamed @P1, @P2, ... so the statement text and
+    parameter definitions are the same on every run, letting SQL Server reuse
+    the cached plan across runs and users.
+    Returns the SQL to execute and its parameter values.
+    """
+    params = list(params or [])
+    named_params = named_params or []
+
+    # Rename the positional markers and declare them from their values
+    positional_names = [f"@P{i + 1}" for i in range(len(params))]
+    statement = replace_markers(sql, positional_names)
+    definitions = [f"{p['name']} {p['type']}" for p in named_params]
+    definitions += [f"{name} {sql_type_for_value(value)}" for name, value in zip(positional_names, params)]
+
+    # Pass the statement, definitions and values to sp_executesql, with
+    # empty named values passed as NULL
+    values = [p["value"] if p["value"] != "" else None for p in named_params] + params
+    markers = ", ".join(["?"] * (2 + len(values)))
+    return f"EXEC sp_executesql {markers}", [statement, ", ".join(definitions)] + values
+
+def build_wildcard_conditions(column, include_wildcard=None, exclude_wildcard=None, schema=None):
+    """
+    Translate |-separated include and exclude wildcards into LIKE / NOT LIKE
+    conditions on a column. The include patterns are ORed together, so they are
+    only translated if every pattern can be; exclude patterns are translated
+    one by one. Patterns match case-insensitively, whatever the column's collation.
+    Returns (conditions, params, include_regex, exclude_regex) where the regexes
+    cover any patterns that must still be filtered locally (or are None).
+    """
+    conditions = []
+    params = []
+    include_regex = None
+    exclude_regex = None
+    column = f"{column} COLLATE {WILDCARD_COLLATION}"
+
+    # Match any of the include patterns
+    if include_wildcard:
+        likes = [wildcard_to_like(pattern, schema) for pattern in include_wildcard.split("|")]
+        if all(likes):
+            conditions.append("(" + " OR ".join([f"{column} LIKE ?"] * len(likes)) + ")")
+            params.extend(likes)
+        else:
+            include_regex = fnmatch_to_regex(include_wildcard, schema)
+
+    # Match none of the exclude patterns
+    if exclude_wildcard:
+        local_patterns = []
+        for pattern in exclude_wildcard.split("|"):
+            like = wildcard_to_like(pattern, schema)
+            if like:
+                conditions.append(f"{column} NOT LIKE ?")
+                params.append(like)
+            else:
+                local_patterns.append(pattern)
+        if local_patterns:
+            exclude_regex = fnmatch_to_regex("|".join(local_patterns), schema)
+
+    return conditions, params, include_regex, exclude_regex
 
 class SQLServerFunctions:
     def __init__(self, connection_string):
@@ -12,6 +159,7 @@ class SQLServerFunctions:
         """
         self.conn_str = connection_string
         self.connection = None
+        self._active_cursor = None
 
     def _connect(self):
         """
@@ -23,6 +171,9 @@ class SQLServerFunctions:
             if not self.connection or not self._is_connection_open():
                 self.connection = pyodbc.connect(self.conn_str, timeout=5)
 
+                # Convert the SQL Server types pyodbc does not handle itself
+                register_output_converters(self.connection)
+
             # Return the connection object
             return self.connection
         
@@ -35,9 +186,8 @@ class SQLServerFunctions:
         Check if the connection is open.
         """
         try:
-            # Check if there is a connection to the database
-            conn = self._connect()
-            if not conn:
+            # Check if there is a connection object to test
+            if not self.connection:
                 return False
 
             # Create a cursor and execute a simple query
@@ -56,7 +206,9 @@ class SQLServerFunctions:
     def get_table_names(self, objects_table, include_wildcard=None, exclude_wildcard=None, schema=None):
         """
         Query the configured view/table to return the list of selectable spatial tables.
-        Applies wildcard filtering if provided.
+        Applies wildcard filtering if provided. The wildcards are translated into
+        LIKE / NOT LIKE conditions so only the matching names are returned by the
+        server; any pattern that cannot be translated is filtered here instead.
         """
         try:
 
@@ -65,22 +217,27 @@ class SQLServerFunctions:
             if not conn:
                 return []
 
+            # Build the server-side wildcard conditions
+            conditions, params, include_regex, exclude_regex = build_wildcard_conditions(
+                "ObjectName", include_wildcard, exclude_wildcard, schema
+            )
+
             # Create a cursor and execute the SQL query
             cursor = conn.cursor()
             sql = f"SELECT ObjectName FROM {objects_table}"
-            cursor.execute(sql)
+            if conditions:
+                sql += " WHERE " + " AND ".join(conditions)
+            cursor.execute(sql, *params)
             rows = [row[0] for row in cursor.fetchall()]
 
-            # Apply include wildcard filtering if provided
-            if include_wildcard:
-                inc_pattern = fnmatch_to_regex(include_wildcard, schema)
-                inc_regex = re.compile(inc_pattern, re.IGNORECASE)
+            # Apply include wildcard filtering if it could not be done on the server
+            if include_regex:
+                inc_regex = re.compile(include_regex, re.IGNORECASE)
                 rows = [name for name in rows if inc_regex.match(name)]
 
-            # Apply exclude wildcard filtering if provided
-            if exclude_wildcard:
-                exc_pattern = fnmatch_to_regex(exclude_wildcard, schema)
-                exc_regex = re.compile(exc_pattern, re.IGNORECASE)
+            # Apply exclude wildcard filtering if it could not be done on the server
+            if exclude_regex:
+                exc_regex = re.compile(exclude_regex, re.IGNORECASE)
                 rows = [name for name in rows if not exc_regex.match(name)]
 
             # Remove schema prefix from names if present
@@ -120,10 +277,10 @@ class SQLServerFunctions:
             QgsMessageLog.logMessage(f"[Get Columns Error] {e}", "DataSelector", Qgis.Critical)
             return []
 
-    def execute_sql(self, sql):
+    def execute_sql(self, sql, timeout=0):
         """
         Execute a SQL query and return all rows.
-        Used for running the final export query.
+        The timeout (in seconds, 0 for none) is applied to the query execution.
         """
         try:
             # Check if there is a connection to the database
@@ -132,6 +289,7 @@ class SQLServerFunctions:
                 return None
 
             # Create a cursor and execute the SQL query
+            conn.timeout = timeout or 0
             cursor = conn.cursor()
             cursor.execute(sql)
 
@@ -142,20 +300,427 @@ class SQLServerFunctions:
             print(f"[SQL Execution Error] {e}")
             return None
 
-    def run_procedure(self, proc_name):
+    def open_cursor(self, sql, params=None, timeout=0, named_params=None):
+        """
+        Execute a SQL query and return the open cursor so the rows can be
+        fetched in batches. Used for streaming exports.
+        The timeout (in seconds, 0 for none) is applied to the query execution.
+        Queries with named parameters are run with sp_executesql.
+        Exceptions are raised to the caller so that interrupted exports can be retried.
+        """
+        # Run queries with named parameters through sp_executesql
+        if named_params:
+            sql, params = build_executesql(sql, params, named_params)
+
+        # Check if there is a connection to the database
+        conn = self._connect()
+        if not conn:
+            raise pyodbc.OperationalError("08001", "Database connection failed.")
+
+        # Create a cursor that can be cancelled from another thread
+        conn.timeout = timeout or 0
+        cursor = conn.cursor()
+        self._active_cursor = cursor
+
+        # Execute the SQL query
+        if params:
+            cursor.execute(sql, params)
+        else:
+            cursor.execute(sql)
+
+        # Return the cursor positioned at the first row
+        return cursor
+
+    def get_column_type(self, table_name, column_name):
+        """
+        Return the SQL Server type of a column of a table as used to declare it
+        (e.g. 'INT' or 'VARCHAR(12)'), or None if the column is not found. The
+        column may be qualified or bracketed. Character types too long for a
+        primary key are shortened to the longest that can be one.
+        """
+        try:
+            # Check if there is a connection to the database
+            conn = self._connect()
+            if not conn:
+                return None
+
+            # Look up the column of the table, however the table is named
+            column_name = column_name.rsplit(".", 1)[-1].strip("[] ")
+            cursor = conn.cursor()
+            sql = (
+                "SELECT DATA_TYPE, CHARACTER_MAXIMUM_LENGTH, NUMERIC_PRECISION, NUMERIC_SCALE"
+                " FROM INFORMATION_SCHEMA.COLUMNS"
+                " WHERE OBJECT_ID(QUOTENAME(TABLE_SCHEMA) + '.' + QUOTENAME(TABLE_NAME)) = OBJECT_ID(?)"
+                " AND COLUMN_NAME = ?"
+            )
+            cursor.execute(sql, table_name, column_name)
+            row = cursor.fetchone()
+            cursor.close()
+            if not row:
+                return None
+
+            # Add the length, or the precision and scale, to the type
+            data_type, length, precision, scale = row
+            data_type = data_type.upper()
+            if data_type in CHARACTER_TYPES:
+                max_length = 450 if data_type.startswith("N") else 900
+                return f"{data_type}({min(length, max_length) if length and length > 0 else max_length})"
+            if data_type in ("DECIMAL", "NUMERIC"):
+                return f"{data_type}({precision}, {scale})"
+            return data_type
+
+        except Exception as e:
+            QgsMessageLog.logMessage(f"[Get Column Type Error] {e}", "DataSelector", Qgis.Warning)
+            return None
+
+    def upload_id_list(self, table_name, values, source_table=None, source_column=None, batch_size=10000):
+        """
+        Bulk-insert a list of IDs into a session temp table (e.g. '#DataSelectorIds')
+        so queries can join against it instead of using a giant IN (...) list.
+        The IDs are stored with the type of the column they are matched against
+        (source_column in source_table), so the join needs no conversion, and
+        IDs that cannot be converted to it are left out. If the column's type
+        cannot be found they are stored as BIGINT if they are all whole numbers,
+        otherwise as NVARCHAR. Uses fast_executemany to send the rows in batches.
+        Returns the number of IDs uploaded and the number left out, and
+        exceptions are raised to the caller.
+        """
+        # Check if there is a connection to the database
+        conn = self._connect()
+        if not conn:
+            raise pyodbc.OperationalError("08001", "Database connection failed.")
+
+        # Work out the column type and convert the IDs to it
+        id_type = self.get_column_type(source_table, source_column) if source_table and source_column else None
+        ids, invalid = convert_id_values(values, id_type)
+        if id_type is None:
+            id_type = "BIGINT" if all(isinstance(value, int) for value in ids) else "NVARCHAR(450)"
+
+        # Compare text IDs using the database's collation rather than tempdb's
+        if id_type.split("(")[0] in CHARACTER_TYPES:
+            id_type += " COLLATE DATABASE_DEFAULT"
+
+        # Create (or recreate) the temp table for this session
+        cursor = conn.cursor()
+        cursor.execute(f"IF OBJECT_ID('tempdb..{table_name}') IS NOT NULL DROP TABLE {table_name}")
+        cursor.execute(f"CREATE TABLE {table_name} (Id {id_type} NOT NULL PRIMARY KEY)")
+
+        # Insert the IDs in batches
+        cursor.fast_executemany = True
+        sql = f"INSERT INTO {table_name} (Id) VALUES (?)"
+        for start in range(0, len(ids), batch_size):
+            cursor.executemany(sql, [(value,) for value in ids[start:start + batch_size]])
+        cursor.commit()
+        cursor.close()
+
+        # Return the number of IDs uploaded and left out
+        return len(ids), invalid
+
+    def upload_area(self, table_name, wkb_geometries, srid, extent, batch_size=500):
+        """
+        Bulk-load area of interest geometries (as WKB) into a session temp table
+        (e.g. '#DataSelectorArea') with a spatial index, so spatial selections can
+        intersect against it on the server. The extent (xmin, ymin, xmax, ymax) is
+        used as the bounding box of the spatial index, padded so a point or a line
+        still has an area. Returns the number of geometries uploaded and the error
+        if the spatial index could not be created (otherwise None).
+        Exceptions uploading the geometries are raised to the caller.
+        """
+        # Check if there is a connection to the database
+        conn = self._connect()
+        if not conn:
+            raise pyodbc.OperationalError("08001", "Database connection failed.")
+
+        # Create (or recreate) the temp table for this session
+        cursor = conn.cursor()
+        cursor.execute(f"IF OBJECT_ID('tempdb..{table_name}') IS NOT NULL DROP TABLE {table_name}")
+        cursor.execute(
+            f"CREATE TABLE {table_name} (Id INT IDENTITY(1, 1) NOT NULL PRIMARY KEY, AreaShape GEOMETRY NOT NULL)"
+        )
+
+        # Insert the geometries in batches, sending the WKB as varbinary(max)
+        cursor.fast_executemany = True
+        cursor.setinputsizes([(pyodbc.SQL_VARBINARY, 0, 0)])
+        sql = f"INSERT INTO {table_name} (AreaShape) VALUES (geometry::STGeomFromWKB(?, {int(srid)}).MakeValid())"
+        for start in range(0, len(wkb_geometries), batch_size):
+            batch = wkb_geometries[start:start + batch_size]
+            cursor.executemany(sql, [(wkb,) for wkb in batch])
+        cursor.commit()
+
+        # Build a spatial index over the area's extent. The query still works
+        # without it, so carry on if it cannot be created
+        index_error = None
+        try:
+            xmin, ymin, xmax, ymax = extent
+            xmin, ymin, xmax, ymax = xmin - AREA_INDEX_PADDING, ymin - AREA_INDEX_PADDING, xmax + AREA_INDEX_PADDING, ymax + AREA_INDEX_PADDING
+            cursor.execute(
+                f"CREATE SPATIAL INDEX SIdx_DataSelectorArea ON {table_name} (AreaShape)"
+                f" USING GEOMETRY_AUTO_GRID WITH (BOUNDING_BOX = ({xmin}, {ymin}, {xmax}, {ymax}))"
+            )
+            cursor.commit()
+        except Exception as e:
+            index_error = str(e)
+
+        cursor.close()
+
+        # Return the number of geometries uploaded and any spatial index error
+        return len(wkb_geometries), index_error
+
+    def get_geometry_column(self, table_name):
+        """
+        Return the name of the geometry column of a table, or None if it has none.
+        """
+        try:
+            # Check if there is a connection to the database
+            conn = self._connect()
+            if not conn:
+                return None
+
+            # Create a cursor and find the first geometry column
+            cursor = conn.cursor()
+            sql = "SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = ? AND DATA_TYPE = 'geometry'"
+            cursor.execute(sql, table_name)
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+        except Exception as e:
+            QgsMessageLog.logMessage(f"[Get Geometry Column Error] {e}", "DataSelector", Qgis.Critical)
+            return None
+
+    def get_unique_key(self, table_name):
+        """
+        Return the columns of the primary key of a table, or of its unique index
+        with the fewest columns, or None if it has neither (e.g. a view).
+        """
+        try:
+            # Check if there is a connection to the database
+            conn = self._connect()
+            if not conn:
+                return None
+
+            # Find the unfiltered unique indexes, the primary key first
+            cursor = conn.cursor()
+            sql = (
+                "SELECT i.index_id, i.is_primary_key, c.name FROM sys.indexes i"
+                " JOIN sys.index_columns ic ON ic.object_id = i.object_id AND ic.index_id = i.index_id"
+                " JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id"
+                " WHERE i.object_id = OBJECT_ID(?) AND i.is_unique = 1 AND i.has_filter = 0"
+                " AND ic.is_included_column = 0"
+                " ORDER BY i.is_primary_key DESC, i.index_id, ic.key_ordinal"
+            )
+            cursor.execute(sql, table_name)
+            indexes = {}
+            primary_key = None
+            for index_id, is_primary_key, column in cursor.fetchall():
+                indexes.setdefault(index_id, []).append(column)
+                if is_primary_key:
+                    primary_key = indexes[index_id]
+            cursor.close()
+
+            # Keep the primary key, or the index with the fewest columns
+            if primary_key:
+                return primary_key
+            return min(indexes.values(), key=len) if indexes else None
+
+        except Exception as e:
+            QgsMessageLog.logMessage(f"[Get Unique Key Error] {e}", "DataSelector", Qgis.Warning)
+            return None
+
+    def get_procedure_tables(self, procedure_name):
+        """
+        Return the procedure and the objects it reads or calls, including those
+        of the procedures, functions and views it uses in turn. Returns None if
+        they cannot all be found, e.g. if it runs dynamic SQL or refers to an
+        object that does not exist yet.
+        """
+        try:
+            # Check if there is a connection to the database
+            conn = self._connect()
+            if not conn:
+                return None
+
+            cursor = conn.cursor()
+            objects = []
+            pending = [procedure_name]
+            while pending:
+                object_name = pending.pop()
+                cursor.execute(
+                    "SELECT QUOTENAME(OBJECT_SCHEMA_NAME(OBJECT_ID(?))) + '.' + QUOTENAME(OBJECT_NAME(OBJECT_ID(?))),"
+                    " OBJECT_DEFINITION(OBJECT_ID(?))",
+                    object_name, object_name, object_name
+                )
+                name, definition = cursor.fetchone()
+                if name is None:
+                    return None
+                if name in objects:
+                    continue
+                objects.append(name)
+
+                # Only modules (procedures, functions, views) refer to other objects
+                if definition is None:
+                    continue
+
+                # The objects dynamic SQL refers to are not recorded
+                if re.search(r"\bsp_executesql\b|\bexec(ute)?\s*\(", definition, re.IGNORECASE):
+                    return None
+
+                # Objects that could not be resolved have no ID. Temp tables are left out,
+                # as they only hold what the procedure read from other objects
+                cursor.execute(
+                    "SELECT DISTINCT referenced_id, QUOTENAME(OBJECT_SCHEMA_NAME(referenced_id)) + '.' + QUOTENAME(OBJECT_NAME(referenced_id))"
+                    " FROM sys.dm_sql_referenced_entities(?, 'OBJECT') WHERE referenced_class = 1"
+                    " AND referenced_entity_name NOT LIKE '#%'",
+                    name
+                )
+                for referenced_id, referenced_name in cursor.fetchall():
+                    if referenced_id is None:
+                        return None
+                    pending.append(referenced_name)
+
+            cursor.close()
+            return objects
+
+        except Exception as e:
+            QgsMessageLog.logMessage(f"[Get Procedure Tables Error] {e}", "DataSelector", Qgis.Warning)
+            return None
+
+    def get_change_markers(self, table_name):
+        """
+        Return markers that change when the data in a table (or in the tables a
+        view reads from, however deeply nested) changes: the modified date, the
+        time of the last update since the server started, the row count and the
+        highest rowversion. Returns None if they cannot be read, e.g. without
+        VIEW SERVER STATE, or if an object it reads from cannot be resolved.
+        """
+        try:
+            # Check if there is a connection to the database
+            conn = self._connect()
+            if not conn:
+                return None
+
+            # The last update times are lost when the server restarts, so include its start time
+            cursor = conn.cursor()
+            cursor.execute("SELECT sqlserver_start_time FROM sys.dm_os_sys_info")
+            markers = {"server_started": str(cursor.fetchone()[0]), "objects": {}}
+
+            # Find the table and the objects it references, and the objects they reference in turn
+            objects = (
+                "WITH objects AS ("
+                " SELECT OBJECT_ID(?) AS object_id, 0 AS depth"
+                " UNION ALL SELECT d.referenced_id, objects.depth + 1 FROM objects"
+                " JOIN sys.sql_expression_dependencies d ON d.referencing_id = objects.object_id"
+                " WHERE d.referenced_id IS NOT NULL AND d.referenced_id <> d.referencing_id AND objects.depth < 32)"
+            )
+
+            # The changes to objects that cannot be resolved, or are in another database, cannot be seen
+            cursor.execute(
+                objects + " SELECT COUNT(*) FROM sys.sql_expression_dependencies d"
+                " WHERE d.referencing_id IN (SELECT object_id FROM objects) AND d.referenced_class = 1"
+                " AND d.referenced_entity_name NOT LIKE '#%'"
+                " AND (d.referenced_id IS NULL OR d.referenced_database_name IS NOT NULL OR d.referenced_server_name IS NOT NULL)",
+                table_name
+            )
+            if cursor.fetchone()[0]:
+                return None
+
+            # Read the markers of each object
+            sql = (
+                objects + " SELECT OBJECT_SCHEMA_NAME(o.object_id) + '.' + o.name, o.modify_date,"
+                " (SELECT MAX(u.last_user_update) FROM sys.dm_db_index_usage_stats u"
+                "  WHERE u.database_id = DB_ID() AND u.object_id = o.object_id),"
+                " (SELECT SUM(p.row_count) FROM sys.dm_db_partition_stats p"
+                "  WHERE p.object_id = o.object_id AND p.index_id IN (0, 1))"
+                " FROM sys.objects o WHERE o.object_id IN (SELECT object_id FROM objects)"
+            )
+            cursor.execute(sql, table_name)
+            for name, modified, last_update, row_count in cursor.fetchall():
+                markers["objects"][name] = [str(modified), str(last_update), row_count]
+            if not markers["objects"]:
+                return None
+
+            # Add the highest value of any rowversion column in the table
+            cursor.execute("SELECT name FROM sys.columns WHERE object_id = OBJECT_ID(?) AND system_type_id = 189", table_name)
+            for (column,) in cursor.fetchall():
+                cursor.execute(f"SELECT MAX([{column}]) FROM {table_name}")
+                value = cursor.fetchone()[0]
+                markers[f"max_{column}"] = value.hex() if value is not None else None
+
+            cursor.close()
+            return markers
+
+        except Exception as e:
+            QgsMessageLog.logMessage(f"[Get Change Markers Error] {e}", "DataSelector", Qgis.Warning)
+            return None
+
+    def get_srid(self, table_name, geometry_column):
+        """
+        Return the spatial reference ID used by the geometry column of a table, or None if it is empty.
+        """
+        try:
+            # Check if there is a connection to the database
+            conn = self._connect()
+            if not conn:
+                return None
+
+            # Create a cursor and read the SRID of the first geometry
+            cursor = conn.cursor()
+            sql = f"SELECT TOP 1 [{geometry_column}].STSrid FROM {table_name} WHERE [{geometry_column}] IS NOT NULL"
+            cursor.execute(sql)
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+        except Exception as e:
+            QgsMessageLog.logMessage(f"[Get SRID Error] {e}", "DataSelector", Qgis.Critical)
+            return None
+
+    def cancel(self):
+        """
+        Cancel the query running on the active cursor. This is called from another
+        thread (e.g. the GUI) while the query is executing or being fetched, and
+        makes the running call raise an 'Operation canceled' error.
         """
-        Execute a stored procedure by name.
+        try:
+            if self._active_cursor is not None:
+                self._active_cursor.cancel()
+            return True
+        except Exception as e:
+            print(f"[SQL Cancel Error] {e}")
+            return False
+
+    def reset_connection(self):
+        """
+        Close and discard the current connection so the next call reconnects.
+        Used after the connection has dropped part way through an export.
+        """
+        try:
+            if self.connection:
+                self.connection.close()
+        except:
+            pass
+        self.connection = None
+
+    def run_procedure(self, proc_name, timeout=0, params=None):
+        """
+        Execute a stored procedure by name, optionally with a dictionary of
+        named parameters (e.g. {"UserId": "jsmith"} is passed as @UserId).
         Used for 'SelectStoredProcedure' and 'ClearStoredProcedure'.
+        The procedure can be stopped with cancel while it runs.
         """
+        cursor = None
         try:
             # Check if there is a connection to the database
             conn = self._connect()
             if not conn:
                 return False
 
-            # Create a cursor and execute the stored procedure
+            # Create a cursor that can be cancelled from another thread and execute the stored procedure
+            conn.timeout = timeout or 0
             cursor = conn.cursor()
-            cursor.execute(f"EXEC {proc_name}")
+            self._active_cursor = cursor
+            sql = f"EXEC {proc_name}"
+            if params:
+                sql += " " + ", ".join(f"@{name} = ?" for name in params)
+            cursor.execute(sql, *(params or {}).values())
             cursor.commit()
 
             # Return True if the procedure executed successfully
@@ -165,6 +730,11 @@ class SQLServerFunctions:
             print(f"[Procedure Error] {e}")
             return False
 
+        finally:
+            # The procedure has finished, so there is nothing left to cancel
+            if cursor is not None and self._active_cursor is cursor:
+                self._active_cursor = None
+
     def validate_sql(self, sql, timeout=10):
         """
         Validate SQL syntax without running the query using SET NOEXEC ON/OFF.
@@ -176,7 +746,8 @@ class SQLServerFunctions:
             if not conn:
                 return False, "Database connection failed."
 
-            # Create a cursor
+            # Create a cursor, applying the timeout to the validation
+            conn.timeout = timeout or 0
             cursor = conn.cursor()
 
             # Set the noexec option to validate the SQL
@@ -199,3 +770,42 @@ class SQLServerFunctions:
                 pass
             return False, str(e)
 
+
+    def get_query_plan(self, sql, timeout=10):
+        """
+        Get the estimated execution plan for the SQL using SET SHOWPLAN_XML ON,
+        without running the query.
+        Returns a tuple: (plan_xml, None) or (None, error_message).
+        """
+        try:
+            # Check if there is a connection to the database
+            conn = self._connect()
+            if not conn:
+                return None, "Database connection failed."
+
+            # Create a cursor, applying the timeout to the compilation
+            conn.timeout = timeout or 0
+            cursor = conn.cursor()
+
+            # Set the showplan option so the plan is returned instead of the rows
+            cursor.execute("SET SHOWPLAN_XML ON")
+
+            # Compile the SQL and fetch the plan document for the batch
+            cursor.execute(sql)
+            row = cursor.fetchone()
+
+            # Discard any further result sets and clear the showplan option
+            while cursor.nextset():
+                pass
+            cursor.execute("SET SHOWPLAN_XML OFF")
+
+            # Return the plan XML
+            return (row[0], None) if row else (None, "No plan was returned.")
+
+        except Exception as e:
+            # Clear the showplan option in case of error
+            try:
+                cursor.execute("SET SHOWPLAN_XML OFF")
+            except:
+                pass
+            return None, str(e)
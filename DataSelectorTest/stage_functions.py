@@ -0,0 +1,299 @@
+import json
+import os
+import re
+import sqlite3
+import tempfile
+from datetime import datetime
+
+from qgis.core import QgsGeometry, QgsRectangle
+
+from .file_functions import geometry_from_value, GEOMETRY_COLUMNS
+from .sql_server_functions import convert_id_values
+
+# Temp table in the stage holding an uploaded list of IDs to filter by
+STAGE_ID_TABLE = "temp.DataSelectorIds"
+
+# Temp table in the stage holding the extent of the uploaded area of interest
+STAGE_AREA_TABLE = "temp.DataSelectorArea"
+
+# --- stage_functions.py ---
+def get_stage_path(stage_folder, user_id):
+    """
+    Return the path of the user's local stage database, in the stage folder
+    or the temp folder if none is set.
+    """
+    return os.path.join(stage_folder or tempfile.gettempdir(), f"DataSelector_{user_id}.stage.sqlite")
+
+
+def get_stage_table(table_name):
+    """Return the name of the stage table holding the rows staged from a SQL Server table."""
+    return re.sub(r"\W+", "_", (table_name or "").strip().lower()).strip("_")
+
+
+def _quote(name):
+    """Quote a name for SQLite."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _create_metadata_table(conn):
+    """Create the table recording what has been staged."""
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS stages ("
+        " stage_table TEXT PRIMARY KEY, source_table TEXT, source_sql TEXT,"
+        " columns TEXT, geometry_column TEXT, rows INTEGER, staged_at TEXT, srid INTEGER)"
+    )
+
+    # Stages made before the SRID was recorded have no column for it
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(stages)")]
+    if "srid" not in columns:
+        conn.execute("ALTER TABLE stages ADD COLUMN srid INTEGER")
+
+
+class StageWriter:
+    """
+    Stream rows into a table in the local stage database, indexing the bounding
+    box of each geometry in an R*Tree so later queries can filter by area
+    without reading every row. Used as the writer for 'stage' exports. The
+    SRID of the source geometries is recorded so outputs from the stage get
+    the right coordinate reference system.
+    """
+
+    def __init__(self, file_path, table_name, headers, append=False, source_sql="", srid=None):
+        self.file_path = file_path
+        self.table_name = table_name
+        self.srid = srid
+        self.stage_table = get_stage_table(table_name)
+        self.rtree_table = self.stage_table + "_rtree"
+        self.headers = list(headers)
+        self.source_sql = source_sql
+        self.geom_index = next((i for i, name in enumerate(self.headers) if name.lower() in GEOMETRY_COLUMNS), -1)
+
+        self._conn = sqlite3.connect(file_path)
+        _create_metadata_table(self._conn)
+
+        # Replace the previous stage of the table, unless carrying on after an interruption
+        if not append:
+            self._conn.execute(f"DROP TABLE IF EXISTS {_quote(self.stage_table)}")
+            self._conn.execute(f"DROP TABLE IF EXISTS {_quote(self.rtree_table)}")
+            self._conn.execute("DELETE FROM stages WHERE stage_table = ?", (self.stage_table,))
+        columns = ", ".join(_quote(name) for name in self.headers)
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS {_quote(self.stage_table)} ({columns})")
+        if self.geom_index >= 0:
+            self._conn.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {_quote(self.rtree_table)} USING rtree(id, minx, maxx, miny, maxy)"
+            )
+        # The extent of the geometries staged, from the boxes indexed
+        self.extent = QgsRectangle()
+        self.extent.setMinimal()
+
+        self._insert_sql = f"INSERT INTO {_quote(self.stage_table)} VALUES ({', '.join('?' * len(self.headers))})"
+
+    def write_rows(self, rows):
+        """Insert a batch of rows, and the bounding boxes of their geometries."""
+        cursor = self._conn.cursor()
+        if self.geom_index < 0:
+            cursor.executemany(self._insert_sql, rows)
+            return
+
+        # Insert the rows one by one so each geometry's box can be keyed on its rowid
+        boxes = []
+        for row in rows:
+            cursor.execute(self._insert_sql, row)
+            geom = geometry_from_value(row[self.geom_index])
+            if geom is not None and not geom.isNull():
+                box = geom.boundingBox()
+                self.extent.combineExtentWith(box)
+                boxes.append((cursor.lastrowid, box.xMinimum(), box.xMaximum(), box.yMinimum(), box.yMaximum()))
+        cursor.executemany(f"INSERT INTO {_quote(self.rtree_table)} VALUES (?, ?, ?, ?, ?)", boxes)
+
+    def flush(self):
+        """Commit the rows written so far. The stage has no file size to checkpoint."""
+        self._conn.commit()
+        return None
+
+    def close(self):
+        """Record the stage and close the database."""
+        if self._conn is None:
+            return
+        try:
+            rows = self._conn.execute(f"SELECT COUNT(*) FROM {_quote(self.stage_table)}").fetchone()[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO stages (stage_table, source_table, source_sql, columns,"
+                " geometry_column, rows, staged_at, srid) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.stage_table, self.table_name, self.source_sql, json.dumps(self.headers),
+                 self.headers[self.geom_index] if self.geom_index >= 0 else None,
+                 rows, datetime.now().isoformat(timespec="seconds"), self.srid)
+            )
+            self._conn.commit()
+        finally:
+            self._conn.close()
+            self._conn = None
+
+
+class LocalStage:
+    """
+    Run queries against the rows staged in the local SQLite database instead of
+    SQL Server, so the Where, Group By and Order By of a staged selection can be
+    refined without running the selection again. Has the same methods as
+    SQLServerFunctions used by exports and previews, so it can take its place.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.connection = None
+        self.area = None
+
+    def _connect(self):
+        """Open the stage database, reusing the connection if already open."""
+        if self.connection is None:
+            # Connections are used by background tasks on other threads
+            self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.connection.create_function("InArea", 1, self._in_area, deterministic=True)
+        return self.connection
+
+    def get_stage(self, table_name):
+        """Return the details of the stage of a table as a dictionary, or None if it has not been staged."""
+        if not table_name or not os.path.exists(self.db_path):
+            return None
+        try:
+            conn = sqlite3.connect(self.db_path)
+            try:
+                conn.row_factory = sqlite3.Row
+                _create_metadata_table(conn)
+                row = conn.execute("SELECT * FROM stages WHERE stage_table = ?", (get_stage_table(table_name),)).fetchone()
+                return dict(row) if row else None
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"[Stage Error] {e}")
+            return None
+
+    def get_geometry_column(self, table_name):
+        """Return the name of the geometry column staged from a table, or None if it has none."""
+        stage = self.get_stage(table_name)
+        return stage["geometry_column"] if stage else None
+
+    def get_srid(self, table_name, geometry_column):
+        """Return the spatial reference ID of the geometries staged from a table, or None if it is not known."""
+        stage = self.get_stage(table_name)
+        return stage["srid"] if stage else None
+
+    def build_sql(self, parts, top=None):
+        """
+        Assemble the query from the form against the stage of its table. The
+        Where, Group By and Order By clauses are used as entered, so they must
+        be valid for SQLite as well as SQL Server, and the Where box cannot
+        hold a FROM clause.
+        """
+        stage_table = get_stage_table(parts.get("table"))
+        columns = (parts.get("columns") or "").strip() or "*"
+        where_clause = (parts.get("where") or "").strip()
+        group_clause = (parts.get("group_by") or "").strip()
+        order_clause = (parts.get("order_by") or "").strip()
+
+        # Add the ID list and area filters
+        predicates = [f"({where_clause})"] if where_clause else []
+        if parts.get("id_column"):
+            predicates.append(f"{parts['id_column']} IN (SELECT Id FROM {STAGE_ID_TABLE})")
+
+        # Filter by area using the R*Tree of geometry boxes, then the exact geometries.
+        # The area column is qualified with the SQL Server table name, so drop it
+        if parts.get("area_column"):
+            geometry_column = parts["area_column"].rsplit(".", 1)[-1]
+            predicates.append(
+                f"rowid IN (SELECT r.id FROM {_quote(stage_table + '_rtree')} AS r, {STAGE_AREA_TABLE} AS a"
+                f" WHERE r.maxx >= a.minx AND r.minx <= a.maxx AND r.maxy >= a.miny AND r.miny <= a.maxy)"
+                f" AND InArea({geometry_column}) = 1"
+            )
+
+        sql = f"SELECT {columns} FROM {_quote(stage_table)}"
+        if predicates:
+            sql += " WHERE " + " AND ".join(predicates)
+        if group_clause:
+            sql += f" GROUP BY {group_clause}"
+        if order_clause:
+            sql += f" ORDER BY {order_clause}"
+        if top:
+            sql += f" LIMIT {int(top)}"
+        return sql
+
+    def open_cursor(self, sql, params=None, timeout=0, named_params=None):
+        """
+        Execute a query on the stage and return the open cursor. Named
+        parameters are bound by name, as SQLite accepts @name parameters.
+        """
+        conn = self._connect()
+        if named_params:
+            values = {p["name"].lstrip("@"): (p["value"] if p["value"] != "" else None) for p in named_params}
+            return conn.execute(sql, values)
+        return conn.execute(sql, params or [])
+
+    def get_column_type(self, table_name, column_name):
+        """
+        Return the SQL Server type matching the values staged in a column of a
+        table (BIGINT, FLOAT or NVARCHAR), or None if it has no values.
+        """
+        column_name = column_name.rsplit(".", 1)[-1].strip("[] ")
+        try:
+            row = self._connect().execute(
+                f"SELECT typeof({_quote(column_name)}) FROM {_quote(get_stage_table(table_name))}"
+                f" WHERE {_quote(column_name)} IS NOT NULL LIMIT 1"
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"[Stage Error] {e}")
+            return None
+        return {"integer": "BIGINT", "real": "FLOAT", "text": "NVARCHAR"}.get(row[0]) if row else None
+
+    def upload_id_list(self, table_name, values, source_table=None, source_column=None):
+        """
+        Load a list of IDs into a temp table on the stage connection, converted
+        to the type of the staged column they are matched against. Returns the
+        number of IDs uploaded and the number left out as not valid for it.
+        """
+        id_type = self.get_column_type(source_table, source_column) if source_table and source_column else None
+        ids, invalid = convert_id_values(values, id_type)
+        conn = self._connect()
+        conn.execute(f"DROP TABLE IF EXISTS {STAGE_ID_TABLE}")
+        conn.execute(f"CREATE TABLE {STAGE_ID_TABLE} (Id PRIMARY KEY) WITHOUT ROWID")
+        conn.executemany(f"INSERT OR IGNORE INTO {STAGE_ID_TABLE} VALUES (?)", [(value,) for value in ids])
+        return len(ids), invalid
+
+    def upload_area(self, table_name, wkb_list, srid, extent):
+        """
+        Keep the area of interest geometries for the InArea filter, and load
+        their extent into a temp table to filter by with the R*Tree.
+        Returns the number of geometries, and None as the R*Tree needs no index.
+        """
+        geometries = [geometry_from_value(wkb) for wkb in wkb_list]
+        area = QgsGeometry.unaryUnion([geom for geom in geometries if geom is not None])
+        engine = QgsGeometry.createGeometryEngine(area.constGet())
+        engine.prepareGeometry()
+        self.area = {"geometry": area, "engine": engine}
+
+        xmin, ymin, xmax, ymax = extent
+        conn = self._connect()
+        conn.execute(f"DROP TABLE IF EXISTS {STAGE_AREA_TABLE}")
+        conn.execute(f"CREATE TABLE {STAGE_AREA_TABLE} (minx, maxx, miny, maxy)")
+        conn.execute(f"INSERT INTO {STAGE_AREA_TABLE} VALUES (?, ?, ?, ?)", (xmin, xmax, ymin, ymax))
+        return len(geometries), None
+
+    def _in_area(self, value):
+        """SQLite function checking if a staged geometry intersects the area of interest."""
+        geom = geometry_from_value(value)
+        if geom is None or geom.isNull() or self.area is None:
+            return 0
+        return 1 if self.area["engine"].intersects(geom.constGet()) else 0
+
+    def cancel(self):
+        """Interrupt the running query."""
+        if self.connection is not None:
+            self.connection.interrupt()
+
+    def reset_connection(self):
+        """Close the stage connection."""
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except sqlite3.Error:
+                pass
+            self.connection = None
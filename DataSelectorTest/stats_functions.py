@@ -0,0 +1,162 @@
+import math
+
+from qgis.core import QgsRectangle
+
+from .file_functions import geometry_from_value, GEOMETRY_COLUMNS
+
+# Number of bits of each hash used to pick a distinct count register (4096 registers, about 1.6% error)
+SKETCH_PRECISION = 12
+
+# Mask keeping hashes to 64 bits
+HASH_MASK = (1 << 64) - 1
+
+# --- stats_functions.py ---
+def mix_hash(value):
+    """
+    Return a well spread 64-bit hash of a value. Python's own hashes of
+    integers are the integers themselves, so they are mixed (splitmix64).
+    """
+    x = hash(value) & HASH_MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & HASH_MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & HASH_MASK
+    return x ^ (x >> 31)
+
+
+class DistinctSketch:
+    """
+    A HyperLogLog sketch estimating the number of distinct values in a column
+    in a fixed amount of memory, however many rows are exported.
+    """
+
+    def __init__(self, precision=SKETCH_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add_all(self, values):
+        """Add the distinct values of a batch to the sketch."""
+        shift = 64 - self.precision
+        width = shift + 1
+        registers = self.registers
+        for hashed in map(mix_hash, values):
+            index = hashed >> shift
+            rank = width - (hashed & ((1 << shift) - 1)).bit_length()
+            if rank > registers[index]:
+                registers[index] = rank
+
+    def estimate(self):
+        """Return the estimated number of distinct values."""
+        count = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / count)
+        estimate = alpha * count * count / sum(2.0 ** -rank for rank in self.registers)
+
+        # Use linear counting while many registers are still empty
+        empty = self.registers.count(0)
+        if empty and estimate <= 2.5 * count:
+            estimate = count * math.log(count / empty)
+        return int(round(estimate))
+
+
+class ColumnStatistics:
+    """
+    Per-column statistics gathered from the batches as they are exported: the
+    number of values, nulls, the minimum and maximum, an estimate of the
+    distinct values of the chosen columns, and the extent of the geometry
+    column. The distinct columns are |-separated names, or * for every column.
+    The extent is only measured here if gather_extent is set, as the vector
+    outputs measure it from the geometries they build instead.
+    """
+
+    def __init__(self, headers, distinct_columns="", gather_extent=True):
+        self.headers = list(headers)
+        self.geom_index = next((i for i, name in enumerate(self.headers) if name.lower() in GEOMETRY_COLUMNS), -1)
+        self.gather_extent = gather_extent
+        self.rows = 0
+        self.nulls = [0] * len(self.headers)
+        self.minimums = [None] * len(self.headers)
+        self.maximums = [None] * len(self.headers)
+
+        # Only sketch the columns whose distinct values are reported
+        names = {name.strip().lower() for name in (distinct_columns or "").split("|") if name.strip()}
+        self.sketches = [DistinctSketch() if "*" in names or name.lower() in names else None for name in self.headers]
+
+        self.extent = QgsRectangle()
+        self.extent.setMinimal()
+
+    def update(self, rows):
+        """Add a batch of rows to the statistics, one column at a time."""
+        if not rows:
+            return
+        self.rows += len(rows)
+
+        for i, column in enumerate(zip(*rows)):
+            values = [value for value in column if value is not None]
+            self.nulls[i] += len(column) - len(values)
+            if not values:
+                continue
+
+            # Take the extent of the geometry column instead, unless the writer measures it
+            if i == self.geom_index:
+                if self.gather_extent:
+                    self._update_extent(values)
+                continue
+
+            # Binary values have no useful range or distinct count
+            if isinstance(values[0], (bytes, bytearray)):
+                continue
+
+            try:
+                low, high = min(values), max(values)
+            except TypeError:
+                continue
+            if self.minimums[i] is None or low < self.minimums[i]:
+                self.minimums[i] = low
+            if self.maximums[i] is None or high > self.maximums[i]:
+                self.maximums[i] = high
+            if self.sketches[i] is not None:
+                self.sketches[i].add_all(set(values))
+
+    def _update_extent(self, values):
+        """Grow the extent to include a batch of geometries."""
+        for value in values:
+            geom = geometry_from_value(value)
+            if geom is not None and not geom.isNull():
+                self.extent.combineExtentWith(geom.boundingBox())
+
+    def to_dict(self, extent=None):
+        """
+        Return the statistics as a dictionary for the JSON sidecar, with the
+        extent measured by the writer if one is given.
+        """
+        columns = []
+        for i, name in enumerate(self.headers):
+            column = {"name": name, "count": self.rows - self.nulls[i], "nulls": self.nulls[i]}
+            if i == self.geom_index:
+                column["geometry"] = True
+            elif self.minimums[i] is not None:
+                column["min"] = self.minimums[i]
+                column["max"] = self.maximums[i]
+                if self.sketches[i] is not None:
+                    column["distinct"] = self.sketches[i].estimate()
+            columns.append(column)
+
+        # The extent is still inverted (minimal) if there were no geometries
+        extent = extent if extent is not None else self.extent
+        bounds = None
+        if self.geom_index >= 0 and extent.xMinimum() <= extent.xMaximum():
+            bounds = [extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum()]
+        return {"rows": self.rows, "columns": columns, "extent": bounds}
+
+
+def format_statistics(stats):
+    """Format the statistics from ColumnStatistics.to_dict as lines for the log."""
+    lines = []
+    for column in stats["columns"]:
+        line = f"{column['name']}: {column['count']} values, {column['nulls']} nulls"
+        if "min" in column:
+            line += f", min {column['min']}, max {column['max']}"
+        if "distinct" in column:
+            line += f", about {column['distinct']} distinct"
+        lines.append(line)
+    if stats["extent"]:
+        lines.append("Extent: {:.2f}, {:.2f} : {:.2f}, {:.2f}".format(*stats["extent"]))
+    return lines
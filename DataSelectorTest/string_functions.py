@@ -26,3 +26,114 @@ def fnmatch_to_regex(wildcard_string, schema=None):
         regex_patterns.append(f'^{regex}$')
 
     return '|'.join(regex_patterns)
+
+def split_columns(columns):
+    """
+    Split a comma-separated column list into its items, ignoring commas inside
+    brackets, parentheses or quotes (e.g. in function calls or [column, names]).
+    """
+    items = []
+    current = []
+    depth = 0
+    quote = None
+
+    for char in columns:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"'):
+            quote = char
+        elif char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+        elif char == "," and depth == 0:
+            items.append("".join(current).strip())
+            current = []
+            continue
+        current.append(char)
+
+    # Add the last item
+    if "".join(current).strip():
+        items.append("".join(current).strip())
+
+    return items
+
+def find_keyword(sql, keyword):
+    """
+    Find the position of the first occurrence of a SQL keyword that is not inside
+    parentheses or quotes (so keywords in subqueries are skipped). Returns -1 if not found.
+    """
+    depth = 0
+    quote = None
+    pattern = re.compile(r"\b" + re.escape(keyword) + r"\b", re.IGNORECASE)
+
+    for i, char in enumerate(sql):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"'):
+            quote = char
+        elif char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+        elif depth == 0 and pattern.match(sql, i) and (i == 0 or not (sql[i - 1].isalnum() or sql[i - 1] == "_")):
+            return i
+
+    return -1
+
+def replace_markers(sql, names):
+    """
+    Replace each '?' parameter marker that is not inside quotes with the next
+    name in the list (e.g. '@P1'), so positional parameters can be used in
+    statements run by sp_executesql.
+    """
+    result = []
+    quote = None
+    names = iter(names)
+
+    for char in sql:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"'):
+            quote = char
+        elif char == "?":
+            char = next(names)
+        result.append(char)
+
+    return "".join(result)
+
+def clean_sql_error(message):
+    """
+    Shorten a pyodbc error message to the first SQL Server message, e.g.
+    "Incorrect syntax near 'FORM'.", dropping the SQLSTATE and driver prefixes.
+    """
+    match = re.search(r"\[SQL Server\](.*?)\s*(?:\(\d+\)|\(SQL\w+\)|;|[\"')]*$)", message or "")
+    if match and match.group(1).strip():
+        return match.group(1).strip()
+    return (message or "").strip()
+
+def wildcard_to_like(pattern, schema=None):
+    """
+    Convert a single wildcard pattern (* and ?) into a SQL Server LIKE pattern,
+    escaping the LIKE special characters. Optionally prepends schema (e.g. 'dbo.').
+    Returns None if the pattern cannot be matched exactly with LIKE, e.g. if it
+    ends in a space, which LIKE ignores.
+    """
+    if not pattern or pattern != pattern.rstrip():
+        return None
+
+    # Escape the LIKE special characters by wrapping them in brackets
+    like = ""
+    for char in (schema + "." if schema else "") + pattern:
+        if char in "%_[":
+            like += f"[{char}]"
+        elif char == "*":
+            like += "%"
+        elif char == "?":
+            like += "_"
+        else:
+            like += char
+    return like
@@ -0,0 +1,141 @@
+"""
+Time taking the attributes of a representative export batch for the vector
+outputs, before and after the per-column formatters in conversion_functions.py.
+
+    python benchmarks/conversion_benchmark.py [rows]
+
+'before' takes each row's attributes with the loop over every cell that
+rows_to_features used before the formatters were added. 'all columns'
+formats every typed column as text and copies the attributes without the
+geometry column in one go, and 'needed columns' does the same but only
+formats the columns QGIS cannot convert itself (decimals), as the vector
+outputs now do.
+Building the features is also timed when the QGIS Python libraries are
+available (e.g. run from the OSGeo4W shell).
+"""
+import os
+import struct
+import sys
+import timeit
+from datetime import date, datetime
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "DataSelectorTest"))
+from conversion_functions import TEXT_FORMATTERS, build_column_formatters, convert_rows, format_text  # noqa: E402
+
+# The formatters used for every typed column before they were limited to the columns that need them
+ALL_TEXT_FORMATTERS = {int: format_text, float: format_text, bool: format_text, Decimal: format_text,
+                       datetime: format_text, date: format_text}
+
+# Columns of the batch, as a cursor description: name, type code and nullable
+DESCRIPTION = [
+    ("RecID", int, None, None, None, None, False),
+    ("TaxonName", str, None, None, None, None, True),
+    ("CommonName", str, None, None, None, None, True),
+    ("TaxonGroup", str, None, None, None, None, True),
+    ("Recorder", str, None, None, None, None, True),
+    ("Determiner", str, None, None, None, None, True),
+    ("SiteName", str, None, None, None, None, True),
+    ("GridRef", str, None, None, None, None, True),
+    ("Survey", str, None, None, None, None, True),
+    ("Sex", str, None, None, None, None, True),
+    ("Stage", str, None, None, None, None, True),
+    ("Method", str, None, None, None, None, True),
+    ("Status", str, None, None, None, None, True),
+    ("Comment", str, None, None, None, None, True),
+    ("Abundance", int, None, None, None, None, True),
+    ("Area", float, None, None, None, None, True),
+    ("Accuracy", Decimal, None, None, None, None, True),
+    ("Recorded", datetime, None, None, None, None, True),
+    ("Verified", date, None, None, None, None, True),
+    ("Confirmed", bool, None, None, None, None, True),
+    ("Shape", bytearray, None, None, None, None, True),
+]
+
+# Position of the geometry column, which is not an attribute
+GEOM_INDEX = len(DESCRIPTION) - 1
+
+
+def make_rows(count):
+    """Build a batch of rows like those of a point dataset, with a few nulls."""
+    rows = []
+    for i in range(count):
+        point = struct.pack("<bIdd", 1, 1, 400000 + i, 300000 + i)
+        rows.append((
+            i, f"Species {i % 500}", f"Common {i % 500}", "Birds", f"Recorder {i % 40}", f"Recorder {i % 20}",
+            f"Site {i % 300}", f"SU{i % 100:02d}{i % 97:02d}", "Atlas", None, "Adult", "Field record",
+            "Accepted", None if i % 3 else "Seen flying over", None if i % 7 == 0 else i % 50, i * 0.5,
+            Decimal(i % 1000) / 100, datetime(2020, 1, 1 + i % 28, 12, 30), date(2021, 1 + i % 12, 1),
+            i % 2 == 0, point,
+        ))
+    return rows
+
+
+def attributes_before(rows):
+    """Take the attributes of each row cell by cell, as rows_to_features did before the formatters."""
+    batch = []
+    for row in rows:
+        attrs = []
+        for i, val in enumerate(row):
+            if i == GEOM_INDEX:
+                continue
+            attrs.append(val)
+        batch.append(attrs)
+    return batch
+
+
+def attributes_after(rows, formatters):
+    """Convert the formatted columns and copy the attributes without the geometry, as rows_to_features does now."""
+    batch = []
+    for row in convert_rows(rows, formatters):
+        attrs = list(row)
+        del attrs[GEOM_INDEX]
+        batch.append(attrs)
+    return batch
+
+
+def time_call(func, repeat=9):
+    """Return the fastest of several runs of a function, in milliseconds."""
+    return min(timeit.repeat(func, number=1, repeat=repeat)) * 1000
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rows = make_rows(count)
+
+    cases = {
+        "before": attributes_before,
+        "all columns": lambda batch, formatters=build_column_formatters(DESCRIPTION, ALL_TEXT_FORMATTERS): attributes_after(batch, formatters),
+        "needed columns": lambda batch, formatters=build_column_formatters(DESCRIPTION, TEXT_FORMATTERS): attributes_after(batch, formatters),
+    }
+
+    # Build features as the vector writers do, if QGIS is available
+    try:
+        from qgis.core import QgsFeature, QgsField, QgsFields
+        from qgis.PyQt.QtCore import QVariant
+    except ImportError:
+        QgsFeature = None
+        print("QGIS is not available, so only taking the attributes is timed")
+    if QgsFeature is not None:
+        fields = QgsFields()
+        for column in DESCRIPTION[:GEOM_INDEX]:
+            fields.append(QgsField(column[0], QVariant.String))
+
+        def build_features(take_attributes):
+            for attrs in take_attributes(rows):
+                feature = QgsFeature(fields)
+                feature.setAttributes(attrs)
+
+    print(f"{count} rows of {len(DESCRIPTION)} columns per batch, fastest of 9 runs")
+    baseline = None
+    for name, take_attributes in cases.items():
+        elapsed = time_call(lambda: take_attributes(rows))
+        baseline = baseline or elapsed
+        line = f"{name:>15}: attributes {elapsed:8.1f} ms ({baseline / elapsed:.1f}x as fast as before)"
+        if QgsFeature is not None:
+            line += f", build features {time_call(lambda: build_features(take_attributes)):8.1f} ms"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()